@@ -0,0 +1,38 @@
+"""Планирование траектории (JPS + оптимизация) на картах maps/1-5.png"""
+import os
+
+import numpy as np
+import pytest
+
+from planner import get_grid
+from planner.preprocess import preprocess_occupancy
+from planner_service import get_path
+
+from conftest import ROOT
+
+# Карты репозитория
+MAPS = (1, 2, 3, 4, 5)
+# Старт и цель не ближе к препятствиям, ячеек
+MIN_CLEARANCE = 2.0
+
+
+@pytest.fixture(scope="module", params=MAPS, ids=lambda map_id: f"map={map_id}")
+def route(request):
+    """
+    Сетка карты и далеко разнесённые старт и цель. Данные карты считаются
+    в памяти, как после python -m planner.preprocess (с ориентирами ALT)
+    """
+    grid = get_grid(request.param, os.path.join(ROOT, "maps", f"{request.param}.png"))
+    data = grid._map_data = preprocess_occupancy(grid.occupied)
+    labels = data.labels[data.labels >= 0]
+    largest = np.bincount(labels).argmax()
+    rows, cols = np.nonzero((data.labels == largest) & (data.clearance >= MIN_CLEARANCE))
+    # Ячейки области, ближайшие к левому верхнему и правому нижнему углам карты
+    start, goal = np.argmin(rows + cols), np.argmax(rows + cols)
+    return grid, grid.cell_to_world(rows[start], cols[start]), grid.cell_to_world(rows[goal], cols[goal])
+
+
+def test_get_path(benchmark, route):
+    grid, (start_x, start_y), (goal_x, goal_y) = route
+    points = benchmark(get_path, start_x, start_y, goal_x, goal_y, grid)
+    assert np.hypot(points[-1]["x"] - goal_x, points[-1]["y"] - goal_y) < 1.0
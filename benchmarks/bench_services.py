@@ -0,0 +1,126 @@
+"""
+Сервисы API (robot_service, transport_request_service) на SQLite.
+Состояние роботов в память не загружается (как без lifespan), поэтому
+чтения идут в БД. Каждый вызов — в своей сессии, как в обработчике запроса.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, update
+
+from app import models
+from app.database import AsyncSessionLocal, Base, SessionLocal, engine
+from app.schemas import RobotPosition, TransportRequestCreate
+from app.services import robot_service, transport_request_service
+from app.services.transport_request_service import encode_cursor
+
+# Размеры таблиц роботов и заявок
+SIZES = (10, 1000, 100_000)
+# Пользователей, между которыми делятся заявки
+USERS = 10
+# Отметок в пакете позиций (не больше числа роботов)
+POSITION_BATCH = 1000
+# Страница списков заявок
+PAGE = 100
+# Заявок, забираемых планировщиком за раз
+CLAIM = 16
+REQUEST_STATUSES = ("PENDING", "READY", "IN_PROGRESS", "COMPLETED")
+
+
+@pytest.fixture(scope="module", params=SIZES, ids=lambda size: f"rows={size}")
+def database(request):
+    """Таблицы с size роботами (половина свободна) и size заявками; возвращает size"""
+    size = request.param
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(models.Map), [{"name": "bench", "file_path": "maps/1.png"}])
+        conn.execute(insert(models.User), [
+            {"username": f"user-{i}", "email": f"user-{i}@example.com", "password": "bench"} for i in range(USERS)
+        ])
+        conn.execute(insert(models.Robot), [
+            {"name": f"robot-{i}", "status": "IDLE" if i % 2 else "BUSY", "current_map_id": 1,
+             "current_position_x": float(i % 100), "current_position_y": float(i // 100 % 100)}
+            for i in range(size)
+        ])
+        conn.execute(insert(models.TransportRequest), [
+            {"user_id": i % USERS + 1, "robot_id": i + 1, "target_x": 10.0, "target_y": 10.0,
+             "status": REQUEST_STATUSES[i % len(REQUEST_STATUSES)], "created_at": start + timedelta(seconds=i)}
+            for i in range(size)
+        ])
+    return size
+
+
+def call(run, function, *args, **kwargs):
+    async def in_session():
+        async with AsyncSessionLocal() as db:
+            return await function(db, *args, **kwargs)
+    return run(in_session())
+
+
+def test_get_all_robots(benchmark, run, database):
+    robots = benchmark(call, run, robot_service.get_all_robots, limit=database)
+    assert len(robots) == database
+
+
+def test_get_all_robots_rows(benchmark, run, database):
+    robots = benchmark(call, run, robot_service.get_all_robots, limit=database, rows=True)
+    assert len(robots) == database
+
+
+def test_get_available_robots(benchmark, run, database):
+    robots = benchmark(call, run, robot_service.get_available_robots)
+    assert len(robots) == database // 2
+
+
+def test_get_robot(benchmark, run, database):
+    robot = benchmark(call, run, robot_service.get_robot, database // 2 + 1)
+    assert robot.id == database // 2 + 1
+
+
+def test_update_robot_positions(benchmark, run, database):
+    samples = [RobotPosition(robot_id=i % database + 1, x=1.0, y=2.0) for i in range(POSITION_BATCH)]
+    result = benchmark(call, run, robot_service.update_robot_positions, samples)
+    assert result["updated"] == min(database, POSITION_BATCH)
+
+
+def test_get_all_requests_page(benchmark, run, database):
+    """Страница PENDING заявок с середины истории (по курсору)"""
+    db = SessionLocal()
+    middle = db.get(models.TransportRequest, database // 2 + 1)
+    cursor = encode_cursor(middle)
+    db.close()
+    requests = benchmark(call, run, transport_request_service.get_all_requests,
+                         limit=PAGE, statuses=["PENDING"], cursor=cursor)
+    assert 0 < len(requests) <= PAGE
+
+
+def test_get_user_requests(benchmark, run, database):
+    requests = benchmark(call, run, transport_request_service.get_user_requests, 1, limit=PAGE)
+    assert len(requests) == min(PAGE, -(-database // USERS))
+
+
+def test_claim_pending_requests(benchmark, run, database):
+    def release():
+        with engine.begin() as conn:
+            conn.execute(update(models.TransportRequest)
+                         .where(models.TransportRequest.status == "PLANNING").values(status="PENDING"))
+
+    claimed = benchmark.pedantic(call, args=(run, transport_request_service.claim_pending_requests, CLAIM),
+                                 setup=release, rounds=20)
+    assert len(claimed) == min(CLAIM, -(-database // len(REQUEST_STATUSES)))
+
+
+def test_create_transport_request(benchmark, run, database):
+    """Заявка свободному роботу; робот освобождается перед каждым раундом"""
+    robot_id = 2
+
+    def free_robot():
+        with engine.begin() as conn:
+            conn.execute(update(models.Robot).where(models.Robot.id == robot_id).values(status="IDLE"))
+
+    request = TransportRequestCreate(user_id=1, robot_id=robot_id, target_x=5.0, target_y=5.0)
+    created = benchmark.pedantic(call, args=(run, transport_request_service.create_transport_request, request),
+                                 setup=free_robot, rounds=20)
+    assert created.status == "PENDING"
@@ -0,0 +1,58 @@
+"""Строковый и двоичный форматы траекторий: планировщик кодирует, эмулятор разбирает"""
+import asyncio
+
+import numpy as np
+import pytest
+
+from planner.codec import decode_trajectory, encode_trajectory
+from planner.ocp import TRAJECTORY_FIELDS, solution_to_points
+from planner_service import points_to_path_string
+from robot_emulator import RobotEmulator
+
+# Точек в траектории
+SIZES = (10, 1000, 50_000)
+
+
+@pytest.fixture(scope="module", params=SIZES, ids=lambda size: f"points={size}")
+def states(request):
+    """Массив состояний (N, 7) — движение по ломаной с плавно меняющимся курсом"""
+    rng = np.random.default_rng(request.param)
+    size = request.param
+    states = np.zeros((size, len(TRAJECTORY_FIELDS)))
+    th = np.cumsum(rng.normal(0.0, 0.05, size))
+    states[:, 0] = np.cumsum(np.cos(th)) * 0.3
+    states[:, 1] = np.cumsum(np.sin(th)) * 0.3
+    states[:, 2] = 1.0
+    states[:, 3] = th
+    states[:, 4:] = rng.normal(0.0, 0.1, (size, 3))
+    return states
+
+
+@pytest.fixture(scope="module")
+def emulator():
+    emulator = RobotEmulator()
+    yield emulator
+    asyncio.run(emulator.client.aclose())
+
+
+def test_points_to_path_string(benchmark, states):
+    points = solution_to_points(states)
+    path_string = benchmark(points_to_path_string, points)
+    assert path_string.count(";") == len(states) - 1
+
+
+def test_parse_trajectory(benchmark, states, emulator):
+    path_string = points_to_path_string(solution_to_points(states))
+    points = benchmark(emulator.parse_trajectory, path_string)
+    assert len(points) == len(states)
+
+
+def test_encode_trajectory(benchmark, states):
+    data = benchmark(encode_trajectory, states)
+    assert decode_trajectory(data)[1].shape == (len(TRAJECTORY_FIELDS), len(states))
+
+
+def test_decode_trajectory(benchmark, states):
+    data = encode_trajectory(states)
+    fields, columns = benchmark(decode_trajectory, data)
+    assert fields == TRAJECTORY_FIELDS
@@ -0,0 +1,75 @@
+"""
+Микробенчмарки (pytest-benchmark).
+
+Запуск из корня репозитория:
+    python -m pytest benchmarks
+Каждый прогон сохраняется в benchmarks/.benchmarks/<машина>/ и сравнивается
+с предыдущим: замедление медианы больше --slowdown процентов (по умолчанию
+BENCH_SLOWDOWN или 10) — ошибка прогона. Сравнение идёт с последним
+сохранённым прогоном, поэтому выборку (-k) стоит держать одной и той же.
+Сервисы API работают на временной
+SQLite (DB_SQLITE_PATH), их event loop один на весь прогон.
+"""
+import asyncio
+import importlib.util
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STORAGE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".benchmarks")
+DEFAULT_STORAGE = "file://./.benchmarks"
+# Допустимое замедление медианы относительно прошлого прогона, %
+SLOWDOWN = int(os.environ.get("BENCH_SLOWDOWN", 10))
+
+# Движки API создаются при импорте пакета app — БД выбирается до него
+_database_dir = tempfile.TemporaryDirectory()
+os.environ.setdefault("DB_SQLITE_PATH", os.path.join(_database_dir.name, "benchmarks.sqlite"))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "robot_delivery_system")]
+
+if importlib.util.find_spec("pytest_benchmark") is None:
+    # Без плагина бенчмарки не собираются
+    collect_ignore_glob = ["bench_*.py"]
+
+
+def pytest_addoption(parser):
+    parser.addoption("--slowdown", type=int, default=SLOWDOWN,
+                     help="допустимое замедление медианы относительно прошлого прогона, %%")
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    """Хранилище прогонов в benchmarks/.benchmarks, автосохранение и сравнение с прошлым прогоном"""
+    if not config.pluginmanager.hasplugin("benchmark"):
+        return
+    from pytest_benchmark.utils import parse_compare_fail
+
+    option = config.option
+    if option.benchmark_storage == DEFAULT_STORAGE:
+        option.benchmark_storage = "file://" + STORAGE
+    if option.benchmark_disable or option.benchmark_skip:
+        return
+    if not option.benchmark_save:
+        option.benchmark_autosave = True
+    # Без сохранённых прогонов сравнивать не с чем (плагин считает это ошибкой)
+    storage = option.benchmark_storage[len("file://"):] if option.benchmark_storage.startswith("file://") else None
+    has_runs = storage is not None and any(
+        name.endswith(".json") for _, _, files in os.walk(storage) for name in files
+    )
+    if has_runs and not option.benchmark_compare:
+        option.benchmark_compare = True
+    if option.benchmark_compare and not option.benchmark_compare_fail:
+        option.benchmark_compare_fail = [parse_compare_fail(f"median:{config.getoption('slowdown')}%")]
+
+
+@pytest.fixture(scope="session")
+def run():
+    """Выполняет корутину в общем event loop прогона"""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    from app.database import async_engine
+    loop.run_until_complete(async_engine.dispose())
+    loop.close()
+    _database_dir.cleanup()
@@ -0,0 +1,326 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+# Сквозной бенчмарк жизненного цикла заявки без сети:
+# API (FastAPI) на локальной SQLite, планировщик и эмулятор — в этом же процессе.
+# PENDING -> PLANNING -> READY -> IN_PROGRESS -> COMPLETED
+
+# Настройки
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "robot_delivery_system")
+MAP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "maps", "1.png")
+REQUESTS = 200  # сколько заявок подать (по одной на робота)
+RATE = 0.0  # заявок в секунду (0 — все сразу)
+TIME_SCALE = 20.0  # во сколько раз симуляция движения быстрее реального времени
+TIMEOUT = 600  # предельное время прогона, секунды
+MIN_CLEARANCE = 2.0  # старт и цель не ближе к препятствиям, ячеек
+EVENTS_WAIT = 1.0  # long-poll ленты событий бенчмарком и планировщиком, секунды
+PERCENTILES = (50, 90, 95, 99)
+# Этапы: (название, статус начала, статус конца)
+STAGES = (
+    ("queue", "PENDING", "PLANNING"),
+    ("planning", "PLANNING", "READY"),
+    ("accept", "READY", "IN_PROGRESS"),
+    ("travel", "IN_PROGRESS", "COMPLETED"),
+    ("total", "PENDING", "COMPLETED"),
+)
+FINAL_STATUSES = ("COMPLETED", "FAILED", "CANCELLED", "REJECTED")
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("lifecycle_benchmark")
+
+
+class LoopRequests:
+    """
+    Клиент с интерфейсом модуля requests для планировщика в отдельном потоке:
+    запросы выполняются общим httpx-клиентом в event loop бенчмарка
+    (приложение ASGI живёт в этом loop, сокетов нет)
+    """
+
+    def __init__(self, client: httpx.AsyncClient, loop: asyncio.AbstractEventLoop):
+        self.client = client
+        self.loop = loop
+
+    def request(self, method: str, url: str, data: Optional[bytes] = None, **kwargs) -> httpx.Response:
+        kwargs.pop("timeout", None)
+        coroutine = self.client.request(method, url, content=data, **kwargs)
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("PATCH", url, **kwargs)
+
+
+def free_points(map_file: str, count: int, rng: np.random.Generator) -> np.ndarray:
+    """count случайных точек (x, y) в самой большой связной области карты, вдали от препятствий"""
+    from planner import get_grid
+    from planner.preprocess import distance_transform, label_components
+
+    grid = get_grid(0, map_file)
+    labels = label_components(grid.occupied)
+    largest = np.bincount(labels[labels >= 0]).argmax()
+    rows, cols = np.nonzero((labels == largest) & (distance_transform(grid.occupied) >= MIN_CLEARANCE))
+    picked = rng.integers(0, len(rows), count)
+    return np.array([grid.cell_to_world(rows[i], cols[i]) for i in picked])
+
+
+def seed(count: int, map_file: str, rng: np.random.Generator) -> Tuple[int, List[int], np.ndarray]:
+    """
+    Пользователь, карта и count свободных роботов на ней (прямо в БД).
+    Возвращает id пользователя, id роботов и цели заявок (по одной на робота)
+    """
+    from app import models
+    from app.database import SessionLocal
+
+    starts = free_points(map_file, count, rng)
+    db = SessionLocal()
+    try:
+        user = models.User(username="benchmark", email="benchmark@localhost", password="benchmark")
+        map_obj = models.Map(name="benchmark", file_path=map_file)
+        db.add_all([user, map_obj])
+        db.flush()
+        robots = [models.Robot(name=f"benchmark-{i}", status="IDLE", current_map_id=map_obj.id,
+                               current_position_x=float(x), current_position_y=float(y))
+                  for i, (x, y) in enumerate(starts)]
+        db.add_all(robots)
+        db.commit()
+        user_id, robot_ids = user.id, [robot.id for robot in robots]
+    finally:
+        db.close()
+    return user_id, robot_ids, free_points(map_file, count, rng)
+
+
+class LifecycleMonitor:
+    """
+    Читает ленту событий заявок: запоминает серверное время каждого перехода
+    и принимает готовые (READY) заявки, как это делал бы оператор в GUI
+    """
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.times: Dict[int, Dict[str, float]] = {}
+        self.final: Dict[int, str] = {}
+        self.cursor: Optional[int] = None
+        self.resets = 0
+        self._accepts: List[asyncio.Task] = []
+
+    async def start_cursor(self):
+        response = await self.client.get("/requests/events", params={"timeout": 0})
+        self.cursor = response.json()["last_id"]
+
+    async def run(self, total: int):
+        """Ждёт, пока total заявок не дойдут до конечного статуса"""
+        while len(self.final) < total:
+            response = await self.client.get("/requests/events",
+                                             params={"after": self.cursor, "timeout": EVENTS_WAIT})
+            feed = response.json()
+            if feed["reset"]:
+                # Часть событий вытеснена из буфера: времена этапов потеряны,
+                # статусы перечитываем целиком
+                self.resets += 1
+                logger.warning("Лента событий сброшена, перечитываем статусы заявок")
+                await self._resync()
+            for event in feed["events"]:
+                self._record(event)
+            self.cursor = feed["last_id"]
+        await asyncio.gather(*self._accepts, return_exceptions=True)
+
+    def _record(self, event: Dict):
+        request_id, status = event["request_id"], event["status"]
+        self.times.setdefault(request_id, {}).setdefault(status, event["timestamp"])
+        if status == "READY":
+            self._accepts.append(asyncio.create_task(self._accept(request_id)))
+        elif status in FINAL_STATUSES:
+            self.final[request_id] = status
+
+    async def _accept(self, request_id: int):
+        response = await self.client.patch(f"/requests/{request_id}/accept")
+        if response.status_code != 200:
+            logger.error(f"Не удалось принять заявку {request_id}: {response.status_code}")
+
+    async def _resync(self):
+        params = {"limit": 1000}
+        while True:
+            response = await self.client.get("/requests/", params=params)
+            for request in response.json():
+                if request["status"] in FINAL_STATUSES:
+                    self.final[request["id"]] = request["status"]
+                elif request["status"] == "READY":
+                    self._accepts.append(asyncio.create_task(self._accept(request["id"])))
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+            params["cursor"] = cursor
+
+
+def stage_latencies(times: Dict[int, Dict[str, float]]) -> Dict[str, np.ndarray]:
+    """Длительности этапов по всем заявкам, прошедшим оба статуса этапа, секунды"""
+    result = {}
+    for name, begin, end in STAGES:
+        result[name] = np.array([t[end] - t[begin] for t in times.values() if begin in t and end in t])
+    return result
+
+
+def summarize(times: Dict[int, Dict[str, float]], final: Dict[int, str], wall: float) -> Dict:
+    """Перцентили этапов и пропускная способность"""
+    summary = {"requests": len(times), "wall_time": wall, "stages": {}}
+    for name, values in stage_latencies(times).items():
+        stage = {"count": int(len(values))}
+        if len(values):
+            stage.update({f"p{q}": float(v) for q, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))})
+            stage["max"] = float(values.max())
+        summary["stages"][name] = stage
+
+    statuses = {}
+    for status in final.values():
+        statuses[status] = statuses.get(status, 0) + 1
+    summary["statuses"] = statuses
+
+    created = [t["PENDING"] for t in times.values() if "PENDING" in t]
+    completed = [t["COMPLETED"] for t in times.values() if "COMPLETED" in t]
+    ready = [t["READY"] for t in times.values() if "READY" in t]
+    if created and completed:
+        span = max(completed) - min(created)
+        summary["throughput"] = len(completed) / span if span > 0 else None
+    if created and ready:
+        span = max(ready) - min(created)
+        summary["planning_throughput"] = len(ready) / span if span > 0 else None
+    return summary
+
+
+def print_summary(summary: Dict, time_scale: float):
+    print(f"\nЗаявок: {summary['requests']}, статусы: {summary['statuses']}, "
+          f"время прогона {summary['wall_time']:.1f} с")
+    header = f"{'этап':<10}{'n':>7}" + "".join(f"{f'p{q}, мс':>12}" for q in PERCENTILES) + f"{'max, мс':>12}"
+    print(header)
+    for name, stage in summary["stages"].items():
+        if not stage["count"]:
+            print(f"{name:<10}{0:>7}")
+            continue
+        cells = "".join(f"{stage[f'p{q}'] * 1000:>12.1f}" for q in PERCENTILES)
+        print(f"{name:<10}{stage['count']:>7}{cells}{stage['max'] * 1000:>12.1f}")
+    print(f"(travel — реальное время при ускорении симуляции x{time_scale:g})")
+    if summary.get("throughput"):
+        print(f"Пропускная способность: {summary['throughput']:.2f} заявок/с до COMPLETED, "
+              f"{summary.get('planning_throughput') or 0:.2f} заявок/с до READY")
+
+
+async def run_benchmark(count: int, rate: float, time_scale: float, timeout: float,
+                        map_file: str, seed_value: int) -> Dict:
+    import main as api
+    import planner_service
+    import robot_emulator
+
+    rng = np.random.default_rng(seed_value)
+    user_id, robot_ids, targets = seed(count, map_file, rng)
+
+    async with api.app.router.lifespan_context(api.app):
+        transport = httpx.ASGITransport(app=api.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark",
+                                     timeout=httpx.Timeout(60.0)) as client:
+            # Планировщик — в своём потоке (синхронный код), его HTTP-запросы идут в этот loop
+            planner_service.requests = LoopRequests(client, asyncio.get_running_loop())
+            planner_service.API_BASE_URL = ""
+            stop = threading.Event()
+            planner = threading.Thread(target=planner_service.run, name="planner",
+                                       kwargs={"stop": stop, "wait_timeout": EVENTS_WAIT}, daemon=True)
+            emulator = robot_emulator.RobotEmulator(client=client, time_scale=time_scale)
+
+            monitor = LifecycleMonitor(client)
+            await monitor.start_cursor()
+            planner.start()
+            emulator_task = asyncio.create_task(emulator.run())
+            started = time.perf_counter()
+            try:
+                watcher = asyncio.create_task(monitor.run(count))
+                for robot_id, (x, y) in zip(robot_ids, targets):
+                    response = await client.post("/requests/", json={
+                        "user_id": user_id, "robot_id": robot_id, "target_x": float(x), "target_y": float(y)
+                    })
+                    if response.status_code != 201:
+                        raise RuntimeError(f"Заявка не создана: {response.status_code} {response.text}")
+                    if rate > 0:
+                        await asyncio.sleep(1.0 / rate)
+                await asyncio.wait_for(watcher, timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Прогон не уложился в {timeout} с: "
+                             f"завершено {len(monitor.final)} из {count} заявок")
+            finally:
+                wall = time.perf_counter() - started
+                stop.set()
+                emulator_task.cancel()
+                await asyncio.gather(emulator_task, return_exceptions=True)
+                await asyncio.to_thread(planner.join)
+
+    summary = summarize(monitor.times, monitor.final, wall)
+    summary.update({"time_scale": time_scale, "event_resets": monitor.resets,
+                    "finished": len(monitor.final) == count})
+    return summary
+
+
+def main(count: int = REQUESTS, rate: float = RATE, time_scale: float = TIME_SCALE,
+         timeout: float = TIMEOUT, map_file: str = MAP_FILE, seed_value: int = 0,
+         output: Optional[str] = None, database: Optional[str] = None) -> int:
+    # Движки API создаются при импорте app, поэтому БД выбирается до него
+    directory = None
+    if database is None:
+        directory = tempfile.TemporaryDirectory()
+        database = os.path.join(directory.name, "benchmark.sqlite")
+    elif os.path.exists(database):
+        os.remove(database)
+    os.environ["DB_SQLITE_PATH"] = database
+    sys.path.insert(0, API_DIR)
+    # Заявки по одной в журнале не нужны
+    for name in ("planner_service", "robot_emulator", "httpx"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    try:
+        summary = asyncio.run(run_benchmark(count, rate, time_scale, timeout, map_file, seed_value))
+    finally:
+        if directory is not None:
+            directory.cleanup()
+
+    print_summary(summary, time_scale)
+    if output:
+        with open(output, "w") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+    return 0 if summary["finished"] and set(summary["statuses"]) == {"COMPLETED"} else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сквозной бенчмарк жизненного цикла заявок (без сети)")
+    parser.add_argument("-n", "--requests", type=int, default=REQUESTS,
+                        help="сколько заявок подать (столько же роботов создаётся)")
+    parser.add_argument("--rate", type=float, default=RATE,
+                        help="заявок в секунду (0 — все сразу)")
+    parser.add_argument("--time-scale", type=float, default=TIME_SCALE,
+                        help="во сколько раз симуляция движения быстрее реального времени")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT,
+                        help="предельное время прогона, секунды")
+    parser.add_argument("--map", default=MAP_FILE, help="PNG карты для роботов")
+    parser.add_argument("--seed", type=int, default=0, help="зерно генератора стартов и целей")
+    parser.add_argument("--db", default=None,
+                        help="файл SQLite (пересоздаётся); по умолчанию — временный")
+    parser.add_argument("--output", default=None, help="записать результаты в JSON")
+    args = parser.parse_args()
+    sys.exit(main(count=args.requests, rate=args.rate, time_scale=args.time_scale,
+                  timeout=args.timeout, map_file=args.map, seed_value=args.seed,
+                  output=args.output, database=args.db))
@@ -0,0 +1,21 @@
+from .grid import OccupancyGrid, get_grid, clear_grid_cache, decode_occupancy
+from .search import jps, expand_path, path_length, octile, find_path, resample_polyline
+from .cache import TrajectoryCache
+from .preprocess import MapData, get_map_data, preprocess_occupancy
+
+__all__ = [
+    'OccupancyGrid',
+    'get_grid',
+    'clear_grid_cache',
+    'decode_occupancy',
+    'jps',
+    'expand_path',
+    'path_length',
+    'octile',
+    'find_path',
+    'resample_polyline',
+    'TrajectoryCache',
+    'MapData',
+    'get_map_data',
+    'preprocess_occupancy',
+]
@@ -0,0 +1,116 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from planner.grid import OccupancyGrid
+
+
+class TrajectoryCache:
+    """LRU-кэш рассчитанных траекторий.
+
+    Ключ — (map_id, ячейка старта, ячейка цели), где ячейки получаются
+    квантованием координат с шагом quantum. Записи вытесняются по размеру
+    (самая давно использованная) и по возрасту (ttl, секунды). Каждая
+    запись помнит подпись файла карты: если файл изменился, все записи
+    этой карты сбрасываются.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600.0, quantum: float = 0.5,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.quantum = quantum
+        self._clock = clock
+        self._entries: "OrderedDict[Tuple, Tuple[np.ndarray, Tuple, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def key(self, map_id: Optional[int], start_x: float, start_y: float,
+            end_x: float, end_y: float) -> Tuple:
+        """Ключ кэша с квантованием координат"""
+        q = self.quantum
+        return (map_id,
+                math.floor(start_x / q), math.floor(start_y / q),
+                math.floor(end_x / q), math.floor(end_y / q))
+
+    def get(self, grid: Optional[OccupancyGrid], start_x: float, start_y: float,
+            end_x: float, end_y: float) -> Optional[np.ndarray]:
+        """Траектория из кэша или None (промах)"""
+        map_id = grid.map_id if grid is not None else None
+        signature = grid.signature if grid is not None else ()
+        key = self.key(map_id, start_x, start_y, end_x, end_y)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                states, entry_signature, created = entry
+                if entry_signature != signature:
+                    # Файл карты изменился: сбрасываем все записи со старой подписью
+                    self._invalidate_map_locked(map_id, keep_signature=signature)
+                    entry = None
+                elif self._clock() - created > self.ttl:
+                    del self._entries[key]
+                    self.evictions += 1
+                    entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return states
+
+    def put(self, grid: Optional[OccupancyGrid], start_x: float, start_y: float,
+            end_x: float, end_y: float, states: np.ndarray):
+        """Сохраняет траекторию; при переполнении вытесняет самую старую по использованию"""
+        map_id = grid.map_id if grid is not None else None
+        signature = grid.signature if grid is not None else ()
+        key = self.key(map_id, start_x, start_y, end_x, end_y)
+
+        states = np.array(states, copy=True)
+        states.setflags(write=False)
+        with self._lock:
+            self._entries[key] = (states, signature, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_map(self, map_id: Optional[int]):
+        """Удаляет все траектории карты"""
+        with self._lock:
+            self._invalidate_map_locked(map_id)
+
+    def _invalidate_map_locked(self, map_id: Optional[int], keep_signature: Optional[Tuple] = None):
+        stale = [key for key, (_, signature, _) in self._entries.items()
+                 if key[0] == map_id and signature != keep_signature]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, float]:
+        """Счётчики кэша"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
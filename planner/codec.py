@@ -0,0 +1,223 @@
+import struct
+import zlib
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from planner.ocp import TRAJECTORY_FIELDS
+
+# Двоичный формат траектории версии 1 — тот же, что в
+# robot_delivery_system/app/trajectory_codec.py (там описание полей)
+MAGIC = b"TRJ"
+VERSION = 1
+FLAG_DEFLATE = 0x01
+MEDIA_TYPE = "application/x-trajectory"
+
+_HEADER = struct.Struct("<3sBBBHI")
+_DTYPE = np.dtype("<f4")
+
+
+def encode_trajectory(states: np.ndarray, fields: Sequence[str] = TRAJECTORY_FIELDS,
+                      compress: bool = True) -> bytes:
+    """Массив состояний (N, len(fields)) -> двоичная траектория"""
+    states = np.asarray(states)
+    if states.ndim != 2 or states.shape[1] != len(fields):
+        raise ValueError(f"Ожидается массив (N, {len(fields)}), получен {states.shape}")
+
+    columns = np.ascontiguousarray(states.T, dtype=_DTYPE)
+    names = ",".join(fields).encode("ascii")
+    padding = b"\0" * (-(_HEADER.size + len(names)) % _DTYPE.itemsize)
+    flags = 0
+    if compress:
+        # Перестановка байтов: старшие байты соседних значений идут подряд
+        shuffled = columns.reshape(-1).view(np.uint8).reshape(-1, _DTYPE.itemsize).T
+        payload = zlib.compress(np.ascontiguousarray(shuffled).tobytes(), 6)
+        flags |= FLAG_DEFLATE
+    else:
+        payload = columns.tobytes()
+    header = _HEADER.pack(MAGIC, VERSION, flags, len(fields), len(names), states.shape[0])
+    return header + names + padding + payload
+
+
+def decode_trajectory(data: bytes) -> Tuple[Tuple[str, ...], np.ndarray]:
+    """
+    Двоичная траектория -> (имена полей, столбцы (len(fields), N) float32).
+    Несжатые данные не копируются: столбцы — представление над data.
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("Траектория слишком короткая")
+    magic, version, flags, n_fields, names_len, n_points = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Неизвестный формат траектории")
+    if version != VERSION:
+        raise ValueError(f"Неподдерживаемая версия траектории: {version}")
+
+    offset = _HEADER.size + names_len
+    fields = tuple(bytes(data[_HEADER.size:offset]).decode("ascii").split(",")) if names_len else ()
+    if len(fields) != n_fields:
+        raise ValueError("Повреждён заголовок траектории")
+    offset += -offset % _DTYPE.itemsize
+    count = n_fields * n_points
+    size = count * _DTYPE.itemsize
+
+    if flags & FLAG_DEFLATE:
+        try:
+            decompressor = zlib.decompressobj()
+            raw = decompressor.decompress(memoryview(data)[offset:], size + 1)
+        except zlib.error as e:
+            raise ValueError(f"Повреждены данные траектории: {e}")
+        if not decompressor.eof:
+            raise ValueError("Повреждены данные траектории: поток обрезан")
+        if len(raw) != size:
+            raise ValueError("Размер данных не совпадает с заголовком траектории")
+        shuffled = np.frombuffer(raw, dtype=np.uint8).reshape(_DTYPE.itemsize, count)
+        columns = np.ascontiguousarray(shuffled.T).view(_DTYPE).reshape(n_fields, n_points)
+    else:
+        if len(data) - offset != size:
+            raise ValueError("Размер данных не совпадает с заголовком траектории")
+        columns = np.frombuffer(data, dtype=_DTYPE, count=count, offset=offset).reshape(n_fields, n_points)
+    return fields, columns
+
+
+def trajectory_dtype(fields: Sequence[str]) -> np.dtype:
+    """Структурированный тип точки: по полю float64 на ключ"""
+    return np.dtype([(name, np.float64) for name in fields])
+
+
+def columns_to_records(fields: Sequence[str], columns: np.ndarray) -> np.ndarray:
+    """Столбцы (len(fields), N) -> структурированный массив точек (N,)"""
+    records = np.empty(columns.shape[1] if columns.ndim == 2 else 0, dtype=trajectory_dtype(fields))
+    for name, column in zip(fields, columns):
+        records[name] = column
+    return records
+
+
+def parse_path_string(path_string: str, fields: Optional[Sequence[str]] = None) -> np.ndarray:
+    """
+    Строка "x:..,y:..;x:..,y:.." -> структурированный массив точек.
+    Поля берутся из первой точки (или задаются fields). Если все точки
+    записаны с одинаковыми ключами в одном порядке, строка разбирается
+    векторно по байтам за один проход; иначе — построчно, отсутствующие
+    значения заполняются NaN.
+    """
+    body = path_string.strip().strip(";")
+    if fields is None:
+        first = body.split(";", 1)[0]
+        fields = tuple(pair.split(":", 1)[0].strip() for pair in first.split(",") if ":" in pair)
+    dtype = trajectory_dtype(fields or ())
+    if not body or not fields:
+        return np.empty(0, dtype=dtype)
+
+    try:
+        buf = np.frombuffer(body.encode("ascii"), dtype=np.uint8)
+    except UnicodeEncodeError:
+        buf = None
+    values = _parse_uniform(buf, fields) if buf is not None else None
+    if values is None:
+        return _parse_path_string_slow(body, fields)
+    return values.view(dtype).reshape(-1)
+
+
+def _parse_uniform(buf: np.ndarray, fields: Sequence[str]) -> Optional[np.ndarray]:
+    """Векторный разбор "k:v,k:v;..." с ключами fields в каждой точке -> (N, len(fields))"""
+    n_fields = len(fields)
+    colons = np.flatnonzero(buf == ord(":"))
+    is_sep = (buf == ord(",")) | (buf == ord(";"))
+    seps = np.flatnonzero(is_sep)
+    if colons.size % n_fields or seps.size != colons.size - 1:
+        return None
+    # Ключи и значения чередуются: ключ : значение , ключ : значение ; ...
+    if np.any(seps <= colons[:-1]) or np.any(colons[1:] <= seps):
+        return None
+    # Точки разделены ';', поля внутри точки — ','
+    point_end = (np.arange(seps.size) % n_fields) == n_fields - 1
+    if np.any((buf[seps] == ord(";")) != point_end):
+        return None
+    key_starts = np.concatenate(([0], seps + 1))
+    for j, name in enumerate(fields):
+        starts = key_starts[j::n_fields]
+        if np.any(colons[j::n_fields] - starts != len(name)):
+            return None
+        for k, char in enumerate(name.encode("ascii")):
+            if np.any(buf[starts + k] != char):
+                return None
+
+    numbers = _parse_numbers(buf, colons + 1, np.append(seps, buf.size))
+    if numbers is None:
+        return None
+    return numbers.reshape(-1, n_fields)
+
+
+# Самое длинное значение, которое разбирается векторно (символов)
+_MAX_VALUE_WIDTH = 32
+
+
+def _parse_numbers(buf: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> Optional[np.ndarray]:
+    """
+    Числа из buf[starts[i]:ends[i]]: значения копируются в строки
+    фиксированной ширины и приводятся к float64 одним вызовом NumPy.
+    """
+    lengths = ends - starts
+    width = int(lengths.max())
+    if lengths.min() <= 0 or width > _MAX_VALUE_WIDTH:
+        return None
+    padded = np.concatenate((buf, np.zeros(width, dtype=np.uint8)))
+    table = sliding_window_view(padded, width)[starts]
+    table[np.arange(width) >= lengths[:, None]] = 0
+    try:
+        return table.view(f"S{width}").ravel().astype(np.float64)
+    except ValueError:
+        return None
+
+
+def _parse_path_string_slow(body: str, fields: Sequence[str]) -> np.ndarray:
+    """Построчный разбор строк с разными ключами или пропусками"""
+    index = {name: i for i, name in enumerate(fields)}
+    rows = []
+    for point_str in body.split(";"):
+        if not point_str.strip():
+            continue
+        row = [np.nan] * len(fields)
+        for pair in point_str.split(","):
+            key, sep, value = pair.partition(":")
+            i = index.get(key.strip())
+            if sep and i is not None:
+                try:
+                    row[i] = float(value)
+                except ValueError:
+                    pass
+        rows.append(tuple(row))
+    return np.array(rows, dtype=trajectory_dtype(fields))
+
+
+class PathStringStream:
+    """
+    Потоковый разбор строки траектории по частям (например, из HTTP-ответа):
+    feed() возвращает уже полные точки, хвост незавершённой точки
+    ждёт следующей части.
+    """
+
+    def __init__(self, fields: Optional[Sequence[str]] = None):
+        self.fields = tuple(fields) if fields else None
+        self._tail = ""
+
+    def feed(self, chunk: str) -> np.ndarray:
+        data = self._tail + chunk
+        cut = data.rfind(";")
+        if cut < 0:
+            self._tail = data
+            return np.empty(0, dtype=trajectory_dtype(self.fields or ()))
+        self._tail = data[cut + 1:]
+        return self._parse(data[:cut])
+
+    def close(self) -> np.ndarray:
+        """Последняя точка (после неё разделителя нет)"""
+        data, self._tail = self._tail, ""
+        return self._parse(data)
+
+    def _parse(self, data: str) -> np.ndarray:
+        records = parse_path_string(data, self.fields)
+        if self.fields is None and records.dtype.names:
+            self.fields = records.dtype.names
+        return records
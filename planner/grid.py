@@ -0,0 +1,203 @@
+import io
+import os
+import threading
+import time
+import logging
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Пиксель считается препятствием, если он непрозрачный (alpha >= порога)
+# или, для карт без альфа-канала, тёмный (яркость < порога)
+OCCUPIED_THRESHOLD = 128
+# 1 пиксель карты = 1 метр, начало координат — левый нижний угол (как в GUI)
+MAP_RESOLUTION = 1.0
+# Как часто сверять с API карту, загруженную по сети (If-None-Match), секунды
+REMOTE_REVALIDATE_INTERVAL = 5.0
+
+
+class OccupancyGrid:
+    """Сетка занятости карты: occupied[row, col] == True — препятствие.
+
+    Строка 0 соответствует верхнему краю изображения, ось Y мира направлена вверх.
+    """
+
+    def __init__(self, map_id: int, occupied: np.ndarray,
+                 resolution: float = MAP_RESOLUTION, signature: Tuple = (),
+                 source_path: Optional[str] = None):
+        self.map_id = map_id
+        self.occupied = np.ascontiguousarray(occupied, dtype=bool)
+        self.occupied.setflags(write=False)
+        self.height, self.width = self.occupied.shape
+        self.resolution = resolution
+        self.signature = signature  # (mtime, size) файла или ("etag", ETag) ответа API — для инвалидации
+        self.source_path = source_path  # PNG карты: рядом лежат предрасчитанные данные
+        # Данные для поиска строятся лениво и живут вместе с сеткой
+        self._search_data = None
+        self._map_data = None
+
+    def __reduce__(self):
+        # При передаче в процесс-воркер данные поиска не копируются:
+        # там сетка берётся из локального кэша или строится заново
+        return _restore_grid, (self.map_id, self.occupied, self.resolution, self.signature, self.source_path)
+
+    def world_to_cell(self, x: float, y: float) -> Tuple[int, int]:
+        """Мировые координаты -> (row, col) ячейки"""
+        col = int(np.floor(x / self.resolution))
+        row = self.height - 1 - int(np.floor(y / self.resolution))
+        return row, col
+
+    def cell_to_world(self, row: int, col: int) -> Tuple[float, float]:
+        """(row, col) ячейки -> координаты её центра"""
+        x = (col + 0.5) * self.resolution
+        y = (self.height - 1 - row + 0.5) * self.resolution
+        return x, y
+
+    def in_bounds(self, row: int, col: int) -> bool:
+        return 0 <= row < self.height and 0 <= col < self.width
+
+    def is_free(self, row: int, col: int) -> bool:
+        return self.in_bounds(row, col) and not self.occupied[row, col]
+
+    def nearest_free(self, row: int, col: int, max_radius: int = 16) -> Optional[Tuple[int, int]]:
+        """Ближайшая свободная ячейка в окне max_radius (или None)"""
+        if self.is_free(row, col):
+            return row, col
+
+        r0 = max(row - max_radius, 0)
+        r1 = min(row + max_radius + 1, self.height)
+        c0 = max(col - max_radius, 0)
+        c1 = min(col + max_radius + 1, self.width)
+        if r0 >= r1 or c0 >= c1:
+            return None
+
+        free = np.argwhere(~self.occupied[r0:r1, c0:c1])
+        if free.size == 0:
+            return None
+
+        d2 = (free[:, 0] + r0 - row) ** 2 + (free[:, 1] + c0 - col) ** 2
+        best = free[int(np.argmin(d2))]
+        if d2.min() > max_radius * max_radius:
+            return None
+        return int(best[0]) + r0, int(best[1]) + c0
+
+
+def decode_occupancy(image: Image.Image) -> np.ndarray:
+    """Декодирует изображение карты в булев массив занятости"""
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        alpha = np.asarray(image.convert("RGBA"))[:, :, 3]
+        return alpha >= OCCUPIED_THRESHOLD
+
+    gray = np.asarray(image.convert("L"))
+    return gray < OCCUPIED_THRESHOLD
+
+
+def file_signature(file_path: str) -> Tuple:
+    """Подпись файла карты: меняется при перезаписи файла"""
+    stat = os.stat(file_path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def load_grid_from_file(map_id: int, file_path: str) -> OccupancyGrid:
+    """Читает PNG карты с диска"""
+    signature = file_signature(file_path)
+    with Image.open(file_path) as image:
+        occupied = decode_occupancy(image)
+    logger.info(f"Карта {map_id} декодирована из {file_path}: {occupied.shape[1]}x{occupied.shape[0]}")
+    return OccupancyGrid(map_id, occupied, signature=signature, source_path=file_path)
+
+
+def load_grid_from_bytes(map_id: int, data: bytes, etag: Optional[str] = None) -> OccupancyGrid:
+    """Декодирует PNG карты, полученный по сети (etag — заголовок ETag ответа)"""
+    with Image.open(io.BytesIO(data)) as image:
+        occupied = decode_occupancy(image)
+    logger.info(f"Карта {map_id} декодирована из ответа API: {occupied.shape[1]}x{occupied.shape[0]}")
+    signature = ("etag", etag) if etag else (len(data),)
+    return OccupancyGrid(map_id, occupied, signature=signature)
+
+
+# Кэш декодированных карт: map_id -> OccupancyGrid
+_grid_cache: Dict[int, OccupancyGrid] = {}
+# Когда карта, загруженная по сети, последний раз сверялась с API (time.monotonic)
+_grid_checked: Dict[int, float] = {}
+_grid_lock = threading.Lock()
+
+# fetch_image(etag) -> (PNG, ETag); PNG None — карта не изменилась (304)
+FetchImage = Callable[[Optional[str]], Tuple[Optional[bytes], Optional[str]]]
+
+
+def _fetch_grid(map_id: int, cached: Optional[OccupancyGrid], fetch_image: FetchImage) -> OccupancyGrid:
+    """Сетка карты из API: не чаще раза в REMOTE_REVALIDATE_INTERVAL сверяется по ETag"""
+    now = time.monotonic()
+    with _grid_lock:
+        checked = _grid_checked.get(map_id)
+    if cached is not None and checked is not None and now - checked < REMOTE_REVALIDATE_INTERVAL:
+        return cached
+
+    etag = cached.signature[1] if cached is not None and cached.signature[:1] == ("etag",) else None
+    try:
+        data, etag = fetch_image(etag)
+    except Exception as e:
+        if cached is None:
+            raise
+        logger.warning(f"Не удалось проверить карту {map_id}, используется загруженная ранее: {e}")
+        data = None
+
+    with _grid_lock:
+        _grid_checked[map_id] = now
+    if data is None and cached is not None:
+        return cached
+    if data is None:
+        raise ValueError(f"API не вернул изображение карты {map_id}")
+    return load_grid_from_bytes(map_id, data, etag)
+
+
+def get_grid(map_id: int, file_path: Optional[str] = None,
+             fetch_image: Optional[FetchImage] = None) -> OccupancyGrid:
+    """Возвращает сетку карты из кэша, декодируя PNG только при первом обращении.
+
+    Если файл доступен локально, он читается с диска и перечитывается при изменении;
+    иначе изображение загружается через fetch_image() и перепроверяется по ETag
+    (новое изображение — новая подпись сетки, кэш траекторий карты сбрасывается).
+    """
+    with _grid_lock:
+        cached = _grid_cache.get(map_id)
+
+    if file_path and os.path.exists(file_path):
+        if cached is not None and cached.signature == file_signature(file_path):
+            return cached
+        grid = load_grid_from_file(map_id, file_path)
+    elif fetch_image is not None:
+        grid = _fetch_grid(map_id, cached, fetch_image)
+        if grid is cached:
+            return cached
+    elif cached is not None:
+        return cached
+    else:
+        raise ValueError(f"Файл карты {map_id} недоступен: {file_path}")
+
+    with _grid_lock:
+        _grid_cache[map_id] = grid
+    return grid
+
+
+def _restore_grid(map_id: int, occupied: np.ndarray, resolution: float, signature: Tuple,
+                  source_path: Optional[str] = None) -> OccupancyGrid:
+    """Распаковка сетки в другом процессе: одна карта — один объект на процесс"""
+    with _grid_lock:
+        cached = _grid_cache.get(map_id)
+        if cached is not None and cached.signature == signature:
+            return cached
+        grid = OccupancyGrid(map_id, occupied, resolution, signature, source_path)
+        _grid_cache[map_id] = grid
+        return grid
+
+
+def clear_grid_cache():
+    """Очищает кэш карт"""
+    with _grid_lock:
+        _grid_cache.clear()
+        _grid_checked.clear()
@@ -0,0 +1,276 @@
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from planner.grid import OccupancyGrid
+from planner.preprocess import get_map_data
+from planner.search import resample_polyline
+
+# Порядок полей состояния в выходном массиве траектории
+TRAJECTORY_FIELDS = ("x", "y", "v", "th", "de", "a", "w")
+
+
+class VehicleParams:
+    """Параметры кинематической модели робота-велосипеда и решателя"""
+    WHEELBASE = 0.5      # база, м
+    V_MAX = 1.5          # максимальная скорость, м/с
+    A_MAX = 0.5          # максимальное ускорение/торможение, м/с^2
+    A_LAT_MAX = 0.4      # допустимое поперечное ускорение, м/с^2
+    DE_MAX = 0.6         # максимальный угол поворота колёс, рад
+    W_MAX = 0.8          # максимальная скорость поворота колёс, рад/с
+    DT = 0.2             # шаг интегрирования, с
+    OUTPUT_DT = 2.0      # шаг точек в выходной траектории, с
+    REF_STEP = 0.5       # шаг передискретизации опорного пути, м
+    GOAL_TOL = 0.3       # допуск достижения цели, м
+    SEARCH_WINDOW = 16   # окно поиска ближайшей опорной точки, точек
+    CLEARANCE = 1.0      # желаемый зазор до препятствий, м
+
+    # Кандидаты, которые перебираются для каждой заявки одновременно
+    CRUISE_SPEEDS = (0.5, 1.0, 1.5)
+    LOOKAHEADS = (0.75, 1.5)
+
+    # Веса функции стоимости
+    W_TIME = 1.0
+    W_TRACK = 4.0
+    W_EFFORT = 0.5
+    W_COLLISION = 1e4
+    W_CLEARANCE = 2.0
+    W_GOAL = 1e5
+
+
+class OcpSolution(NamedTuple):
+    states: np.ndarray   # (T, len(TRAJECTORY_FIELDS))
+    cost: float
+    feasible: bool
+
+
+def _pad_references(references: Sequence[np.ndarray], step: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Передискретизирует опорные пути и выравнивает их по длине (повтором цели).
+
+    Возвращает точки (N, M, 2), накопленную длину (N, M) и длину пути (N,).
+    """
+    resampled = [resample_polyline(ref, step) for ref in references]
+    m = max(len(r) for r in resampled)
+    n = len(resampled)
+
+    pts = np.empty((n, m, 2))
+    arc = np.empty((n, m))
+    length = np.empty(n)
+    for i, r in enumerate(resampled):
+        k = len(r)
+        pts[i, :k] = r
+        pts[i, k:] = r[-1]
+        seg = np.hypot(*np.diff(r, axis=0).T) if k > 1 else np.zeros(0)
+        arc[i, 0] = 0.0
+        arc[i, 1:k] = np.cumsum(seg)
+        arc[i, k:] = arc[i, k - 1]
+        length[i] = arc[i, k - 1]
+    return pts, arc, length
+
+
+def _grid_masks(grids: Sequence[Optional[OccupancyGrid]], owner: np.ndarray) -> List[Tuple[OccupancyGrid, np.ndarray, Optional[np.ndarray]]]:
+    """
+    Группирует прогоны по картам: [(сетка, маска прогонов (B,), зазор ячеек
+    в метрах или None, если поле расстояний карты не посчитано)]
+    """
+    groups = []
+    for grid in {id(g): g for g in grids if g is not None}.values():
+        mask = np.fromiter((g is grid for g in grids), dtype=bool, count=len(grids))[owner]
+        clearance = get_map_data(grid).clearance
+        if clearance is not None:
+            # Поле расстояний — между центрами ячеек; до края препятствия на полячейки меньше
+            clearance = np.maximum(clearance - 0.5, 0.0) * grid.resolution
+        groups.append((grid, mask, clearance))
+    return groups
+
+
+def _probe(x: np.ndarray, y: np.ndarray, groups: List[Tuple[OccupancyGrid, np.ndarray, Optional[np.ndarray]]],
+           default_clearance: float) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Для точек прогонов (B,): находится ли точка в препятствии или вне карты
+    и зазор до ближайшего препятствия, м (без карты или поля расстояний — default_clearance)
+    """
+    blocked = np.zeros(x.shape[0], dtype=bool)
+    clearance = np.full(x.shape[0], default_clearance)
+    for grid, mask, grid_clearance in groups:
+        col = np.floor(x[mask] / grid.resolution).astype(np.int64)
+        row = grid.height - 1 - np.floor(y[mask] / grid.resolution).astype(np.int64)
+        inside = (row >= 0) & (row < grid.height) & (col >= 0) & (col < grid.width)
+        hit = ~inside
+        hit[inside] = grid.occupied[row[inside], col[inside]]
+        blocked[mask] = hit
+        if grid_clearance is None:
+            continue
+        gap = np.zeros(hit.shape[0])
+        gap[inside] = grid_clearance[row[inside], col[inside]]
+        clearance[mask] = gap
+    return blocked, clearance
+
+
+def optimize_batch(references: Sequence[Sequence[Tuple[float, float]]],
+                   grids: Optional[Sequence[Optional[OccupancyGrid]]] = None,
+                   params: type = VehicleParams) -> List[OcpSolution]:
+    """Рассчитывает динамически допустимые траектории сразу для пачки заявок.
+
+    Каждая заявка задаётся опорным путём (например, из JPS). Для всех заявок
+    и всех кандидатов (крейсерская скорость x дальность упреждения) модель
+    велосипеда прогоняется одновременно как массивы формы (N*K,); управление
+    (a, w) ограничено, поэтому ограничения на v, a, de и w выполняются
+    по построению. Стоимость (время, отклонение от пути, затраты на
+    управление, столкновения, близость к препятствиям, недостижение цели)
+    считается векторно, и для каждой заявки выбирается лучший кандидат.
+    """
+    n = len(references)
+    if n == 0:
+        return []
+    if grids is None:
+        grids = [None] * n
+
+    p = params
+    ref_pts, ref_arc, ref_len = _pad_references([np.asarray(r, dtype=np.float64) for r in references],
+                                               p.REF_STEP)
+    m = ref_pts.shape[1]
+
+    speeds, lookaheads = np.meshgrid(np.asarray(p.CRUISE_SPEEDS, dtype=np.float64),
+                                     np.asarray(p.LOOKAHEADS, dtype=np.float64))
+    speeds = np.minimum(speeds.ravel(), p.V_MAX)
+    lookaheads = lookaheads.ravel()
+    k = speeds.size
+    b = n * k
+
+    # Прогон b принадлежит заявке owner[b] и кандидату b % k
+    owner = np.repeat(np.arange(n), k)
+    v_cruise = np.tile(speeds, n)
+    look_pts = np.maximum(np.rint(np.tile(lookaheads, n) / p.REF_STEP).astype(np.int64), 1)
+    look_dist = look_pts * p.REF_STEP
+
+    pts = ref_pts[owner]           # (B, M, 2)
+    arc = ref_arc[owner]           # (B, M)
+    length = ref_len[owner]        # (B,)
+    goal = pts[:, -1, :]           # (B, 2)
+
+    # Начальное состояние: на старте, курс вдоль первого сегмента, покой
+    first = np.minimum(1, m - 1)
+    x = pts[:, 0, 0].copy()
+    y = pts[:, 0, 1].copy()
+    th = np.arctan2(pts[:, first, 1] - y, pts[:, first, 0] - x)
+    v = np.zeros(b)
+    de = np.zeros(b)
+    idx = np.zeros(b, dtype=np.int64)
+    done = length <= p.GOAL_TOL
+
+    # Горизонт: путь на минимальной скорости с запасом на разгон и торможение
+    t_max = int(np.ceil((ref_len.max() / min(speeds.min(), p.V_MAX) * 1.5
+                         + 2.0 * p.V_MAX / p.A_MAX) / p.DT)) + 1
+
+    window = np.arange(p.SEARCH_WINDOW)
+    rows = np.arange(b)
+    hist = np.empty((t_max + 1, len(TRAJECTORY_FIELDS), b))
+    hist[0] = (x, y, v, th, de, np.zeros(b), np.zeros(b))
+    cross2 = np.zeros(b)
+    effort = np.zeros(b)
+    steps = np.zeros(b, dtype=np.int64)
+    groups = _grid_masks(grids, owner)
+    blocked, _ = _probe(x, y, groups, p.CLEARANCE)
+    collisions = blocked.astype(np.float64)
+    proximity = np.zeros(b)
+    arrived = np.zeros(b, dtype=bool)
+
+    t = 0
+    while t < t_max and not done.all():
+        live = ~done
+
+        # Ближайшая опорная точка в окне впереди текущей
+        cand = np.minimum(idx[:, None] + window, m - 1)               # (B, W)
+        d2 = (pts[rows[:, None], cand, 0] - x[:, None]) ** 2 + \
+             (pts[rows[:, None], cand, 1] - y[:, None]) ** 2
+        best = np.argmin(d2, axis=1)
+        idx = cand[rows, best]
+        cross2 += np.where(live, d2[rows, best], 0.0)
+
+        # Чистое преследование: цель впереди на дальность упреждения
+        tgt = np.minimum(idx + look_pts, m - 1)
+        dx = pts[rows, tgt, 0] - x
+        dy = pts[rows, tgt, 1] - y
+        alpha = np.arctan2(dy, dx) - th
+        alpha = (alpha + np.pi) % (2.0 * np.pi) - np.pi
+        ld = np.maximum(np.hypot(dx, dy), 1e-6)
+        kappa = 2.0 * np.sin(alpha) / np.maximum(ld, look_dist)
+        de_des = np.clip(np.arctan(p.WHEELBASE * kappa), -p.DE_MAX, p.DE_MAX)
+        w = np.clip((de_des - de) / p.DT, -p.W_MAX, p.W_MAX)
+
+        # Профиль скорости: крейсерская, ограничение по кривизне и торможение к цели
+        dist_goal = np.hypot(goal[:, 0] - x, goal[:, 1] - y)
+        remaining = np.maximum(length - arc[rows, idx], dist_goal)
+        v_turn = np.sqrt(p.A_LAT_MAX / np.maximum(np.abs(np.tan(de_des)) / p.WHEELBASE, 1e-6))
+        # Запас в один шаг торможения компенсирует дискретность интегрирования
+        v_stop = np.maximum(np.sqrt(2.0 * p.A_MAX * np.maximum(remaining - p.GOAL_TOL * 0.5, 0.0))
+                            - p.A_MAX * p.DT, 0.0)
+        v_des = np.minimum(np.minimum(v_cruise, v_turn), v_stop)
+        a = np.clip((v_des - v) / p.DT, -p.A_MAX, p.A_MAX)
+
+        # Интегрирование модели (завершённые прогоны заморожены)
+        a = np.where(live, a, 0.0)
+        w = np.where(live, w, 0.0)
+        x = x + np.where(live, v * np.cos(th) * p.DT, 0.0)
+        y = y + np.where(live, v * np.sin(th) * p.DT, 0.0)
+        th = th + np.where(live, v / p.WHEELBASE * np.tan(de) * p.DT, 0.0)
+        v = np.where(live, np.maximum(v + a * p.DT, 0.0), 0.0)
+        de = np.clip(de + w * p.DT, -p.DE_MAX, p.DE_MAX)
+        effort += (a ** 2 + w ** 2) * p.DT
+        steps += live
+
+        # Управление, приложенное на шаге, относится к состоянию в его начале
+        hist[t, 5] = a
+        hist[t, 6] = w
+        t += 1
+        hist[t, :5] = (x, y, v, th, de)
+        hist[t, 5:] = 0.0
+
+        blocked, clearance = _probe(x, y, groups, p.CLEARANCE)
+        collisions += live & blocked
+        # Штраф за проезд ближе желаемого зазора (квадратичный по нехватке)
+        proximity += np.where(live, np.maximum(p.CLEARANCE - clearance, 0.0) ** 2 * p.DT, 0.0)
+
+        dist_goal = np.hypot(goal[:, 0] - x, goal[:, 1] - y)
+        stalled = (idx >= m - 1) & (v < 1e-3) & (a <= 0.0)
+        arrived |= live & (dist_goal < p.GOAL_TOL) & (v <= p.A_MAX * p.DT)
+        done = done | arrived | stalled
+
+        # Отсечение: нижняя граница стоимости ещё едущего кандидата уже хуже
+        # лучшего доехавшего кандидата той же заявки — дальше его не считаем
+        if arrived.any():
+            bound = (p.W_TIME * steps * p.DT + p.W_EFFORT * effort + p.W_COLLISION * collisions
+                     + p.W_CLEARANCE * proximity)
+            finished = np.where(arrived, bound + p.W_TRACK * cross2 / np.maximum(steps, 1), np.inf)
+            best_done = finished.reshape(n, k).min(axis=1)[owner]
+            done |= bound > best_done
+
+    reached = arrived | (np.hypot(goal[:, 0] - x, goal[:, 1] - y) < 2.0 * p.GOAL_TOL)
+
+    cost = (p.W_TIME * steps * p.DT
+            + p.W_TRACK * cross2 / np.maximum(steps, 1)
+            + p.W_EFFORT * effort
+            + p.W_COLLISION * collisions
+            + p.W_CLEARANCE * proximity
+            + p.W_GOAL * ~reached)
+    feasible = reached & (collisions == 0)
+
+    cost = cost.reshape(n, k)
+    best = np.argmin(cost, axis=1)
+    every = max(int(round(p.OUTPUT_DT / p.DT)), 1)
+
+    solutions = []
+    for i in range(n):
+        j = i * k + best[i]
+        states = hist[:steps[j] + 1, :, j]
+        # Прореживание по времени с сохранением конечного состояния
+        keep = np.unique(np.append(np.arange(0, len(states), every), len(states) - 1))
+        solutions.append(OcpSolution(states[keep], float(cost[i, best[i]]), bool(feasible[j])))
+    return solutions
+
+
+def solution_to_points(states: np.ndarray, digits: int = 3) -> List[dict]:
+    """Массив состояний -> список точек в формате API"""
+    rounded = np.round(states, digits).tolist()
+    return [dict(zip(TRAJECTORY_FIELDS, row)) for row in rounded]
@@ -0,0 +1,348 @@
+"""
+Предварительный расчёт данных карты для планировщика.
+
+Для каждой карты один раз считаются:
+- поле расстояний до ближайшего препятствия (в ячейках; край карты —
+  тоже препятствие) — для штрафа за близость к стенам в OCP;
+- компоненты связности свободных ячеек — недостижимая цель
+  отбрасывается без поиска;
+- таблицы кратчайших расстояний от нескольких ориентиров (ALT) — по
+  неравенству треугольника |d(L, n) - d(L, t)| является допустимой
+  эвристикой и намного точнее октильной на картах со стенами.
+
+Результат сохраняется рядом с PNG карты (maps/1.png -> maps/1.dist.npz)
+и загружается планировщиком при первом поиске по карте:
+
+    python -m planner.preprocess maps/*.png
+"""
+import argparse
+import hashlib
+import heapq
+import logging
+import math
+import os
+from collections import deque
+from typing import List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Число ориентиров ALT на карту
+LANDMARK_COUNT = 8
+# Ориентиры ставятся только в компоненты не меньше этой доли свободных ячеек
+LANDMARK_MIN_COMPONENT = 0.05
+# Суффикс файла с данными рядом с файлом карты
+SIDECAR_SUFFIX = ".dist.npz"
+FORMAT_VERSION = 1
+# Для карт не больше этого числа ячеек без файла данных планировщик сам
+# считает поле расстояний и компоненты (в памяти, миллисекунды); ориентиры
+# и данные больших карт — только через python -m planner.preprocess
+AUTO_PREPROCESS_CELLS = 256 * 256
+
+SQRT2 = math.sqrt(2.0)
+
+
+class MapData:
+    """Предрасчитанные данные карты.
+
+    clearance[row, col] — расстояние от центра ячейки до центра ближайшей
+    занятой ячейки (или рамки за краем карты), в ячейках; 0 в препятствиях.
+    labels[row, col] — номер компоненты связности, -1 в препятствиях.
+    Без предобработки большой карты clearance и labels — None: штрафа за
+    близость к стенам нет, а связность не проверяется до поиска.
+    landmarks (K, 2) — ячейки ориентиров, tables (K, H, W) — расстояния
+    от них; для ячеек, недостижимых из ориентира, хранится 0 (поиск
+    идёт только внутри одной компоненты, поэтому оценка остаётся допустимой).
+    """
+
+    def __init__(self, clearance: Optional[np.ndarray], labels: Optional[np.ndarray],
+                 landmarks: Optional[np.ndarray] = None, tables: Optional[np.ndarray] = None):
+        self.clearance = clearance
+        self.labels = labels
+        self.landmarks = landmarks if landmarks is not None else np.empty((0, 2), dtype=np.int32)
+        shape = labels.shape if labels is not None else (0, 0)
+        self.tables = tables if tables is not None else np.empty((0,) + shape, dtype=np.float32)
+
+    @property
+    def landmark_count(self) -> int:
+        return len(self.landmarks)
+
+    def connected(self, start: tuple, goal: tuple) -> bool:
+        """Лежат ли две свободные ячейки в одной компоненте (без компонент — считаются связными)"""
+        if self.labels is None:
+            return True
+        return self.labels[start] >= 0 and self.labels[start] == self.labels[goal]
+
+
+def occupancy_digest(occupied: np.ndarray) -> str:
+    """Хэш сетки занятости: данные привязаны к содержимому карты, а не к файлу"""
+    digest = hashlib.sha1(np.asarray(occupied.shape, dtype=np.int64).tobytes())
+    digest.update(np.packbits(occupied).tobytes())
+    return digest.hexdigest()
+
+
+def _lower_envelope(f: np.ndarray) -> np.ndarray:
+    """
+    Одномерное преобразование расстояний Фельценшвальба — Хуттенлохера
+    вдоль оси 0 сразу для всех столбцов f (N, M): min по q' f(q') + (q - q')^2.
+    Нижняя огибающая парабол строится за один проход по q — O(N·M).
+    """
+    n, m = f.shape
+    cols = np.arange(m)
+    h = f + (np.arange(n, dtype=np.float64) ** 2)[:, None]
+    # v[j] — вершины парабол огибающей, z[j]..z[j + 1] — их участки, k — последняя
+    v = np.zeros((n, m), dtype=np.int64)
+    z = np.empty((n + 1, m))
+    z[0] = -np.inf
+    z[1] = np.inf
+    k = np.zeros(m, dtype=np.int64)
+    for q in range(1, n):
+        todo = cols
+        hq = h[q]
+        while todo.size:
+            kk = k[todo]
+            p = v[kk, todo]
+            # Пересечение параболы q с последней параболой огибающей
+            s = (hq[todo] - h[p, todo]) / (2.0 * (q - p))
+            pop = s <= z[kk, todo]
+            if pop.any():
+                keep = ~pop
+                done, kk, s = todo[keep], kk[keep] + 1, s[keep]
+                todo = todo[pop]
+                k[todo] -= 1
+            else:
+                done, kk = todo, kk + 1
+                todo = todo[:0]
+            k[done] = kk
+            v[kk, done] = q
+            z[kk, done] = s
+            z[kk + 1, done] = np.inf
+
+    result = np.empty((n, m))
+    k[:] = 0
+    for q in range(n):
+        while True:
+            ahead = z[k + 1, cols] < q
+            if not ahead.any():
+                break
+            k += ahead
+        p = v[k, cols]
+        result[q] = (q - p) ** 2 + f[p, cols]
+    return result
+
+
+def distance_transform(occupied: np.ndarray) -> np.ndarray:
+    """
+    Точное евклидово поле расстояний до препятствий (float32, в ячейках)
+    за линейное время: сначала по столбцам — расстояние до ближайшего
+    препятствия по вертикали, затем по строкам — нижняя огибающая парабол.
+    """
+    height, width = occupied.shape
+    rows = np.arange(height)[:, None]
+    # Ближайшее препятствие сверху и снизу; рамка за краем — строки -1 и height
+    above = np.maximum.accumulate(np.where(occupied, rows, -1), axis=0)
+    below = np.minimum.accumulate(np.where(occupied, rows, height)[::-1], axis=0)[::-1]
+    vertical = np.minimum(rows - above, below - rows).astype(np.float64)
+
+    # Строки идут по оси 0; рамка слева и справа — столбцы -1 и width
+    g2 = np.zeros((width + 2, height))
+    g2[1:-1] = vertical.T ** 2
+    return np.sqrt(_lower_envelope(g2)[1:-1].T).astype(np.float32)
+
+
+def _padded_free(occupied: np.ndarray) -> bytearray:
+    free = np.zeros((occupied.shape[0] + 2, occupied.shape[1] + 2), dtype=np.uint8)
+    free[1:-1, 1:-1] = ~occupied
+    return bytearray(free.tobytes())
+
+
+def _unpad(values, height: int, width: int, dtype) -> np.ndarray:
+    return np.asarray(values, dtype=dtype).reshape(height + 2, width + 2)[1:-1, 1:-1].copy()
+
+
+def label_components(occupied: np.ndarray) -> np.ndarray:
+    """
+    Компоненты связности свободных ячеек (int32, -1 в препятствиях).
+    Без срезания углов диагональный шаг возможен только вместе с прямыми,
+    поэтому 8-связные пути совпадают с 4-связными.
+    """
+    height, width = occupied.shape
+    stride = width + 2
+    free = _padded_free(occupied)
+    labels = [-1] * len(free)
+    steps = (1, -1, stride, -stride)
+    current = 0
+    for seed in range(len(free)):
+        if not free[seed] or labels[seed] != -1:
+            continue
+        labels[seed] = current
+        queue = deque([seed])
+        while queue:
+            i = queue.popleft()
+            for step in steps:
+                j = i + step
+                if free[j] and labels[j] == -1:
+                    labels[j] = current
+                    queue.append(j)
+        current += 1
+    return _unpad(labels, height, width, np.int32)
+
+
+def grid_distances(occupied: np.ndarray, source: tuple) -> np.ndarray:
+    """
+    Кратчайшие расстояния от ячейки source до всех ячеек (Дейкстра по
+    8-связной сетке без срезания углов, как в JPS); inf — недостижимо.
+    """
+    height, width = occupied.shape
+    stride = width + 2
+    free = _padded_free(occupied)
+    dist = [math.inf] * len(free)
+    s = (source[0] + 1) * stride + source[1] + 1
+    if not free[s]:
+        raise ValueError(f"Ориентир {source} в препятствии")
+
+    straight = (1, -1, stride, -stride)
+    diagonal = ((1, stride), (1, -stride), (-1, stride), (-1, -stride))
+    dist[s] = 0.0
+    heap = [(0.0, s)]
+    while heap:
+        d, i = heapq.heappop(heap)
+        if d > dist[i]:
+            continue
+        for step in straight:
+            j = i + step
+            nd = d + 1.0
+            if free[j] and nd < dist[j]:
+                dist[j] = nd
+                heapq.heappush(heap, (nd, j))
+        for sc, sr in diagonal:
+            j = i + sc + sr
+            nd = d + SQRT2
+            if free[j] and free[i + sc] and free[i + sr] and nd < dist[j]:
+                dist[j] = nd
+                heapq.heappush(heap, (nd, j))
+    return _unpad(dist, height, width, np.float64)
+
+
+def select_landmarks(occupied: np.ndarray, labels: np.ndarray, count: int = LANDMARK_COUNT):
+    """
+    Ориентиры выбираются «самой дальней точкой»: каждый следующий —
+    свободная ячейка, дальше всего (по сетке) отстоящая от уже выбранных.
+    Первый — самая дальняя ячейка от центра крупнейшей компоненты.
+    Возвращает (ячейки (K, 2), таблицы расстояний (K, H, W) float32).
+    """
+    sizes = np.bincount(labels[labels >= 0])
+    if count <= 0 or sizes.size == 0:
+        return np.empty((0, 2), dtype=np.int32), np.empty((0,) + occupied.shape, dtype=np.float32)
+
+    allowed = np.isin(labels, np.flatnonzero(sizes >= LANDMARK_MIN_COMPONENT * sizes.sum()))
+    cells = np.argwhere(labels == int(np.argmax(sizes)))
+    centre = cells[np.argmin(((cells - cells.mean(axis=0)) ** 2).sum(axis=1))]
+    nearest = np.where(allowed, grid_distances(occupied, tuple(centre)), -np.inf)
+
+    landmarks: List[np.ndarray] = []
+    tables: List[np.ndarray] = []
+    for _ in range(count):
+        # Ячейки вне уже покрытых компонент (inf) выбираются в первую очередь
+        best = np.unravel_index(int(np.argmax(nearest)), nearest.shape)
+        if nearest[best] <= 0:
+            break
+        dist = grid_distances(occupied, best)
+        landmarks.append(np.asarray(best, dtype=np.int32))
+        tables.append(np.where(np.isfinite(dist), dist, 0.0).astype(np.float32))
+        nearest = np.where(allowed, np.minimum(nearest, dist), -np.inf)
+        nearest[best] = 0.0
+    return np.array(landmarks, dtype=np.int32).reshape(-1, 2), np.array(tables, dtype=np.float32)
+
+
+def preprocess_occupancy(occupied: np.ndarray, landmark_count: int = LANDMARK_COUNT) -> MapData:
+    """Полный расчёт данных карты (поле расстояний, компоненты, ориентиры)"""
+    labels = label_components(occupied)
+    landmarks, tables = select_landmarks(occupied, labels, landmark_count)
+    return MapData(distance_transform(occupied), labels, landmarks, tables)
+
+
+def sidecar_path(map_file: str) -> str:
+    """Путь файла с данными рядом с файлом карты"""
+    return os.path.splitext(map_file)[0] + SIDECAR_SUFFIX
+
+
+def save_map_data(path: str, occupied: np.ndarray, data: MapData):
+    """Сохраняет данные карты (атомарно: через временный файл)"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez_compressed(
+            f,
+            version=np.int32(FORMAT_VERSION),
+            digest=np.array(occupancy_digest(occupied)),
+            clearance=data.clearance,
+            labels=data.labels,
+            landmarks=data.landmarks,
+            tables=data.tables,
+        )
+    os.replace(tmp_path, path)
+
+
+def load_map_data(path: str, occupied: np.ndarray) -> Optional[MapData]:
+    """Данные карты из файла или None, если файла нет или он от другой версии карты"""
+    try:
+        with np.load(path) as npz:
+            if int(npz["version"]) != FORMAT_VERSION or str(npz["digest"]) != occupancy_digest(occupied):
+                logger.warning(f"Данные карты {path} устарели — пересчитайте их (python -m planner.preprocess)")
+                return None
+            return MapData(npz["clearance"], npz["labels"], npz["landmarks"], npz["tables"])
+    except FileNotFoundError:
+        return None
+    except (OSError, KeyError, ValueError) as e:
+        logger.warning(f"Не удалось прочитать данные карты {path}: {e}")
+        return None
+
+
+def get_map_data(grid) -> MapData:
+    """
+    Данные карты для сетки (один раз на сетку): из файла рядом с картой.
+    Файлы пишет только python -m planner.preprocess. Без файла для небольшой
+    карты в памяти считаются поле расстояний и компоненты, большая карта
+    идёт без них; поиск в обоих случаях — с октильной эвристикой.
+    """
+    if grid._map_data is None:
+        path = sidecar_path(grid.source_path) if grid.source_path else None
+        data = load_map_data(path, grid.occupied) if path else None
+        if data is None:
+            logger.warning(f"Карта {grid.map_id}: нет предрасчитанных данных, "
+                           f"запустите python -m planner.preprocess {grid.source_path or ''}")
+            if grid.occupied.size <= AUTO_PREPROCESS_CELLS:
+                data = MapData(distance_transform(grid.occupied), label_components(grid.occupied))
+            else:
+                data = MapData(None, None)
+        logger.info(f"Карта {grid.map_id}: ориентиров ALT — {data.landmark_count}")
+        grid._map_data = data
+    return grid._map_data
+
+
+def preprocess_file(map_file: str, landmark_count: int = LANDMARK_COUNT) -> str:
+    """Считает и сохраняет данные для файла карты; возвращает путь результата"""
+    from planner.grid import load_grid_from_file
+
+    grid = load_grid_from_file(0, map_file)
+    data = preprocess_occupancy(grid.occupied, landmark_count)
+    path = sidecar_path(map_file)
+    save_map_data(path, grid.occupied, data)
+    return path
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Предварительный расчёт данных карт для планировщика")
+    parser.add_argument("maps", nargs="+", help="PNG-файлы карт")
+    parser.add_argument("--landmarks", type=int, default=LANDMARK_COUNT, help="число ориентиров ALT")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    for map_file in args.maps:
+        path = preprocess_file(map_file, args.landmarks)
+        logger.info(f"{map_file} -> {path}")
+
+
+if __name__ == "__main__":
+    main()
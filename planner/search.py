@@ -0,0 +1,373 @@
+import heapq
+import math
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from planner.grid import OccupancyGrid
+from planner.preprocess import MapData, get_map_data
+
+SQRT2 = math.sqrt(2.0)
+OCTILE_K = SQRT2 - 1.0
+# Запас на погрешность float32 в таблицах ориентиров: оценка не должна
+# превышать истинное расстояние, иначе путь может оказаться не кратчайшим
+ALT_SLACK = 1e-3
+
+
+class SearchData:
+    """Плоское представление сетки для поиска.
+
+    Сетка дополнена рамкой из препятствий шириной в 1 ячейку, поэтому
+    проверки выхода за границы в горячем цикле не нужны. Для каждого из
+    четырёх прямых направлений заранее вычислена маска «стоп-ячеек»
+    (препятствие или вынужденный сосед), так что прыжок по прямой — это
+    один вызов bytes.find вместо цикла на Python. Маски для вертикальных
+    направлений хранятся в транспонированном (по столбцам) порядке.
+    Таблицы ориентиров ALT (если они посчитаны для карты) переложены
+    в тот же порядок ячеек: alt[i] — расстояния от всех ориентиров до ячейки i.
+    """
+
+    def __init__(self, grid: OccupancyGrid, map_data: MapData):
+        self.height = grid.height
+        self.width = grid.width
+        self.stride = grid.width + 2
+        self.col_stride = grid.height + 2
+        free = np.zeros((grid.height + 2, grid.width + 2), dtype=bool)
+        free[1:-1, 1:-1] = ~grid.occupied
+        self.free = bytearray(free.astype(np.uint8).tobytes())
+
+        up = np.zeros_like(free)
+        up[1:, :] = free[:-1, :]
+        down = np.zeros_like(free)
+        down[:-1, :] = free[1:, :]
+        left = np.zeros_like(free)
+        left[:, 1:] = free[:, :-1]
+        right = np.zeros_like(free)
+        right[:, :-1] = free[:, 1:]
+
+        def behind(a, dr, dc):
+            # Значение a в ячейке (row - dr, col - dc), за рамкой — False
+            out = np.zeros_like(a)
+            rs = slice(max(dr, 0), a.shape[0] + min(dr, 0))
+            cs = slice(max(dc, 0), a.shape[1] + min(dc, 0))
+            rd = slice(max(-dr, 0), a.shape[0] + min(-dr, 0))
+            cd = slice(max(-dc, 0), a.shape[1] + min(-dc, 0))
+            out[rs, cs] = a[rd, cd]
+            return out
+
+        forced_e = (up & ~behind(up, 0, 1)) | (down & ~behind(down, 0, 1))
+        forced_w = (up & ~behind(up, 0, -1)) | (down & ~behind(down, 0, -1))
+        forced_s = (left & ~behind(left, 1, 0)) | (right & ~behind(right, 1, 0))
+        forced_n = (left & ~behind(left, -1, 0)) | (right & ~behind(right, -1, 0))
+
+        def pack(stop, transpose=False):
+            if transpose:
+                stop = stop.T
+            return np.ascontiguousarray(stop, dtype=np.uint8).tobytes()
+
+        self.stop_e = pack(~free | forced_e)
+        self.stop_w = pack(~free | forced_w)
+        self.stop_s = pack(~free | forced_s, transpose=True)
+        self.stop_n = pack(~free | forced_n, transpose=True)
+
+        self.map_data = map_data
+        self.alt = None
+        if map_data.landmark_count:
+            alt = np.zeros((grid.height + 2, grid.width + 2, map_data.landmark_count))
+            alt[1:-1, 1:-1] = np.moveaxis(map_data.tables, 0, -1)
+            self.alt = alt.reshape(-1, map_data.landmark_count)
+
+    def index(self, row: int, col: int) -> int:
+        return (row + 1) * self.stride + (col + 1)
+
+    def cell(self, i: int) -> Tuple[int, int]:
+        r, c = divmod(i, self.stride)
+        return r - 1, c - 1
+
+
+def get_search_data(grid: OccupancyGrid) -> SearchData:
+    """Данные поиска строятся один раз на сетку"""
+    if grid._search_data is None:
+        grid._search_data = SearchData(grid, get_map_data(grid))
+    return grid._search_data
+
+
+def octile(dr: int, dc: int) -> float:
+    """Октильное расстояние (8-связная сетка)"""
+    if dr < 0:
+        dr = -dr
+    if dc < 0:
+        dc = -dc
+    if dr > dc:
+        return dr + OCTILE_K * dc
+    return dc + OCTILE_K * dr
+
+
+def _jump_straight(data: SearchData, i: int, step: int, goal: int) -> int:
+    """Прыжок по прямой из ячейки i с шагом step (±1 или ±stride)"""
+    stride = data.stride
+    if step == 1 or step == -1:
+        row_start = i - i % stride
+        if step == 1:
+            k = data.stop_e.find(1, i + 1)
+            hit_goal = row_start <= goal and i < goal <= k
+        else:
+            k = data.stop_w.rfind(1, row_start, i)
+            hit_goal = goal < row_start + stride and k <= goal < i
+    else:
+        # Вертикаль: поиск по маскам в порядке «по столбцам»
+        col_stride = data.col_stride
+        r, c = divmod(i, stride)
+        it = c * col_stride + r
+        if step > 0:
+            kt = data.stop_s.find(1, it + 1)
+        else:
+            kt = data.stop_n.rfind(1, c * col_stride, it)
+        k = (kt % col_stride) * stride + c
+        gr, gc = divmod(goal, stride)
+        hit_goal = gc == c and (r < gr <= kt % col_stride if step > 0 else kt % col_stride <= gr < r)
+    if hit_goal:
+        return goal
+    if data.free[k]:
+        return k
+    return -1
+
+
+def _jump_diagonal(data: SearchData, i: int, step_c: int, step_r: int, goal: int) -> int:
+    """Прыжок по диагонали (без срезания углов препятствий)"""
+    free = data.free
+    step = step_c + step_r
+    while True:
+        i += step
+        if not free[i]:
+            return -1
+        if i == goal:
+            return i
+        if _jump_straight(data, i, step_c, goal) != -1 or \
+                _jump_straight(data, i, step_r, goal) != -1:
+            return i
+        if not (free[i + step_c] and free[i + step_r]):
+            return -1
+
+
+def _jump(data: SearchData, i: int, step_c: int, step_r: int, goal: int) -> int:
+    if step_c and step_r:
+        return _jump_diagonal(data, i, step_c, step_r, goal)
+    return _jump_straight(data, i, step_c or step_r, goal)
+
+
+def _neighbors(free: bytearray, i: int, dc: int, dr: int, stride: int) -> List[Tuple[int, int]]:
+    """Направления (step_c, step_r) после отсечения симметричных путей JPS"""
+    dirs = []
+    if dc == 0 and dr == 0:
+        # Стартовая вершина: все 8 направлений без срезания углов
+        for sc in (-1, 0, 1):
+            for sr in (-stride, 0, stride):
+                if sc == 0 and sr == 0:
+                    continue
+                if not free[i + sc + sr]:
+                    continue
+                if sc and sr and not (free[i + sc] and free[i + sr]):
+                    continue
+                dirs.append((sc, sr))
+        return dirs
+
+    sc = dc
+    sr = dr * stride
+    if sc and sr:
+        open_r = free[i + sr]
+        open_c = free[i + sc]
+        if open_r:
+            dirs.append((0, sr))
+        if open_c:
+            dirs.append((sc, 0))
+        if open_r and open_c and free[i + sc + sr]:
+            dirs.append((sc, sr))
+    elif sc:
+        next_free = free[i + sc]
+        up = free[i - stride]
+        down = free[i + stride]
+        if next_free:
+            dirs.append((sc, 0))
+            if up and free[i + sc - stride]:
+                dirs.append((sc, -stride))
+            if down and free[i + sc + stride]:
+                dirs.append((sc, stride))
+        if up:
+            dirs.append((0, -stride))
+        if down:
+            dirs.append((0, stride))
+    else:
+        next_free = free[i + sr]
+        left = free[i - 1]
+        right = free[i + 1]
+        if next_free:
+            dirs.append((0, sr))
+            if left and free[i - 1 + sr]:
+                dirs.append((-1, sr))
+            if right and free[i + 1 + sr]:
+                dirs.append((1, sr))
+        if left:
+            dirs.append((-1, 0))
+        if right:
+            dirs.append((1, 0))
+    return dirs
+
+
+def _sign(v: int) -> int:
+    return (v > 0) - (v < 0)
+
+
+def jps(grid: OccupancyGrid, start: Tuple[int, int], goal: Tuple[int, int]) -> Optional[List[Tuple[int, int]]]:
+    """Jump Point Search.
+
+    Эвристика — максимум из октильного расстояния и оценки ALT по
+    ориентирам карты (обе согласованы, поэтому путь остаётся кратчайшим).
+    Цель в другой компоненте связности отбрасывается без поиска.
+    Возвращает список опорных ячеек (row, col) от старта до цели
+    или None, если путь не существует.
+    """
+    data = get_search_data(grid)
+    free = data.free
+    stride = data.stride
+
+    s = data.index(*start)
+    t = data.index(*goal)
+    if not free[s] or not free[t]:
+        return None
+    if s == t:
+        return [start]
+    if not data.map_data.connected(start, goal):
+        return None
+
+    tr, tc = divmod(t, stride)
+    alt = data.alt
+    alt_goal = alt[t] if alt is not None else None
+
+    def heuristic(j: int, jr: int, jc: int) -> float:
+        h = octile(jr - tr, jc - tc)
+        if alt is not None:
+            h = max(h, float(np.abs(alt[j] - alt_goal).max()) - ALT_SLACK)
+        return h
+
+    g = {s: 0.0}
+    parent = {s: -1}
+    closed = set()
+    sr0, sc0 = divmod(s, stride)
+    open_heap = [(heuristic(s, sr0, sc0), 0.0, s)]
+
+    while open_heap:
+        _, gi, i = heapq.heappop(open_heap)
+        if i in closed:
+            continue
+        if i == t:
+            break
+        closed.add(i)
+
+        ir, ic = divmod(i, stride)
+        p = parent[i]
+        if p == -1:
+            dc = dr = 0
+        else:
+            pr, pc = divmod(p, stride)
+            dc = _sign(ic - pc)
+            dr = _sign(ir - pr)
+
+        for step_c, step_r in _neighbors(free, i, dc, dr, stride):
+            j = _jump(data, i, step_c, step_r, t)
+            if j == -1 or j in closed:
+                continue
+            jr, jc = divmod(j, stride)
+            gj = gi + octile(jr - ir, jc - ic)
+            if gj < g.get(j, math.inf):
+                g[j] = gj
+                parent[j] = i
+                heapq.heappush(open_heap, (gj + heuristic(j, jr, jc), gj, j))
+    else:
+        return None
+
+    if t not in parent:
+        return None
+
+    path = []
+    i = t
+    while i != -1:
+        path.append(data.cell(i))
+        i = parent[i]
+    path.reverse()
+    return path
+
+
+def expand_path(jump_points: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Разворачивает опорные точки JPS в последовательность соседних ячеек"""
+    if not jump_points:
+        return []
+    cells = [jump_points[0]]
+    for (r0, c0), (r1, c1) in zip(jump_points, jump_points[1:]):
+        dr = _sign(r1 - r0)
+        dc = _sign(c1 - c0)
+        r, c = r0, c0
+        while (r, c) != (r1, c1):
+            # Отрезок JPS: сначала диагональ, затем прямая
+            if r != r1 and c != c1:
+                r += dr
+                c += dc
+            elif r != r1:
+                r += dr
+            else:
+                c += dc
+            cells.append((r, c))
+    return cells
+
+
+def path_length(cells: List[Tuple[int, int]]) -> float:
+    """Длина пути по ячейкам (в ячейках)"""
+    return sum(octile(r1 - r0, c1 - c0) for (r0, c0), (r1, c1) in zip(cells, cells[1:]))
+
+
+def find_path(grid: OccupancyGrid, start_x: float, start_y: float, end_x: float, end_y: float,
+              snap_radius: int = 8) -> List[Tuple[float, float]]:
+    """Путь в мировых координатах: опорные точки JPS, концы — точные старт и цель.
+
+    Старт и цель, попавшие в препятствие, притягиваются к центру ближайшей
+    свободной ячейки в радиусе snap_radius. Если путь не существует,
+    бросает ValueError.
+    """
+    start_cell = grid.world_to_cell(start_x, start_y)
+    start = grid.nearest_free(*start_cell, max_radius=snap_radius)
+    if start is None:
+        raise ValueError(f"Старт ({start_x}, {start_y}) внутри препятствия или вне карты")
+    if start != start_cell:
+        start_x, start_y = grid.cell_to_world(*start)
+
+    goal_cell = grid.world_to_cell(end_x, end_y)
+    goal = grid.nearest_free(*goal_cell, max_radius=snap_radius)
+    if goal is None:
+        raise ValueError(f"Цель ({end_x}, {end_y}) внутри препятствия или вне карты")
+    if goal != goal_cell:
+        end_x, end_y = grid.cell_to_world(*goal)
+
+    cells = jps(grid, start, goal)
+    if cells is None:
+        raise ValueError(f"Путь из ({start_x}, {start_y}) в ({end_x}, {end_y}) не найден")
+
+    waypoints = [(float(start_x), float(start_y))]
+    waypoints.extend(grid.cell_to_world(r, c) for r, c in cells[1:-1])
+    waypoints.append((float(end_x), float(end_y)))
+    return waypoints
+
+
+def resample_polyline(waypoints: List[Tuple[float, float]], step: float) -> np.ndarray:
+    """Равномерная передискретизация ломаной с шагом step; возвращает массив (N, 2)"""
+    pts = np.asarray(waypoints, dtype=np.float64)
+    if len(pts) < 2:
+        return pts.reshape(-1, 2)
+
+    seg = np.hypot(*np.diff(pts, axis=0).T)
+    s = np.concatenate(([0.0], np.cumsum(seg)))
+    if s[-1] <= 0.0:
+        return pts[[0, -1]]
+
+    n = max(int(np.ceil(s[-1] / step)), 1)
+    si = np.linspace(0.0, s[-1], n + 1)
+    return np.column_stack((np.interp(si, s, pts[:, 0]), np.interp(si, s, pts[:, 1])))
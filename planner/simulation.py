@@ -0,0 +1,283 @@
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from planner.ocp import VehicleParams
+
+# Шаг симуляции по умолчанию, с (20 Гц)
+SIM_DT = 0.05
+# Скорость по траектории без поля v (старый формат x, y), м/с
+NOMINAL_SPEED = 1.0
+# Сколько ждать прибытия в конечную точку после планового времени, с
+SETTLE_TIME = 2.0
+# Коэффициент подтягивания скорости к опорной точке, 1/с
+K_ALONG = 1.0
+# Минимальная дальность упреждения регулятора, м
+MIN_LOOKAHEAD = 0.5
+
+
+def plan_times(points: np.ndarray, nominal_speed: float = NOMINAL_SPEED) -> np.ndarray:
+    """
+    Плановое время прохождения точек траектории от её начала, с.
+    Отрезок проходится со средней из скоростей v на его концах (при
+    равноускоренном движении это точное время); без поля v или при
+    нулевой скорости — с nominal_speed
+    """
+    if 'v' in (points.dtype.names or ()):
+        v = np.nan_to_num(points['v'].astype(np.float64))
+    else:
+        v = np.zeros(len(points))
+    return _cumulative_times(points['x'], points['y'], v, nominal_speed)
+
+
+def _cumulative_times(x: np.ndarray, y: np.ndarray, v: np.ndarray,
+                      nominal_speed: float = NOMINAL_SPEED) -> np.ndarray:
+    lengths = np.hypot(np.diff(x), np.diff(y))
+    mean_v = 0.5 * (np.abs(v[:-1]) + np.abs(v[1:]))
+    mean_v = np.where(mean_v > 1e-3, mean_v, nominal_speed)
+    return np.concatenate(([0.0], np.cumsum(lengths / mean_v)))
+
+
+def _point_columns(points: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Столбцы x, y, v, de точек (без v — NOMINAL_SPEED, без de — 0)"""
+    names = points.dtype.names or ()
+    x = points['x'].astype(np.float64)
+    y = points['y'].astype(np.float64)
+    v = np.nan_to_num(points['v'].astype(np.float64)) if 'v' in names else np.full(len(x), NOMINAL_SPEED)
+    de = np.nan_to_num(points['de'].astype(np.float64)) if 'de' in names else np.zeros(len(x))
+    return x, y, v, de
+
+
+class FleetSimulation:
+    """
+    Кинематическая симуляция всех движущихся роботов с фиксированным шагом dt.
+    Состояние роботов (x, y, курс th, скорость v) лежит в массивах NumPy,
+    точки всех траекторий — в общих массивах, и один вызов step() продвигает
+    весь парк без циклов по роботам. Опорная точка каждого робота
+    интерполируется по траектории во времени с плановой скоростью; робот
+    догоняет её по модели велосипеда (база WHEELBASE, угол колёс не больше
+    DE_MAX): подруливание на опорную точку с упреждением поверх угла de
+    из траектории. Робот прибывает, когда плановое время вышло и он в
+    пределах GOAL_TOL от конца (или прошло SETTLE_TIME), — его позиция
+    становится последней точкой траектории. Траекторию можно передавать
+    частями: add(..., final=False), затем extend() — пока она не закрыта,
+    робот ждёт продолжения в последней полученной точке и не прибывает.
+    """
+
+    _STATE = ("x", "y", "th", "v", "t")
+    _POINTS = ("times", "px", "py", "pv", "pde")
+
+    def __init__(self, dt: float = SIM_DT, params=VehicleParams, capacity: int = 64):
+        self.dt = dt
+        self.params = params
+        self.time = 0.0
+        self._slots: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._capacity = 0
+        self._allocate(capacity)
+        # Точки траекторий: [start, start + n) — отрезок робота в слоте
+        for name in self._POINTS:
+            setattr(self, "_" + name, np.zeros(capacity * 16))
+        self._used = 0
+
+    def _allocate(self, capacity: int):
+        old = self._capacity
+        for name, dtype in [(name, np.float64) for name in self._STATE] + \
+                [("ids", np.int64), ("start", np.int64), ("n", np.int64), ("k", np.int64),
+                 ("active", bool), ("open", bool)]:
+            array = np.zeros(capacity, dtype=dtype)
+            if old:
+                array[:old] = getattr(self, "_" + name)
+            setattr(self, "_" + name, array)
+        self._free.extend(range(capacity - 1, old - 1, -1))
+        self._capacity = capacity
+
+    def _reserve(self, count: int):
+        """Место под count точек: траектории прибывших роботов выбрасываются, массивы растут"""
+        size = len(self._times)
+        if self._used + count <= size:
+            return
+        slots = np.flatnonzero(self._active)
+        lengths = self._n[slots]
+        live = int(lengths.sum())
+        size = max(size, 2 * (live + count))
+        offsets = np.cumsum(lengths) - lengths
+        # Индексы живых точек в старых массивах
+        index = np.repeat(self._start[slots] - offsets, lengths) + np.arange(live)
+        for name in self._POINTS:
+            array = np.zeros(size)
+            array[:live] = getattr(self, "_" + name)[index]
+            setattr(self, "_" + name, array)
+        self._start[slots] = offsets
+        self._used = live
+
+    def add(self, robot_id: int, points: np.ndarray, final: bool = True) -> float:
+        """
+        Начинает движение робота по траектории (поля x, y и, если есть, v, th, de);
+        final=False — продолжение придёт через extend(). Плановое время, с
+        """
+        if robot_id in self._slots:
+            self.remove(robot_id)
+        if not self._free:
+            self._allocate(self._capacity * 2)
+        names = points.dtype.names or ()
+        times = plan_times(points)
+        x, y, v, de = _point_columns(points)
+        if len(x) == 1:
+            # Одна точка: «отрезок» нулевой длины
+            times, x, y, v, de = (np.repeat(a, 2) for a in (times, x, y, v, de))
+        if 'th' in names and not np.isnan(points['th'][0]):
+            th = float(points['th'][0])
+        else:
+            th = float(np.arctan2(y[1] - y[0], x[1] - x[0]))
+
+        n = len(x)
+        self._reserve(n)
+        start = self._used
+        for name, values in zip(self._POINTS, (times, x, y, v, de)):
+            getattr(self, "_" + name)[start:start + n] = values
+        self._used += n
+
+        slot = self._free.pop()
+        self._slots[robot_id] = slot
+        self._ids[slot] = robot_id
+        self._active[slot] = True
+        self._open[slot] = not final
+        self._x[slot], self._y[slot], self._th[slot], self._v[slot] = x[0], y[0], th, 0.0
+        self._t[slot] = 0.0
+        self._start[slot], self._n[slot], self._k[slot] = start, n, 0
+        return float(times[-1])
+
+    def extend(self, robot_id: int, points: np.ndarray, final: bool = False) -> float:
+        """
+        Добавляет точки в конец траектории робота. Если робот уже ждёт
+        в последней точке, продолжение планируется от текущего момента.
+        Возвращает плановое время всей траектории, с
+        """
+        slot = self._slots[robot_id]
+        self._open[slot] = not final
+        if not len(points):
+            return float(self._times[self._start[slot] + self._n[slot] - 1])
+        start, n = int(self._start[slot]), int(self._n[slot])
+        last = start + n - 1
+        x, y, v, de = _point_columns(points)
+        # Последняя точка — начало первого нового отрезка. Если робот уже ждёт
+        # в ней, к траектории добавляется остановка в этой точке до текущего
+        # момента, и новый отрезок начинается с нулевой скорости
+        waiting = self._t[slot] > self._times[last]
+        x = np.concatenate(([self._px[last]], x))
+        y = np.concatenate(([self._py[last]], y))
+        v = np.concatenate(([0.0 if waiting else self._pv[last]], v))
+        de = np.concatenate(([self._pde[last]], de))
+        times = _cumulative_times(x, y, v) + max(self._times[last], self._t[slot])
+        if not waiting:
+            times, x, y, v, de = times[1:], x[1:], y[1:], v[1:], de[1:]
+
+        count = len(x)
+        if start + n != self._used or self._used + count > len(self._times):
+            # Отрезок робота не в конце общих массивов: переносим его туда
+            self._reserve(n + count)
+            start = int(self._start[slot])
+            for name in self._POINTS:
+                array = getattr(self, "_" + name)
+                array[self._used:self._used + n] = array[start:start + n]
+            start = self._start[slot] = self._used
+            self._used += n
+        end = start + n
+        for name, values in zip(self._POINTS, (times, x, y, v, de)):
+            getattr(self, "_" + name)[end:end + count] = values
+        self._used += count
+        self._n[slot] = n + count
+        return float(times[-1])
+
+    def finish(self, robot_id: int):
+        """Траектория робота получена целиком: по её концу робот прибывает"""
+        slot = self._slots.get(robot_id)
+        if slot is not None:
+            self._open[slot] = False
+
+    def remove(self, robot_id: int):
+        slot = self._slots.pop(robot_id, None)
+        if slot is None:
+            return
+        self._active[slot] = False
+        self._open[slot] = False
+        self._v[slot] = 0.0
+        self._free.append(slot)
+
+    def step(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[int]]:
+        """
+        Шаг dt для всех роботов. Возвращает (id, x, y) движущихся роботов
+        после шага и список id прибывших (они уже удалены из симуляции)
+        """
+        p, dt = self.params, self.dt
+        self.time += dt
+        slots = np.flatnonzero(self._active)
+        t = self._t[slots] + dt
+        self._t[slots] = t
+
+        # Текущий отрезок траектории: [start + k, start + k + 1]
+        start, last, k = self._start[slots], self._n[slots] - 2, self._k[slots]
+        times = self._times
+        while True:
+            late = (t > times[start + k + 1]) & (k < last)
+            if not late.any():
+                break
+            k = k + late
+        self._k[slots] = k
+        i0 = start + k
+        i1 = i0 + 1
+
+        # Опорная точка траектории в момент t
+        t0, t1 = times[i0], times[i1]
+        span = t1 - t0
+        frac = np.clip((t - t0) / np.where(span > 1e-9, span, 1.0), 0.0, 1.0)
+        x1, y1 = self._px[i1], self._py[i1]
+        xr = self._px[i0] + (x1 - self._px[i0]) * frac
+        yr = self._py[i0] + (y1 - self._py[i0]) * frac
+        vr = self._pv[i0] + (self._pv[i1] - self._pv[i0]) * frac
+        dr = self._pde[i0] + (self._pde[i1] - self._pde[i0]) * frac
+        # Продолжение траектории ещё не пришло: стоим в её последней точке
+        vr = np.where(self._open[slots] & (k == last) & (t >= t1), 0.0, vr)
+
+        # Ошибка положения в системе координат робота
+        x, y, th = self._x[slots], self._y[slots], self._th[slots]
+        cos_th, sin_th = np.cos(th), np.sin(th)
+        dx, dy = xr - x, yr - y
+        along = dx * cos_th + dy * sin_th
+        cross = -dx * sin_th + dy * cos_th
+        lookahead = np.maximum(np.hypot(dx, dy), MIN_LOOKAHEAD)
+
+        v = np.clip(np.abs(vr) + K_ALONG * along, 0.0, p.V_MAX * 1.5)
+        kappa = np.tan(dr) / p.WHEELBASE + 2.0 * cross / lookahead ** 2
+        de = np.clip(np.arctan(p.WHEELBASE * kappa), -p.DE_MAX, p.DE_MAX)
+
+        # Кинематическая модель велосипеда
+        x = x + v * cos_th * dt
+        y = y + v * sin_th * dt
+        self._th[slots] = th + v / p.WHEELBASE * np.tan(de) * dt
+        self._v[slots] = v
+
+        # Прибытие: траектория закрыта, плановое время вышло и робот у её конца
+        # (или вышел запас времени)
+        near = np.hypot(x1 - x, y1 - y) < p.GOAL_TOL
+        arrived = (k == last) & (t >= t1) & (near | (t >= t1 + SETTLE_TIME)) & ~self._open[slots]
+        x = np.where(arrived, x1, x)
+        y = np.where(arrived, y1, y)
+        self._x[slots], self._y[slots] = x, y
+
+        ids = self._ids[slots]
+        finished = ids[arrived].tolist()
+        for robot_id in finished:
+            self.remove(robot_id)
+        return ids, x, y, finished
+
+    def position(self, robot_id: int) -> Tuple[float, float]:
+        slot = self._slots[robot_id]
+        return float(self._x[slot]), float(self._y[slot])
+
+    def __contains__(self, robot_id: int) -> bool:
+        return robot_id in self._slots
+
+    def __len__(self) -> int:
+        return len(self._slots)
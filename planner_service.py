@@ -1,13 +1,28 @@
 import time
+import argparse
+import threading
 import requests
 import json
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 import logging
+from concurrent.futures import Executor, ProcessPoolExecutor
 from datetime import datetime
 
+import numpy as np
+
+from planner import OccupancyGrid, TrajectoryCache, get_grid, find_path
+from planner.ocp import optimize_batch, solution_to_points
+from planner.codec import MEDIA_TYPE, encode_trajectory
+
 # Настройки
 API_BASE_URL = "http://192.168.56.104/api"
-POLL_INTERVAL = 2  # секунды
+POLL_INTERVAL = 2  # секунды (пауза, если лента событий недоступна)
+LONG_POLL_TIMEOUT = 25  # сколько ждать события в одном long-poll запросе, секунды
+PLANNER_WORKERS = 1  # число процессов планирования (1 — считать в основном процессе)
+CLAIM_BATCH = 64  # сколько заявок забирать за один запрос
+CACHE_SIZE = 4096  # максимум траекторий в кэше
+CACHE_TTL = 3600  # время жизни траектории в кэше, секунды
+CACHE_QUANTUM = 0.5  # шаг квантования старта и цели в ключе кэша, метры
 
 # Настройка логирования
 logging.basicConfig(
@@ -16,37 +31,80 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Заглушка для функции расчета пути (замени на свою)
-def get_path(start_x: float, start_y: float, end_x: float, end_y: float) -> List[Dict[str, float]]:
+# Кэш траекторий: одинаковые маршруты (с точностью до CACHE_QUANTUM) не пересчитываются
+trajectory_cache = TrajectoryCache(max_size=CACHE_SIZE, ttl=CACHE_TTL, quantum=CACHE_QUANTUM)
+
+# Задача планирования: (start_x, start_y, end_x, end_y, сетка карты или None)
+PlanTask = Tuple[float, float, float, float, Optional[OccupancyGrid]]
+
+def reference_path(start_x: float, start_y: float, end_x: float, end_y: float,
+                   grid: Optional[OccupancyGrid] = None) -> List[Tuple[float, float]]:
     """
-    Генерирует простую траекторию от старта до цели.
-    В реальности здесь будет вызов твоего алгоритма планирования.
+    Опорный путь по сетке занятости карты робота (JPS).
+    Без карты (у робота она не назначена) — прямой отрезок.
     """
-    logger.info(f"Расчёт пути из ({start_x}, {start_y}) в ({end_x}, {end_y})")
-    
-    # Простая линейная интерполяция (10 точек)
-    points = []
-    num_points = 10
-    
-    for i in range(num_points + 1):
-        t = i / num_points
-        x = start_x + (end_x - start_x) * t
-        y = start_y + (end_y - start_y) * t
-        
-        # Добавляем параметры для робота (v, th, de, a, w можно настроить)
-        point = {
-            "x": round(x, 2),
-            "y": round(y, 2),
-            "v": 1.0,  # скорость
-            "th": 0.0,  # угол
-            "de": 0.0,  # угол поворота колес
-            "a": 0.0,   # ускорение
-            "w": 0.0    # угловая скорость
-        }
-        points.append(point)
-    
-    logger.info(f"Сгенерировано {len(points)} точек траектории")
-    return points
+    if grid is not None:
+        return find_path(grid, start_x, start_y, end_x, end_y)
+    logger.warning("Карта не задана, строим путь без учёта препятствий")
+    return [(start_x, start_y), (end_x, end_y)]
+
+def get_paths(tasks: List[PlanTask]) -> List[Optional[np.ndarray]]:
+    """
+    Пакетный расчёт траекторий: опорные пути JPS, затем одна векторная
+    оптимизация модели велосипеда для всех заявок сразу.
+    Возвращает массивы состояний (T, 7) в порядке задач; None — путь не найден.
+    """
+    results: List[Optional[np.ndarray]] = [None] * len(tasks)
+    references, grids, slots = [], [], []
+
+    for i, (start_x, start_y, end_x, end_y, grid) in enumerate(tasks):
+        logger.info(f"Расчёт пути из ({start_x}, {start_y}) в ({end_x}, {end_y})")
+        try:
+            references.append(reference_path(start_x, start_y, end_x, end_y, grid))
+            grids.append(grid)
+            slots.append(i)
+        except ValueError as e:
+            logger.error(str(e))
+
+    for i, solution in zip(slots, optimize_batch(references, grids)):
+        if not solution.feasible:
+            logger.error(f"Не найдена допустимая траектория для задачи {i}")
+            continue
+        results[i] = solution.states
+        logger.info(f"Сгенерировано {len(solution.states)} точек траектории")
+
+    return results
+
+def get_paths_parallel(tasks: List[PlanTask], pool: Optional[Executor] = None,
+                       workers: int = 1) -> List[Optional[np.ndarray]]:
+    """
+    Делит задачи на пачки по числу процессов и считает их в пуле.
+    Каждая пачка решается одной векторной оптимизацией; порядок результатов
+    совпадает с порядком задач.
+    """
+    if pool is None or workers <= 1 or len(tasks) <= 1:
+        return get_paths(tasks)
+
+    n_chunks = min(workers, len(tasks))
+    size, extra = divmod(len(tasks), n_chunks)
+    chunks, start = [], 0
+    for i in range(n_chunks):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append(tasks[start:end])
+        start = end
+
+    results: List[Optional[np.ndarray]] = []
+    for chunk_result in pool.map(get_paths, chunks):
+        results.extend(chunk_result)
+    return results
+
+def get_path(start_x: float, start_y: float, end_x: float, end_y: float,
+             grid: Optional[OccupancyGrid] = None) -> List[Dict[str, float]]:
+    """Траектория для одной заявки в виде списка точек (x, y, v, th, de, a, w)"""
+    states = get_paths([(start_x, start_y, end_x, end_y, grid)])[0]
+    if states is None:
+        raise ValueError(f"Не удалось построить траекторию из ({start_x}, {start_y}) в ({end_x}, {end_y})")
+    return solution_to_points(states)
 
 def points_to_path_string(points: List[Dict[str, float]]) -> str:
     """Преобразует список точек в строку формата API"""
@@ -57,18 +115,40 @@ def points_to_path_string(points: List[Dict[str, float]]) -> str:
     
     return ";".join(path_parts)
 
-def get_pending_requests() -> List[Dict]:
-    """Получает список PENDING заявок"""
+def claim_pending_requests(limit: int = CLAIM_BATCH) -> List[Dict]:
+    """
+    Забирает самые старые PENDING заявки (сервер атомарно переводит их в PLANNING).
+    Вместе с заявкой приходят позиция робота и его карта.
+    """
     try:
-        response = requests.get(f"{API_BASE_URL}/requests/")
+        response = requests.post(f"{API_BASE_URL}/requests/claim", params={"limit": limit})
         if response.status_code == 200:
-            all_requests = response.json()
-            pending_requests = [r for r in all_requests if r.get("status") == "PENDING"]
-            return pending_requests
+            return response.json()
+        logger.error(f"Ошибка получения заявок: {response.status_code} - {response.text}")
     except Exception as e:
         logger.error(f"Ошибка получения заявок: {e}")
     return []
 
+def wait_for_events(after: Optional[int], statuses: Optional[List[str]] = None,
+                    timeout: float = LONG_POLL_TIMEOUT) -> Optional[Dict]:
+    """
+    Long-poll ленты статусов заявок: ждёт событий после курсора after.
+    Без after сразу возвращает текущий курсор. None — лента недоступна.
+    """
+    params = {"timeout": timeout}
+    if after is not None:
+        params["after"] = after
+    if statuses:
+        params["status"] = statuses
+    try:
+        response = requests.get(f"{API_BASE_URL}/requests/events", params=params, timeout=timeout + 10)
+        if response.status_code == 200:
+            return response.json()
+        logger.error(f"Ошибка ленты событий: {response.status_code} - {response.text}")
+    except Exception as e:
+        logger.error(f"Ошибка ленты событий: {e}")
+    return None
+
 def get_robot_position(robot_id: int) -> Tuple[float, float]:
     """Получает текущую позицию робота"""
     try:
@@ -82,31 +162,90 @@ def get_robot_position(robot_id: int) -> Tuple[float, float]:
         logger.error(f"Ошибка получения позиции робота {robot_id}: {e}")
     return 0.0, 0.0
 
-def update_request_status(request_id: int, status: str) -> bool:
-    """Обновляет статус заявки"""
+def get_robot_map(robot_id: int) -> Optional[Dict]:
+    """Получает описание карты робота (None, если карта не назначена)"""
+    response = requests.get(f"{API_BASE_URL}/robots/{robot_id}/map")
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json()
+
+def get_robot_grid(robot_id: int, map_id: Optional[int] = None,
+                   file_path: Optional[str] = None) -> Optional[OccupancyGrid]:
+    """
+    Сетка занятости карты робота; PNG декодируется один раз и кэшируется
+    (карта без локального файла перепроверяется в API по ETag).
+    Если карта уже известна (пришла вместе с заявкой), API не опрашивается.
+    """
+    if map_id is None:
+        map_info = get_robot_map(robot_id)
+        if map_info is None:
+            return None
+        map_id, file_path = map_info["id"], map_info.get("file_path")
+
+    def fetch_image(etag: Optional[str] = None) -> Tuple[Optional[bytes], Optional[str]]:
+        # Карта уже загружена — API ответит 304, если файл не менялся
+        headers = {"If-None-Match": etag} if etag else {}
+        response = requests.get(f"{API_BASE_URL}/robots/{robot_id}/map/image", headers=headers)
+        if response.status_code == 304:
+            return None, etag
+        response.raise_for_status()
+        return response.content, response.headers.get("ETag")
+
+    return get_grid(map_id, file_path, fetch_image)
+
+def update_request_status(request_id: int, status: str, expected: str = "PLANNING") -> bool:
+    """
+    Обновляет статус заявки, только если она ещё в состоянии expected:
+    заявку, которую отменили или после истечения аренды спланировал
+    другой планировщик, не трогаем
+    """
     try:
         response = requests.patch(
-            f"{API_BASE_URL}/requests/{request_id}/status?status={status}"
+            f"{API_BASE_URL}/requests/{request_id}/status",
+            params={"status": status, "expected": expected}
         )
         return response.status_code == 200
     except Exception as e:
         logger.error(f"Ошибка обновления статуса заявки {request_id}: {e}")
         return False
 
-def create_trajectory(request_id: int, path_data: str) -> bool:
-    """Создает запись траектории"""
+def _route_missing(response: requests.Response) -> bool:
+    """
+    404 самого маршрута, а не объекта: ответ FastAPI {"detail": "Not Found"}
+    или не-JSON страница прокси (например, nginx)
+    """
+    if response.status_code != 404:
+        return False
+    if not response.headers.get("content-type", "").startswith("application/json"):
+        return True
+    try:
+        body = response.json()
+    except ValueError:
+        return True
+    return isinstance(body, dict) and body.get("detail") == "Not Found"
+
+def create_trajectory(request_id: int, states: np.ndarray) -> bool:
+    """
+    Создает запись траектории в двоичном формате (столбцы float32).
+    Если API его не поддерживает, отправляет строку старого формата.
+    """
     try:
-        trajectory_data = {
-            "request_id": request_id,
-            "path_data": path_data
-        }
-        
         response = requests.post(
-            f"{API_BASE_URL}/trajectories/",
-            json=trajectory_data
+            f"{API_BASE_URL}/trajectories/binary",
+            params={"request_id": request_id},
+            data=encode_trajectory(states),
+            headers={"Content-Type": MEDIA_TYPE}
         )
         
-        if response.status_code == 200:
+        if _route_missing(response):
+            # Старая версия API: двоичного эндпоинта нет
+            response = requests.post(
+                f"{API_BASE_URL}/trajectories/",
+                json={"request_id": request_id, "path_data": points_to_path_string(solution_to_points(states))}
+            )
+        
+        if response.status_code in (200, 201):
             logger.info(f"Траектория создана для заявки {request_id}")
             return True
         else:
@@ -118,68 +257,114 @@ def create_trajectory(request_id: int, path_data: str) -> bool:
         return False
 
 def process_request(request: Dict):
-    """Обрабатывает одну PENDING заявку"""
-    request_id = request.get("id")
-    robot_id = request.get("robot_id")
-    target_x = request.get("target_x")
-    target_y = request.get("target_y")
-    
-    logger.info(f"Обработка заявки {request_id}: робот {robot_id} -> ({target_x}, {target_y})")
-    
-    # 1. Меняем статус на PLANNING
-    if not update_request_status(request_id, "PLANNING"):
-        logger.error(f"Не удалось обновить статус заявки {request_id}")
+    """Обрабатывает одну заявку, уже выданную планировщику (PLANNING)"""
+    process_requests([request])
+
+def process_requests(claimed: List[Dict], pool: Optional[Executor] = None, workers: int = 1):
+    """
+    Обрабатывает пачку заявок, полученных через /requests/claim (уже в PLANNING):
+    траектории считаются пакетами (в пуле процессов, если он задан),
+    а результаты отправляются в API по порядку.
+    """
+    planned = []  # (request_id, задача)
+
+    for request in claimed:
+        request_id = request.get("id")
+        robot_id = request.get("robot_id")
+        target_x = request.get("target_x")
+        target_y = request.get("target_y")
+
+        logger.info(f"Обработка заявки {request_id}: робот {robot_id} -> ({target_x}, {target_y})")
+
+        # 1-2. Позиция робота и карта приходят вместе с заявкой
+        if "start_x" in request:
+            start_x, start_y = float(request["start_x"]), float(request["start_y"])
+        else:
+            start_x, start_y = get_robot_position(robot_id)
+        logger.info(f"Робот {robot_id} сейчас на позиции ({start_x}, {start_y})")
+        try:
+            grid = get_robot_grid(robot_id, request.get("map_id"), request.get("map_file_path"))
+        except Exception as e:
+            logger.error(f"Ошибка загрузки карты для заявки {request_id}: {e}")
+            update_request_status(request_id, "FAILED")
+            continue
+
+        planned.append((request_id, (start_x, start_y, float(target_x), float(target_y), grid)))
+
+    if not planned:
         return
-    
-    # 2. Получаем текущую позицию робота
-    start_x, start_y = get_robot_position(robot_id)
-    logger.info(f"Робот {robot_id} сейчас на позиции ({start_x}, {start_y})")
-    
-    # 3. Рассчитываем траекторию (используем твою функцию get_path)
-    try:
-        # points = get_path(start_x, start_y, target_x, target_y)
-        # Или если твоя функция возвращает другой формат:
-        points = get_path(start_x, start_y, float(target_x), float(target_y))
-        
-        # 4. Преобразуем в строку
-        path_string = points_to_path_string(points)
-        
-        # 5. Создаем траекторию в БД
-        if create_trajectory(request_id, path_string):
-            # 6. Меняем статус на READY
-            update_request_status(request_id, "READY")
+
+    # 3. Повторяющиеся маршруты берём из кэша, остальные считаем
+    #    (пакетами по процессам) и кладём в кэш
+    trajectories: List[Optional[np.ndarray]] = [
+        trajectory_cache.get(task[4], *task[:4]) for _, task in planned
+    ]
+    misses = [i for i, states in enumerate(trajectories) if states is None]
+    if misses:
+        try:
+            solved = get_paths_parallel([planned[i][1] for i in misses], pool, workers)
+        except Exception as e:
+            logger.error(f"Ошибка пакетного расчета траекторий: {e}")
+            solved = [None] * len(misses)
+        for i, states in zip(misses, solved):
+            trajectories[i] = states
+            if states is not None:
+                task = planned[i][1]
+                trajectory_cache.put(task[4], *task[:4], states)
+    logger.info(f"Кэш траекторий: попаданий {len(planned) - len(misses)} из {len(planned)}")
+
+    for (request_id, _), states in zip(planned, trajectories):
+        if states is None:
+            logger.error(f"Ошибка расчета траектории для заявки {request_id}")
+            update_request_status(request_id, "FAILED")
+            continue
+
+        # 4. Создаем траекторию в БД (API сам переводит заявку в READY)
+        if create_trajectory(request_id, states):
             logger.info(f"Заявка {request_id} готова (статус: READY)")
         else:
             logger.error(f"Не удалось создать траекторию для заявки {request_id}")
             update_request_status(request_id, "FAILED")
-            
-    except Exception as e:
-        logger.error(f"Ошибка расчета траектории для заявки {request_id}: {e}")
-        update_request_status(request_id, "FAILED")
 
-def main():
-    """Основной цикл планировщика"""
-    logger.info("Планировщик траекторий запущен")
-    logger.info(f"Опрашиваем API: {API_BASE_URL}")
-    
-    while True:
+def run(pool: Optional[Executor] = None, workers: int = 1, stop: Optional[threading.Event] = None,
+        wait_timeout: float = LONG_POLL_TIMEOUT):
+    """
+    Цикл планировщика: забирает PENDING заявки пачками и ждёт новых по ленте
+    событий. stop — событие остановки (проверяется между пачками, ожидание
+    новых заявок длится не дольше wait_timeout)
+    """
+    cursor = None
+    while stop is None or not stop.is_set():
         try:
-            # Получаем PENDING заявки
-            pending_requests = get_pending_requests()
-            
-            if pending_requests:
-                logger.info(f"Найдено {len(pending_requests)} PENDING заявок")
-                
-                # Обрабатываем каждую заявку
-                for request in pending_requests:
-                    process_request(request)
-                    time.sleep(0.5)  # Небольшая пауза между обработкой
+            # Курсор ленты берём до выборки, чтобы не пропустить заявки, созданные между ними
+            if cursor is None:
+                feed = wait_for_events(None)
+                cursor = feed["last_id"] if feed else None
+
+            # Забираем PENDING заявки (сервер сразу переводит их в PLANNING)
+            claimed = claim_pending_requests(CLAIM_BATCH)
+
+            if claimed:
+                logger.info(f"Получено {len(claimed)} заявок на планирование")
+
+                # Обрабатываем все заявки одним пакетом
+                process_requests(claimed, pool, workers)
+                logger.debug(f"Кэш траекторий: {trajectory_cache.stats()}")
+
+                # Очередь могла не уместиться в один запрос — забираем дальше без паузы
+                if len(claimed) == CLAIM_BATCH:
+                    continue
             else:
                 logger.debug("Нет PENDING заявок")
-            
-            # Ждем перед следующей проверкой
-            time.sleep(POLL_INTERVAL)
-            
+
+            # Ждем новых PENDING заявок; без ленты событий — обычный опрос
+            feed = wait_for_events(cursor, ["PENDING"], wait_timeout) if cursor is not None else None
+            if feed is None:
+                cursor = None
+                time.sleep(POLL_INTERVAL)
+            else:
+                cursor = feed["last_id"]
+
         except KeyboardInterrupt:
             logger.info("Планировщик остановлен")
             break
@@ -187,5 +372,37 @@ def main():
             logger.error(f"Ошибка в основном цикле: {e}")
             time.sleep(POLL_INTERVAL)
 
+def main(workers: int = PLANNER_WORKERS, cache_size: int = CACHE_SIZE,
+         cache_ttl: float = CACHE_TTL, cache_quantum: float = CACHE_QUANTUM):
+    """Основной цикл планировщика"""
+    trajectory_cache.max_size = cache_size
+    trajectory_cache.ttl = cache_ttl
+    trajectory_cache.quantum = cache_quantum
+
+    logger.info("Планировщик траекторий запущен")
+    logger.info(f"Опрашиваем API: {API_BASE_URL}")
+
+    # Планирование упирается в CPU (GIL), поэтому параллелим процессами
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    if pool is not None:
+        logger.info(f"Пул планирования: {workers} процессов")
+
+    try:
+        run(pool, workers)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Планировщик траекторий")
+    parser.add_argument("--workers", type=int, default=PLANNER_WORKERS,
+                        help="число процессов планирования")
+    parser.add_argument("--cache-size", type=int, default=CACHE_SIZE,
+                        help="максимум траекторий в кэше")
+    parser.add_argument("--cache-ttl", type=float, default=CACHE_TTL,
+                        help="время жизни траектории в кэше, секунды")
+    parser.add_argument("--cache-quantum", type=float, default=CACHE_QUANTUM,
+                        help="шаг квантования старта и цели, метры")
+    args = parser.parse_args()
+    main(workers=args.workers, cache_size=args.cache_size,
+         cache_ttl=args.cache_ttl, cache_quantum=args.cache_quantum)
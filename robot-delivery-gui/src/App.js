@@ -5,7 +5,7 @@ import RobotList from './components/RobotList';
 import RobotMap from './components/RobotMap';
 import RequestForm from './components/RequestForm';
 import TrajectoryViewer from './components/TrajectoryViewer';
-import { login, getRobotById, updateRobotCoordinates } from './services/api';
+import { login, getRobotById, subscribeRobotPositions } from './services/api';
 
 function App() {
   const [user, setUser] = useState(null);
@@ -15,31 +15,20 @@ function App() {
   const [targetPoint, setTargetPoint] = useState(null);
   const [trajectoryPoints, setTrajectoryPoints] = useState([]);
   
-  // Периодическое обновление координат робота
+  // Координаты робота приходят от сервера по WebSocket при каждом изменении
   useEffect(() => {
     if (!selectedRobotId) return;
     
-    const updateCoordinates = async () => {
-      try {
-        const coords = await updateRobotCoordinates(selectedRobotId);
-        setRobotData(prev => prev ? {
-          ...prev,
-          current_position_x: coords.current_position_x,
-          current_position_y: coords.current_position_y
-        } : null);
-        
-        console.log('Обновлены координаты:', coords);
-      } catch (error) {
-        console.error('Ошибка обновления координат:', error);
-      }
-    };
-    
-    // Первое обновление сразу
-    updateCoordinates();
-    
-    // Затем каждые 5 секунд
-    const interval = setInterval(updateCoordinates, 5000);
-    return () => clearInterval(interval);
+    return subscribeRobotPositions({ robot_id: selectedRobotId }, (robots) => {
+      const coords = robots.find(r => r.id === selectedRobotId);
+      if (!coords) return;
+      setRobotData(prev => prev ? {
+        ...prev,
+        status: coords.status,
+        current_position_x: coords.x,
+        current_position_y: coords.y
+      } : null);
+    });
   }, [selectedRobotId]);
 
   const handleLogin = (userData) => {
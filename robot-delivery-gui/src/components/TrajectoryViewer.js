@@ -3,7 +3,8 @@ import {
   getTrajectoryByRequestId, 
   acceptRequest, 
   rejectRequest,
-  getRequestById 
+  getRequestById,
+  subscribeRequestEvents
 } from '../services/api';
 
 function TrajectoryViewer({ requestId, onAccept, onReject, onTrajectoryLoaded }) {
@@ -15,7 +16,6 @@ function TrajectoryViewer({ requestId, onAccept, onReject, onTrajectoryLoaded })
   
   // Используем ref для отслеживания, чтобы избежать лишних рендеров
   const trajectoryLoadedRef = useRef(false);
-  const pollingIntervalRef = useRef(null);
 
   // Функция для загрузки статуса заявки
   const loadRequestStatus = async () => {
@@ -28,20 +28,14 @@ function TrajectoryViewer({ requestId, onAccept, onReject, onTrajectoryLoaded })
         setRequestStatus(newStatus);
       }
       
-      // Если заявка завершена - очищаем траекторию и останавливаем опрос
+      // Если заявка завершена - очищаем траекторию
       if (newStatus === 'COMPLETED' || newStatus === 'FAILED') {
-        console.log('Заявка завершена, очищаем траекторию и останавливаем опрос');
+        console.log('Заявка завершена, очищаем траекторию');
         setTrajectory(null);
         setHasTrajectory(false);
         if (onTrajectoryLoaded) {
           onTrajectoryLoaded([]); // Очищаем точки на карте
         }
-        
-        // Останавливаем опрос
-        if (pollingIntervalRef.current) {
-          clearInterval(pollingIntervalRef.current);
-          pollingIntervalRef.current = null;
-        }
         return true; // Возвращаем true чтобы остановить дальнейшую загрузку
       }
       return false;
@@ -109,35 +103,7 @@ function TrajectoryViewer({ requestId, onAccept, onReject, onTrajectoryLoaded })
       
       // 2. Если заявка не завершена - пытаемся загрузить траекторию
       if (!isCompleted) {
-        const hasTraj = await loadTrajectoryOnce();
-        
-        // 3. Если траектории ещё нет, запускаем интервал для её поиска
-        if (!hasTraj) {
-          console.log('Траектории нет, запускаем интервал поиска');
-          
-          // Интервал для поиска траектории (каждые 2 секунды, максимум 30 раз = 1 минута)
-          let attempts = 0;
-          const maxAttempts = 30;
-          
-          const trajectoryPolling = setInterval(async () => {
-            attempts++;
-            
-            // Пытаемся загрузить траекторию
-            const loaded = await loadTrajectoryOnce();
-            
-            // Если загрузили или превысили попытки - останавливаем
-            if (loaded || attempts >= maxAttempts) {
-              clearInterval(trajectoryPolling);
-              if (attempts >= maxAttempts) {
-                setError('Траектория не была рассчитана в течение минуты');
-                setLoading(false);
-              }
-            }
-          }, 2000);
-          
-          // Сохраняем ID интервала для очистки
-          pollingIntervalRef.current = trajectoryPolling;
-        }
+        await loadTrajectoryOnce();
       } else {
         // Если заявка уже завершена - останавливаем загрузку
         setLoading(false);
@@ -146,18 +112,26 @@ function TrajectoryViewer({ requestId, onAccept, onReject, onTrajectoryLoaded })
     
     initialLoad();
     
-    // Интервал для обновления статуса (каждые 5 секунд)
-    const statusInterval = setInterval(() => {
-      loadRequestStatus();
-    }, 5000);
+    // Дальше сервер сам присылает переходы статусов заявки
+    const unsubscribe = subscribeRequestEvents(
+      { request_id: requestId },
+      (event) => {
+        if (event.status === 'COMPLETED' || event.status === 'FAILED') {
+          loadRequestStatus();
+          return;
+        }
+        setRequestStatus(event.status);
+        if (event.status === 'READY') {
+          loadTrajectoryOnce();
+        }
+      },
+      // События потеряны (переподключение, перезапуск API) - перечитываем всё
+      initialLoad
+    );
     
     // Очистка при размонтировании
     return () => {
-      clearInterval(statusInterval);
-      if (pollingIntervalRef.current) {
-        clearInterval(pollingIntervalRef.current);
-        pollingIntervalRef.current = null;
-      }
+      unsubscribe();
     };
   }, [requestId]); // Зависимость только от requestId
 
@@ -120,6 +120,50 @@ export const updateRequestStatus = async (request_id, status) => {
   return response.data;
 };
 
+// Подписка на переходы статусов заявок (Server-Sent Events).
+// params: { request_id, robot_id, status }; возвращает функцию отписки
+export const subscribeRequestEvents = (params, onEvent, onReset) => {
+  const query = new URLSearchParams();
+  Object.entries(params || {}).forEach(([key, value]) => {
+    if (value !== undefined && value !== null) query.append(key, value);
+  });
+  const source = new EventSource(`${API_BASE}/requests/events/stream?${query}`);
+  source.addEventListener('status', (e) => onEvent(JSON.parse(e.data)));
+  if (onReset) {
+    source.addEventListener('reset', () => onReset());
+  }
+  return () => source.close();
+};
+
+// Поток позиций роботов (WebSocket). params: { robot_id, map_id };
+// onUpdate получает список изменившихся роботов. Возвращает функцию отписки
+export const subscribeRobotPositions = (params, onUpdate) => {
+  const query = new URLSearchParams();
+  Object.entries(params || {}).forEach(([key, value]) => {
+    if (value !== undefined && value !== null) query.append(key, value);
+  });
+  const url = `${API_BASE.replace(/^http/, 'ws')}/robots/ws?${query}`;
+  let socket = null;
+  let reconnectTimer = null;
+  let closed = false;
+
+  const connect = () => {
+    socket = new WebSocket(url);
+    socket.onmessage = (e) => onUpdate(JSON.parse(e.data).robots);
+    socket.onclose = () => {
+      // Переподключаемся; после подключения сервер снова пришлёт снимок
+      if (!closed) reconnectTimer = setTimeout(connect, 2000);
+    };
+  };
+  connect();
+
+  return () => {
+    closed = true;
+    clearTimeout(reconnectTimer);
+    socket.close();
+  };
+};
+
 // Получить все заявки пользователя
 export const getUserRequests = async (user_id) => {
   const response = await api.get(`/requests/user/${user_id}`);
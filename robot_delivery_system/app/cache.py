@@ -0,0 +1,96 @@
+import hashlib
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import Request, Response
+
+# Время жизни готовых ответов, секунды: страховка от изменений в обход API
+# (другой процесс uvicorn, ручные правки в БД)
+RESPONSE_CACHE_TTL = 5.0
+# Максимум разных ответов (комбинаций skip/limit) в одном кэше
+RESPONSE_CACHE_SIZE = 64
+# Карты меняются редко; изменения через API сбрасывают кэш сразу
+MAP_CACHE_TTL = 300.0
+
+
+class ResponseCache:
+    """
+    Готовые (уже сериализованные) ответы или данные для них по ключу запроса.
+    invalidate() сбрасывает все записи разом и увеличивает версию;
+    ответ, собранный во время сброса, не сохраняется — иначе в кэш
+    попали бы данные, прочитанные до изменения.
+    """
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_size: int = RESPONSE_CACHE_SIZE,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._entries: Dict[Hashable, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() - entry[0] < self.ttl:
+                self.hits += 1
+                return entry[1]
+            self._entries.pop(key, None)
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, body: Any, version: int) -> None:
+        """Сохраняет ответ, если с начала его сборки (version) ничего не менялось"""
+        with self._lock:
+            if version != self.version:
+                return
+            if len(self._entries) >= self.max_size:
+                self._entries.clear()
+            self._entries[key] = (self._clock(), body)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def etag_for(body: bytes) -> str:
+    """Сильный ETag по содержимому ответа"""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """If-None-Match совпадает с etag (сравнение без учёта W/, как требует RFC 9110)"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def conditional_response(request: Request, body: bytes, etag: Optional[str] = None,
+                         media_type: str = "application/json",
+                         headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Ответ с ETag; если у клиента уже эта версия — 304 без тела.
+    no-cache: браузер хранит ответ, но перед использованием перепроверяет его
+    """
+    headers = dict(headers or {}, ETag=etag or etag_for(body))
+    headers["Cache-Control"] = "no-cache"
+    if not_modified(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
+
+
+# Списки роботов (GET /robots/ и /robots/available)
+robot_lists = ResponseCache()
+# Карты по id (GET /robots/{id}/map и /robots/{id}/map/image)
+maps = ResponseCache(ttl=MAP_CACHE_TTL, max_size=1024)
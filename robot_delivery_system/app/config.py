@@ -1,13 +1,35 @@
+import os
+
 class Settings:
     DB_HOST = "192.168.56.104"
     DB_PORT = "3306"
     DB_USER = "robot_app"
     DB_PASSWORD = "strong_password_here" 
     DB_NAME = "robot_delivery_db"
+    # Пул асинхронного движка: соединений постоянно и сверх того под пиковую нагрузку
+    DB_POOL_SIZE = 20
+    DB_MAX_OVERFLOW = 20
+    # Логирование SQL (сильно замедляет API под нагрузкой)
+    DB_ECHO = False
+    # Быстрая выдача списков (/robots/, /requests/): строки без проверки схемой,
+    # JSON через orjson (без пакета orjson остаётся обычный путь)
+    FAST_JSON = False
+    # Файл локальной БД SQLite вместо сервера MySQL (бенчмарки, запуск без сети);
+    # берётся из окружения, т.к. движки создаются при импорте пакета app
+    DB_SQLITE_PATH = os.environ.get("DB_SQLITE_PATH")
     
     @property
     def DATABASE_URL(self):
+        if self.DB_SQLITE_PATH:
+            return f"sqlite:///{self.DB_SQLITE_PATH}"
         return f"mysql+pymysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    @property
+    def ASYNC_DATABASE_URL(self):
+        """Тот же сервер через асинхронный драйвер (для обработчиков API)"""
+        if self.DB_SQLITE_PATH:
+            return f"sqlite+aiosqlite:///{self.DB_SQLITE_PATH}"
+        return f"mysql+aiomysql://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
+
 # Создаем экземпляр настроек
 settings = Settings()
\ No newline at end of file
@@ -1,39 +1,115 @@
-from sqlalchemy import create_engine
+from contextlib import asynccontextmanager
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from app.config import settings
 
-# Создаем движок для подключения к БД
+# SQLite: сколько соединение ждёт снятия блокировки записи другим, секунды
+SQLITE_BUSY_TIMEOUT = 30
+_connect_args = {"timeout": SQLITE_BUSY_TIMEOUT} if settings.DB_SQLITE_PATH else {}
+
+# Синхронный движок: создание таблиц и скрипты обслуживания
 engine = create_engine(
     settings.DATABASE_URL,
-    echo = True,
+    echo = settings.DB_ECHO,
     pool_pre_ping = True,
     pool_recycle = 3600,
+    connect_args = _connect_args,
 )
 
-# Фабрика сессий
+# Фабрика синхронных сессий
 SessionLocal = sessionmaker(
     autocommit = False,
     autoflush = False,
     bind = engine
 )
 
+# Асинхронный движок для обработчиков API: запросы к БД не занимают
+# потоки uvicorn, поэтому число одновременных запросов ограничено пулом
+# соединений, а не пулом потоков
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL,
+    echo = settings.DB_ECHO,
+    pool_pre_ping = True,
+    pool_recycle = 3600,
+    pool_size = settings.DB_POOL_SIZE,
+    max_overflow = settings.DB_MAX_OVERFLOW,
+    connect_args = _connect_args,
+)
+
+# Фабрика асинхронных сессий. Объекты не сбрасываются после COMMIT:
+# ленивая догрузка атрибутов в асинхронном коде невозможна
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_ = AsyncSession,
+    autoflush = False,
+    expire_on_commit = False,
+)
+
 # Базовый класс для моделей
 Base = declarative_base()
 
 # Зависимость для получения сессии БД
-def get_db():
+async def get_db():
     """
-    Генератор сессии БД для использования в FastAPI зависимостях
+    Асинхронная сессия БД для использования в FastAPI зависимостях
     Использование:
-        db = next(get_db())
+        async with AsyncSessionLocal() as db: ...
         или в FastAPI: Depends(get_db)
     """
-    db = SessionLocal()
+    async with AsyncSessionLocal() as db:
+        yield db
+
+@event.listens_for(Session, "after_flush")
+def _mark_flush(session: Session, flush_context):
+    """Отмечает, что внутри unit_of_work изменения уже ушли в БД"""
+    if session.info.get("unit_of_work"):
+        session.info["unit_of_work_changed"] = True
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_write(orm_execute_state):
+    """То же для UPDATE/DELETE/INSERT через db.execute() — они минуют flush"""
+    session = orm_execute_state.session
+    if session.info.get("unit_of_work") and (
+            orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        session.info["unit_of_work_changed"] = True
+
+@asynccontextmanager
+async def unit_of_work(db: AsyncSession):
+    """
+    Одна транзакция на изменение: все запросы блока фиксируются одним
+    COMMIT при выходе, при исключении — ROLLBACK. Во вложенном блоке
+    (сервис, вызванный из другого сервиса) фиксирует только внешний.
+    Использование:
+        async with unit_of_work(db): ...
+    """
+    depth = db.info.get("unit_of_work", 0)
+    if depth == 0:
+        db.info["unit_of_work_changed"] = False
+    db.info["unit_of_work"] = depth + 1
     try:
         yield db
+        if depth == 0:
+            await db.commit()
+    except ValueError:
+        if depth == 0:
+            # Проверка не прошла до изменений: транзакцию (и блокировки строк)
+            # завершаем COMMIT, а не ROLLBACK — откат сбросил бы загруженные
+            # в сессию объекты, а догрузка в асинхронном коде невозможна.
+            # Была запись в БД (flush или UPDATE/DELETE/INSERT) — только ROLLBACK
+            if db.info["unit_of_work_changed"] or db.new or db.dirty or db.deleted:
+                await db.rollback()
+            else:
+                await db.commit()
+        raise
+    except BaseException:
+        if depth == 0:
+            await db.rollback()
+        raise
     finally:
-        db.close()
+        db.info["unit_of_work"] = depth
 
 # Функция для создания всех таблиц
 def create_tables():
@@ -0,0 +1,321 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app import models
+from app.cache import robot_lists
+from app.robot_state import robot_state
+
+# Сколько последних событий хранится для догоняющих клиентов
+EVENT_HISTORY = 4096
+# Максимальное время ожидания long-poll запроса, секунды
+LONG_POLL_TIMEOUT = 25.0
+# Интервал пустых комментариев в SSE-потоке, чтобы прокси не рвали соединение
+SSE_HEARTBEAT = 15.0
+
+
+class RequestEventBroker:
+    """
+    Лента переходов статусов заявок внутри процесса API.
+    События нумеруются по возрастанию и хранятся в кольцевом буфере,
+    поэтому клиент, передавший номер последнего увиденного события,
+    получает всё, что пропустил. Публикация идёт из потоков обработки
+    запросов, ожидание — в event loop (SSE и long-poll).
+    Лента общая только для одного процесса uvicorn.
+    """
+
+    def __init__(self, history: int = EVENT_HISTORY):
+        self._events: deque = deque(maxlen=history)
+        self._last_id = 0
+        self._lock = threading.Lock()
+        self._waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    def publish(self, request_id: int, robot_id: Optional[int], status: str,
+                old_status: Optional[str] = None) -> Dict:
+        """Добавляет событие и будит всех ожидающих"""
+        with self._lock:
+            self._last_id += 1
+            item = {
+                "id": self._last_id,
+                "request_id": request_id,
+                "robot_id": robot_id,
+                "status": status,
+                "old_status": old_status,
+                "timestamp": time.time(),
+            }
+            self._events.append(item)
+            waiters, self._waiters = self._waiters, []
+
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                # Цикл событий уже закрыт
+                pass
+        return item
+
+    def events_since(self, after: int, statuses: Optional[Iterable[str]] = None,
+                     robot_id: Optional[int] = None,
+                     request_id: Optional[int] = None) -> Tuple[List[Dict], int, bool]:
+        """
+        События с номером больше after, подходящие под фильтры.
+        Возвращает (события, номер последнего события, reset); reset == True,
+        если часть событий уже вытеснена из буфера или API перезапускался —
+        клиенту нужно перечитать состояние целиком.
+        """
+        statuses = set(statuses) if statuses else None
+        with self._lock:
+            last_id = self._last_id
+            first_id = self._events[0]["id"] if self._events else last_id + 1
+            reset = after > last_id or after < first_id - 1
+            selected = [
+                item for item in self._events
+                if item["id"] > after
+                and (statuses is None or item["status"] in statuses)
+                and (robot_id is None or item["robot_id"] == robot_id)
+                and (request_id is None or item["request_id"] == request_id)
+            ]
+        return selected, last_id, reset
+
+    async def wait(self, after: int, timeout: float) -> bool:
+        """Ждёт события с номером больше after; False — по таймауту"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self._last_id > after:
+                return True
+            self._waiters.append((loop, future))
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._lock:
+                if (loop, future) in self._waiters:
+                    self._waiters.remove((loop, future))
+
+    async def listen(self, after: int, timeout: float, statuses: Optional[Iterable[str]] = None,
+                     robot_id: Optional[int] = None,
+                     request_id: Optional[int] = None) -> Tuple[List[Dict], int, bool]:
+        """Long-poll: возвращается сразу при первом подходящем событии или по таймауту"""
+        deadline = time.monotonic() + timeout
+        while True:
+            selected, last_id, reset = self.events_since(after, statuses, robot_id, request_id)
+            if selected or reset:
+                return selected, last_id, reset
+            # Неподходящие события пропускаем, чтобы не просматривать их повторно
+            after = last_id
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not await self.wait(after, remaining):
+                return [], after, False
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class PositionSubscriber:
+    """
+    Подписчик на позиции роботов (одно WebSocket-соединение).
+    Между отправками накапливает только последнее состояние каждого робота,
+    поэтому медленный клиент получает реже, но не отстаёт.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, map_id: Optional[int] = None,
+                 robot_id: Optional[int] = None):
+        self.loop = loop
+        self.map_id = map_id
+        self.robot_id = robot_id
+        self._pending: Dict[int, Dict] = {}
+        self._ready = asyncio.Event()
+
+    def matches(self, item: Dict) -> bool:
+        return _position_matches(item, self.map_id, self.robot_id)
+
+    def _push(self, item: Dict):
+        self._pending[item["id"]] = item
+        self._ready.set()
+
+    async def next_batch(self) -> List[Dict]:
+        """Изменения с прошлой отправки (ждёт, пока они появятся)"""
+        await self._ready.wait()
+        self._ready.clear()
+        batch = list(self._pending.values())
+        self._pending.clear()
+        return batch
+
+
+class RobotPositionHub:
+    """
+    Последние позиции роботов в памяти процесса API и рассылка изменений
+    подписчикам. Снимок для нового подписчика берётся из памяти, поэтому
+    число открытых панелей не влияет на нагрузку на БД.
+    """
+
+    def __init__(self):
+        self._positions: Dict[int, Dict] = {}
+        self._subscribers: List[PositionSubscriber] = []
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def load(self, robots: Iterable) -> None:
+        """Начальное заполнение из БД; более свежие опубликованные позиции не затираются"""
+        with self._lock:
+            for robot in robots:
+                self._positions.setdefault(robot.id, _robot_item(robot))
+            self.loaded = True
+
+    def publish(self, item: Dict) -> None:
+        """
+        Рассылает изменение робота. Если робот сменил карту (previous_map_id
+        в записи или последняя известная позиция на другой карте), подписчики
+        старой карты получают его с deleted, чтобы убрать с отображения
+        """
+        with self._lock:
+            previous = self._positions.get(item["id"])
+            old_map_id = item.get("previous_map_id", previous["map_id"] if previous else None)
+            item = {key: value for key, value in item.items() if key != "previous_map_id"}
+            if item.get("deleted"):
+                self._positions.pop(item["id"], None)
+            else:
+                self._positions[item["id"]] = item
+            left = None
+            if not item.get("deleted") and old_map_id is not None and old_map_id != item["map_id"]:
+                item = dict(item, previous_map_id=old_map_id)
+                left = dict(item, map_id=old_map_id, deleted=True)
+            deliveries = []
+            for sub in self._subscribers:
+                if sub.matches(item):
+                    deliveries.append((sub, item))
+                elif left is not None and sub.matches(left):
+                    deliveries.append((sub, left))
+
+        for sub, delivered in deliveries:
+            try:
+                sub.loop.call_soon_threadsafe(sub._push, delivered)
+            except RuntimeError:
+                pass
+
+    def snapshot(self, map_id: Optional[int] = None, robot_id: Optional[int] = None) -> List[Dict]:
+        with self._lock:
+            return [item for item in self._positions.values()
+                    if _position_matches(item, map_id, robot_id)]
+
+    def subscribe(self, map_id: Optional[int] = None, robot_id: Optional[int] = None) -> PositionSubscriber:
+        subscriber = PositionSubscriber(asyncio.get_running_loop(), map_id, robot_id)
+        with self._lock:
+            self._subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: PositionSubscriber) -> None:
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+
+def _position_matches(item: Dict, map_id: Optional[int], robot_id: Optional[int]) -> bool:
+    return ((robot_id is None or item["id"] == robot_id)
+            and (map_id is None or item["map_id"] == map_id))
+
+
+def position_item(robot_id: int, map_id: Optional[int], x: float, y: float, status: str,
+                  deleted: bool = False) -> Dict:
+    """Запись о позиции робота в том виде, в каком она уходит подписчикам"""
+    item = {
+        "id": robot_id,
+        "map_id": map_id,
+        "x": x,
+        "y": y,
+        "status": status,
+        "timestamp": time.time(),
+    }
+    if deleted:
+        item["deleted"] = True
+    return item
+
+
+def _robot_item(robot, deleted: bool = False) -> Dict:
+    return position_item(robot.id, robot.current_map_id, robot.current_position_x,
+                         robot.current_position_y, robot.status, deleted)
+
+
+# Лента событий процесса API
+broker = RequestEventBroker()
+# Позиции роботов для WebSocket-подписчиков
+positions = RobotPositionHub()
+
+_ROBOT_FIELDS = ("current_position_x", "current_position_y", "status", "current_map_id")
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_status_changes(session: Session, flush_context):
+    """Запоминает изменения статусов заявок и позиций роботов до фиксации транзакции"""
+    pending = session.info.setdefault("request_events", [])
+    robots = session.info.setdefault("robot_updates", {})
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, models.Robot):
+            state = inspect(obj)
+            if any(state.attrs[name].history.added for name in _ROBOT_FIELDS):
+                item = _robot_item(obj)
+                # Прежняя карта — подписчикам старой карты робот уходит с deleted
+                map_history = state.attrs.current_map_id.history
+                if map_history.added and map_history.deleted and map_history.deleted[0] is not None:
+                    item["previous_map_id"] = map_history.deleted[0]
+                elif "previous_map_id" in robots.get(obj.id, {}):
+                    item["previous_map_id"] = robots[obj.id]["previous_map_id"]
+                robots[obj.id] = item
+            continue
+        if not isinstance(obj, models.TransportRequest):
+            continue
+        history = inspect(obj).attrs.status.history
+        if not history.added:
+            continue
+        old_status = history.deleted[0] if history.deleted else None
+        pending.append((obj.id, obj.robot_id, history.added[0], old_status))
+    for obj in session.deleted:
+        if isinstance(obj, models.Robot):
+            robots[obj.id] = _robot_item(obj, deleted=True)
+
+
+def stage_robot_updates(session, items: Iterable[Dict]) -> None:
+    """
+    Позиции, изменённые в обход объектов сессии (пакетный UPDATE): будут
+    разосланы подписчикам вместе с остальными изменениями после COMMIT
+    """
+    robots = session.info.setdefault("robot_updates", {})
+    for item in items:
+        robots[item["id"]] = item
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_status_changes(session: Session):
+    """Публикует изменения статусов и позиций только после успешного COMMIT"""
+    for request_id, robot_id, status, old_status in session.info.pop("request_events", []):
+        broker.publish(request_id, robot_id, status, old_status)
+    robot_updates = session.info.pop("robot_updates", {})
+    if robot_updates:
+        robot_lists.invalidate()
+    for item in robot_updates.values():
+        # Позиция в БД может отставать от памяти, подписчикам уходит позиция из памяти
+        positions.publish(robot_state.apply_committed(item))
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_status_changes(session: Session, previous_transaction):
+    session.info.pop("request_events", None)
+    session.info.pop("robot_updates", None)
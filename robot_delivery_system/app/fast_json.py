@@ -0,0 +1,31 @@
+from operator import attrgetter
+from typing import Iterable, Sequence
+
+from app import schemas
+from app.config import settings
+
+try:
+    import orjson
+except ImportError:
+    # Необязательная зависимость: без неё списки сериализуются через Pydantic
+    orjson = None
+
+# Поля ответов в порядке схем (JSON совпадает с выдачей Pydantic)
+ROBOT_FIELDS = tuple(schemas.Robot.model_fields)
+REQUEST_FIELDS = tuple(schemas.TransportRequest.model_fields)
+
+
+def enabled() -> bool:
+    """Включён ли быстрый путь (settings.FAST_JSON и установлен orjson)"""
+    return settings.FAST_JSON and orjson is not None
+
+
+def dump_rows(rows: Iterable, fields: Sequence[str]) -> bytes:
+    """
+    JSON-массив объектов из строк с атрибутами fields (строки SELECT по
+    столбцам, снимки из памяти) без проверки каждой строки схемой.
+    Значения те же, что у Pydantic; отличается только запись больших
+    чисел с экспонентой (1e20 вместо 1e+20)
+    """
+    values = attrgetter(*fields)
+    return orjson.dumps([dict(zip(fields, values(row))) for row in rows], option=orjson.OPT_UTC_Z)
@@ -0,0 +1,154 @@
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+# Сторона тайла, пиксели
+TILE_SIZE = 256
+# Память под пирамиды карт (изображения уровней и готовые тайлы), байты
+TILE_CACHE_BYTES = 256 * 1024 * 1024
+# Сжатие PNG тайлов: тайл кодируется один раз, поэтому можно сжимать сильнее
+TILE_PNG_COMPRESSION = 6
+
+
+class MapPyramid:
+    """
+    Пирамида одной карты: уровень max_zoom — исходное изображение, каждый
+    уровень ниже — вдвое меньше, на уровне 0 карта целиком помещается в
+    один тайл. Изображения уровней строятся сразу после единственного
+    декодирования PNG, тайлы кодируются при первом запросе и хранятся.
+    signature — (mtime_ns, size) файла: изменившийся файл строится заново.
+    """
+
+    def __init__(self, image: Image.Image, signature: Tuple[int, int]):
+        self.signature = signature
+        self.width, self.height = image.size
+        levels = [image]
+        while max(levels[-1].size) > TILE_SIZE:
+            levels.append(levels[-1].reduce(2))
+        # levels[z]: z = 0 — самый мелкий уровень
+        self.levels: List[Image.Image] = levels[::-1]
+        self._tiles: Dict[Tuple[int, int, int], bytes] = {}
+        self._lock = threading.Lock()
+        self.nbytes = sum(level.width * level.height * len(level.getbands()) for level in self.levels)
+
+    @property
+    def max_zoom(self) -> int:
+        return len(self.levels) - 1
+
+    def grid(self, z: int) -> Tuple[int, int]:
+        """(столбцы, строки) тайлов уровня z"""
+        level = self.levels[z]
+        return -(-level.width // TILE_SIZE), -(-level.height // TILE_SIZE)
+
+    def info(self) -> Dict:
+        return {
+            "width": self.width,
+            "height": self.height,
+            "tile_size": TILE_SIZE,
+            "max_zoom": self.max_zoom,
+            "levels": [
+                {"z": z, "width": level.width, "height": level.height,
+                 "cols": self.grid(z)[0], "rows": self.grid(z)[1]}
+                for z, level in enumerate(self.levels)
+            ],
+        }
+
+    def tile(self, z: int, x: int, y: int) -> Optional[bytes]:
+        """PNG тайла (x — столбец, y — строка от верхнего края); None — вне пирамиды"""
+        if not 0 <= z <= self.max_zoom:
+            return None
+        cols, rows = self.grid(z)
+        if not (0 <= x < cols and 0 <= y < rows):
+            return None
+        key = (z, x, y)
+        data = self._tiles.get(key)
+        if data is None:
+            level = self.levels[z]
+            # Крайние тайлы не дополняются: их размер меньше TILE_SIZE
+            box = (x * TILE_SIZE, y * TILE_SIZE,
+                   min((x + 1) * TILE_SIZE, level.width), min((y + 1) * TILE_SIZE, level.height))
+            buffer = io.BytesIO()
+            level.crop(box).save(buffer, format="PNG", compress_level=TILE_PNG_COMPRESSION)
+            data = buffer.getvalue()
+            with self._lock:
+                if key not in self._tiles:
+                    self._tiles[key] = data
+                    self.nbytes += len(data)
+        return data
+
+
+def load_pyramid(path: str, signature: Tuple[int, int]) -> MapPyramid:
+    """Декодирует PNG карты и строит пирамиду"""
+    with Image.open(path) as image:
+        image.load()
+        # Палитра и полутона масштабируются без искажений только в полноцветном виде
+        if image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        return MapPyramid(image, signature)
+
+
+class MapTileCache:
+    """
+    Пирамиды карт в памяти процесса API, вытеснение давно не
+    использованных (LRU) при превышении max_bytes. Построение идёт
+    вне event loop (вызывающий код — через asyncio.to_thread); одну
+    карту одновременно строит только один поток.
+    """
+
+    def __init__(self, max_bytes: int = TILE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._pyramids: "OrderedDict[Tuple[int, str], MapPyramid]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks: Dict[Tuple[int, str], threading.Lock] = {}
+        self.builds = 0
+
+    def get(self, map_id: int, path: str) -> MapPyramid:
+        """Пирамида карты (FileNotFoundError, если файла нет)"""
+        stat_result = os.stat(path)
+        signature = (stat_result.st_mtime_ns, stat_result.st_size)
+        key = (map_id, path)
+        with self._lock:
+            pyramid = self._pyramids.get(key)
+            if pyramid is not None and pyramid.signature == signature:
+                self._pyramids.move_to_end(key)
+                # Тайлы, закодированные после прошлого запроса, тоже занимают память
+                self._evict_locked()
+                return pyramid
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        with build_lock:
+            with self._lock:
+                pyramid = self._pyramids.get(key)
+            if pyramid is None or pyramid.signature != signature:
+                pyramid = load_pyramid(path, signature)
+                self.builds += 1
+                with self._lock:
+                    self._pyramids[key] = pyramid
+                    self._pyramids.move_to_end(key)
+            self._evict()
+        return pyramid
+
+    def _evict(self) -> None:
+        with self._lock:
+            self._evict_locked()
+
+    def _evict_locked(self) -> None:
+        # Последнюю использованную пирамиду оставляем, даже если она больше лимита
+        while len(self._pyramids) > 1 and self.nbytes > self.max_bytes:
+            key, _ = self._pyramids.popitem(last=False)
+            self._build_locks.pop(key, None)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(pyramid.nbytes for pyramid in self._pyramids.values())
+
+    def __len__(self) -> int:
+        return len(self._pyramids)
+
+
+# Тайлы карт процесса API
+map_tiles = MapTileCache()
@@ -4,6 +4,7 @@ from .map import Map
 from .user import User
 from .transport_request import TransportRequest
 from .trajectory import Trajectory
+from .telemetry import RobotTelemetry
 
 # Экспортируем Base и все модели
 __all__ = [
@@ -12,6 +13,7 @@ __all__ = [
     'Map', 
     'User',
     'TransportRequest',
+    'RobotTelemetry',
     'Trajectory'
     'Test'
 ]
\ No newline at end of file
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Double, Index, Integer, LargeBinary
+from sqlalchemy.dialects.mysql import MEDIUMBLOB
+from app.database import Base
+
+class RobotTelemetry(Base):
+    """
+    История позиций робота: одна строка — отрезок до TELEMETRY_CHUNK_SECONDS
+    одного робота. Отметки лежат в samples в формате app/trajectory_codec.py
+    (поля dt, x, y; dt — секунды от t_start), поэтому таблица растёт на
+    строку в минуту на робота, а не на каждую отметку.
+    """
+    __tablename__ = "robot_telemetry"
+
+    id = Column(Integer, primary_key=True)
+    # Без внешнего ключа: история остаётся и после удаления робота
+    robot_id = Column(Integer, nullable=False)
+    t_start = Column(Double, nullable=False)  # unix-время первой отметки, с
+    t_end = Column(Double, nullable=False)    # unix-время последней отметки, с
+    points = Column(Integer, nullable=False)
+    samples = Column(LargeBinary().with_variant(MEDIUMBLOB(), "mysql"), nullable=False)
+
+    # Отрезки робота по времени: выборка окна — один диапазон индекса
+    __table_args__ = (
+        Index('ix_robot_telemetry_robot_id_t_start', 'robot_id', 't_start'),
+    )
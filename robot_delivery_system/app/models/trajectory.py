@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, LargeBinary
+from sqlalchemy.dialects.mysql import MEDIUMBLOB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -8,7 +9,8 @@ class Trajectory(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     request_id = Column(Integer, ForeignKey('transport_requests.id'), unique=True)
-    path_data = Column(String(10000))  # JSON с координатами траектории
+    path_data = Column(String(10000))  # JSON с координатами траектории (старый формат)
+    path_blob = Column(LargeBinary().with_variant(MEDIUMBLOB(), "mysql"))  # app/trajectory_codec.py
     calculated_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Связи
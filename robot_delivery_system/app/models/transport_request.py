@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, Enum, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, Float, Enum, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -16,8 +16,18 @@ class TransportRequest(Base):
         default='PENDING'
     )
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Когда заявку забрал планировщик (UTC): по истечении аренды PLANNING её заберёт другой
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
 
     # Связи
     user = relationship("User", back_populates="transport_requests")
     robot = relationship("Robot", back_populates="transport_requests")
-    trajectory = relationship("Trajectory", back_populates="request", uselist=False)
\ No newline at end of file
+    trajectory = relationship("Trajectory", back_populates="request", uselist=False)
+
+    # Очередь планировщика и фильтр по статусу: самые старые заявки в заданном статусе;
+    # история пользователя — по (user_id, created_at). Страницы листаются по
+    # (created_at, id): первичный ключ входит в каждый вторичный индекс InnoDB
+    __table_args__ = (
+        Index('ix_transport_requests_status_created_at', 'status', 'created_at'),
+        Index('ix_transport_requests_user_id_created_at', 'user_id', 'created_at'),
+    )
\ No newline at end of file
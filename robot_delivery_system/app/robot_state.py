@@ -0,0 +1,262 @@
+import asyncio
+import threading
+from array import array
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, select, update
+
+from app import models
+
+# Как часто накопленные позиции роботов записываются в БД, секунды
+ROBOT_STATE_FLUSH_INTERVAL = 1.0
+# Максимум строк в одном пакетном UPDATE при записи
+ROBOT_STATE_FLUSH_BATCH = 5000
+
+# Коды статусов в массиве состояний
+STATUSES = ('IDLE', 'BUSY')
+_STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+# Значение «карта не назначена» в массиве карт
+_NO_MAP = -1
+
+# Запись позиций одним UPDATE с executemany (мимо ORM: удалённые
+# к этому моменту роботы просто не обновятся)
+_robots_table = models.Robot.__table__
+_FLUSH_STATEMENT = update(_robots_table).where(
+    _robots_table.c.id == bindparam("b_id")
+).values(
+    current_position_x=bindparam("b_x"),
+    current_position_y=bindparam("b_y"),
+)
+
+
+class RobotRow:
+    """Снимок робота из памяти; атрибуты те же, что у models.Robot"""
+    __slots__ = ("id", "name", "status", "current_map_id",
+                 "current_position_x", "current_position_y", "created_at")
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values[name])
+
+
+class RobotStateStore:
+    """
+    Горячее состояние роботов в памяти процесса API.
+    Позиция, статус и карта каждого робота лежат в плотных массивах
+    (array), по id ищется номер ячейки. Позиции пишутся только в память и
+    помечаются изменёнными; фоновая задача раз в ROBOT_STATE_FLUSH_INTERVAL
+    записывает в БД последнюю позицию каждого изменившегося робота одним
+    UPDATE, и ещё раз — при остановке API. Статусы, создание и удаление
+    роботов по-прежнему идут через транзакции БД и попадают сюда после
+    COMMIT. Состояние общее только для одного процесса uvicorn.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._session_factory = None
+        self.flushed = 0
+        self._reset()
+
+    def _reset(self):
+        self._slots: Dict[int, int] = {}
+        self._free: List[int] = []
+        self._x = array("d")
+        self._y = array("d")
+        self._map = array("q")
+        self._status = array("b")
+        self._names: List[Optional[str]] = []
+        self._created: List = []
+        self._dirty: set = set()
+        # Отсортированные id для выдачи списка; сбрасывается при добавлении и удалении
+        self._order: Optional[List[int]] = None
+        self.loaded = False
+
+    # Заполнение
+    def load(self, robots: Iterable) -> None:
+        """Начальное заполнение из БД (объекты с атрибутами models.Robot)"""
+        with self._lock:
+            self._reset()
+            for robot in robots:
+                self._put(robot)
+            self.loaded = True
+
+    async def load_from_db(self, session_factory) -> None:
+        async with session_factory() as db:
+            self.load((await db.scalars(select(models.Robot))).all())
+
+    def clear(self) -> None:
+        """Выключает хранилище: сервисы снова читают и пишут напрямую в БД"""
+        with self._lock:
+            self._reset()
+
+    def _put(self, robot) -> None:
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._names)
+            self._x.append(0.0)
+            self._y.append(0.0)
+            self._map.append(_NO_MAP)
+            self._status.append(0)
+            self._names.append(None)
+            self._created.append(None)
+        self._slots[robot.id] = slot
+        self._order = None
+        self._x[slot] = robot.current_position_x or 0.0
+        self._y[slot] = robot.current_position_y or 0.0
+        self._set_fields(slot, robot.status, robot.current_map_id)
+        self._names[slot] = robot.name
+        self._created[slot] = robot.created_at
+
+    def _set_fields(self, slot: int, status: Optional[str], map_id: Optional[int]) -> None:
+        self._status[slot] = _STATUS_CODES.get(status or 'IDLE', 0)
+        self._map[slot] = _NO_MAP if map_id is None else map_id
+
+    def _row(self, robot_id: int, slot: int) -> RobotRow:
+        map_id = self._map[slot]
+        return RobotRow(
+            id=robot_id,
+            name=self._names[slot],
+            status=STATUSES[self._status[slot]],
+            current_map_id=None if map_id == _NO_MAP else map_id,
+            current_position_x=self._x[slot],
+            current_position_y=self._y[slot],
+            created_at=self._created[slot],
+        )
+
+    # Чтение
+    def get(self, robot_id: int) -> Optional[RobotRow]:
+        with self._lock:
+            slot = self._slots.get(robot_id)
+            return None if slot is None else self._row(robot_id, slot)
+
+    def rows(self, skip: int = 0, limit: Optional[int] = None,
+             status: Optional[str] = None) -> List[RobotRow]:
+        """Роботы по возрастанию id (как SELECT без ORDER BY по первичному ключу)"""
+        with self._lock:
+            if self._order is None:
+                self._order = sorted(self._slots)
+            ids = self._order
+            if status is not None:
+                code = _STATUS_CODES.get(status)
+                ids = [robot_id for robot_id in ids if self._status[self._slots[robot_id]] == code]
+            end = None if limit is None else skip + limit
+            return [self._row(robot_id, self._slots[robot_id]) for robot_id in ids[skip:end]]
+
+    def __contains__(self, robot_id: int) -> bool:
+        return robot_id in self._slots
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    # Изменение
+    def set_position(self, robot_id: int, x: float, y: float) -> Optional[RobotRow]:
+        """Новая позиция робота (в БД попадёт при следующей записи); None — робот неизвестен"""
+        with self._lock:
+            slot = self._slots.get(robot_id)
+            if slot is None:
+                return None
+            self._x[slot] = x
+            self._y[slot] = y
+            self._dirty.add(robot_id)
+            return self._row(robot_id, slot)
+
+    def upsert(self, robot) -> None:
+        """Робот из БД после COMMIT; позиция известного робота остаётся из памяти"""
+        with self._lock:
+            slot = self._slots.get(robot.id)
+            if slot is None:
+                self._put(robot)
+                return
+            self._set_fields(slot, robot.status, robot.current_map_id)
+            self._names[slot] = robot.name
+            self._created[slot] = robot.created_at
+
+    def remove(self, robot_id: int) -> None:
+        with self._lock:
+            slot = self._slots.pop(robot_id, None)
+            if slot is None:
+                return
+            self._dirty.discard(robot_id)
+            self._names[slot] = self._created[slot] = None
+            self._free.append(slot)
+            self._order = None
+
+    def apply_committed(self, item: Dict) -> Dict:
+        """
+        Изменение робота, зафиксированное в БД (запись для подписчиков на
+        позиции): статус и карта переносятся в память, а позиция в записи
+        заменяется на позицию из памяти — в БД она может быть ещё старой
+        """
+        if not self.loaded:
+            return item
+        if item.get("deleted"):
+            self.remove(item["id"])
+            return item
+        with self._lock:
+            slot = self._slots.get(item["id"])
+            if slot is None:
+                # Новый робот: добавляется сервисом после COMMIT вместе с остальными полями
+                return item
+            self._set_fields(slot, item["status"], item["map_id"])
+            return dict(item, x=self._x[slot], y=self._y[slot])
+
+    # Запись в БД
+    @property
+    def dirty_count(self) -> int:
+        return len(self._dirty)
+
+    def _take_dirty(self) -> List[Dict]:
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            return [{"b_id": robot_id, "b_x": self._x[self._slots[robot_id]],
+                     "b_y": self._y[self._slots[robot_id]]} for robot_id in dirty]
+
+    async def flush(self, session_factory) -> int:
+        """Записывает в БД изменившиеся позиции; возвращает число роботов"""
+        params = self._take_dirty()
+        if not params:
+            return 0
+        try:
+            async with session_factory() as db:
+                for start in range(0, len(params), ROBOT_STATE_FLUSH_BATCH):
+                    await db.execute(_FLUSH_STATEMENT, params[start:start + ROBOT_STATE_FLUSH_BATCH])
+                await db.commit()
+        except BaseException:
+            # Не записанные позиции повторим в следующий раз (если их ещё не перезаписали)
+            with self._lock:
+                self._dirty.update(p["b_id"] for p in params if p["b_id"] in self._slots)
+            raise
+        self.flushed += len(params)
+        return len(params)
+
+    def start(self, session_factory, interval: float = ROBOT_STATE_FLUSH_INTERVAL) -> None:
+        """Запускает периодическую запись в текущем event loop"""
+        self._session_factory = session_factory
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(session_factory, interval))
+
+    async def stop(self) -> None:
+        """Останавливает периодическую запись и записывает то, что осталось"""
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await self.flush(self._session_factory)
+
+    async def _run(self, session_factory, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush(session_factory)
+            except Exception as e:
+                print(f"Ошибка записи позиций роботов в БД: {e}")
+
+
+# Состояние роботов процесса API
+robot_state = RobotStateStore()
@@ -0,0 +1,70 @@
+import asyncio
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import conditional_response, not_modified
+from app.database import get_db
+from app.map_tiles import MapPyramid, map_tiles
+from app.schemas import Map, MapTiles
+from app.services.map_service import get_map_info
+
+router = APIRouter(prefix="/maps", tags=["maps"])
+
+
+async def _map(db: AsyncSession, map_id: int) -> Map:
+    map_obj = await get_map_info(db, map_id)
+    if not map_obj:
+        raise HTTPException(status_code=404, detail="Карта не найдена")
+    return map_obj
+
+
+async def map_pyramid(map_obj: Map) -> MapPyramid:
+    """Пирамида тайлов карты: при первом обращении PNG декодируется вне event loop"""
+    try:
+        return await asyncio.to_thread(map_tiles.get, map_obj.id, map_obj.file_path)
+    except (OSError, TypeError):
+        raise HTTPException(status_code=404, detail="Файл карты не найден")
+
+
+def tiles_response(request: Request, map_obj: Map, pyramid: MapPyramid) -> Response:
+    """Описание пирамиды (If-None-Match -> 304)"""
+    body = MapTiles(map_id=map_obj.id, **pyramid.info()).model_dump_json().encode()
+    return conditional_response(request, body)
+
+
+@router.get("/{map_id}/tiles", response_model=MapTiles)
+async def read_map_tiles(map_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """Размеры карты и уровни пирамиды тайлов"""
+    map_obj = await _map(db, map_id)
+    return tiles_response(request, map_obj, await map_pyramid(map_obj))
+
+
+@router.get("/{map_id}/tiles/{z}/{x}/{y}")
+async def read_map_tile(map_id: int, z: int, x: int, y: int, request: Request,
+                        db: AsyncSession = Depends(get_db)):
+    """
+    Тайл карты в PNG: z — уровень (0 — вся карта в одном тайле),
+    x — столбец, y — строка от верхнего края. ETag — по версии файла
+    и координатам тайла: при совпадении 304 без обращения к пирамиде
+    """
+    map_obj = await _map(db, map_id)
+    try:
+        stat_result = os.stat(map_obj.file_path)
+    except (OSError, TypeError):
+        raise HTTPException(status_code=404, detail="Файл карты не найден")
+
+    etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}-{z}-{x}-{y}"'
+    if not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    pyramid = await map_pyramid(map_obj)
+    tile = await asyncio.to_thread(pyramid.tile, z, x, y)
+    if tile is None:
+        raise HTTPException(status_code=404, detail="Тайл вне карты")
+    # Файл мог смениться между stat и построением: ETag — по версии, из которой собран тайл
+    mtime_ns, size = pyramid.signature
+    etag = f'"{mtime_ns:x}-{size:x}-{z}-{x}-{y}"'
+    return conditional_response(request, tile, etag, media_type="image/png")
@@ -1,15 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import FileResponse
-from sqlalchemy.orm import Session
-from typing import List
+import asyncio
 
+from fastapi import APIRouter, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from app.cache import conditional_response, not_modified
 from app.database import get_db
-from app.schemas import Robot, RobotBase, Map
+from app.events import positions
+from app.routers.maps import map_pyramid, tiles_response
+from app.schemas import Robot, RobotBase, Map, MapTiles, RobotPositionBatch, RobotPositionBatchResult, RobotTrack
 from app.services.robot_service import (
-    get_all_robots, get_available_robots, 
-    update_robot_status, update_robot_position,
+    get_all_robots, get_all_robots_json, get_available_robots_json,
+    update_robot_status, update_robot_position, update_robot_positions,
     create_robot
 )
+from app.services.telemetry_service import get_robot_track
 
 import os
 
@@ -17,96 +23,179 @@ router = APIRouter(prefix="/robots", tags=["robots"])
 
 
 @router.post("/", response_model=Robot)
-def create_new_robot(robot: RobotBase, db: Session = Depends(get_db)):
+async def create_new_robot(robot: RobotBase, db: AsyncSession = Depends(get_db)):
     """Создание нового робота"""
     try:
-        return create_robot(db, robot)
+        return await create_robot(db, robot)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/", response_model=List[Robot])
-def read_robots(
+async def read_robots(
+    request: Request,
     skip: int = 0, 
     limit: int = 100, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Получение списка всех роботов"""
-    return get_all_robots(db, skip=skip, limit=limit)
+    """Получение списка всех роботов (готовый JSON из кэша; If-None-Match -> 304)"""
+    return conditional_response(request, await get_all_robots_json(db, skip=skip, limit=limit))
 
 
 @router.get("/available", response_model=List[Robot])
-def read_available_robots(db: Session = Depends(get_db)):
-    """Получение списка доступных (IDLE) роботов"""
-    return get_available_robots(db)
+async def read_available_robots(request: Request, db: AsyncSession = Depends(get_db)):
+    """Получение списка доступных (IDLE) роботов (готовый JSON из кэша; If-None-Match -> 304)"""
+    return conditional_response(request, await get_available_robots_json(db))
+
+@router.post("/positions", response_model=RobotPositionBatchResult)
+async def update_robot_positions_endpoint(batch: RobotPositionBatch, db: AsyncSession = Depends(get_db)):
+    """
+    Пакетное обновление позиций (для эмулятора): отметки многих роботов,
+    по несколько на робота, применяются одной транзакцией.
+    Неизвестные роботы пропускаются и перечисляются в ответе.
+    """
+    try:
+        return await update_robot_positions(db, batch.positions)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.websocket("/ws")
+async def robot_positions_ws(
+    websocket: WebSocket,
+    map_id: Optional[int] = None,
+    robot_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Поток позиций роботов (фильтр по карте или роботу).
+    Сначала приходит снимок {"type": "snapshot"}, затем только изменения
+    {"type": "positions"}; рассылка идёт из памяти, без запросов к БД.
+    """
+    await websocket.accept()
+    if not positions.loaded:
+        # Позиции в памяти заполняются из БД один раз на процесс
+        positions.load(await get_all_robots(db, 0, None))
+    await db.close()
+
+    subscriber = positions.subscribe(map_id, robot_id)
+    receiver = asyncio.create_task(websocket.receive())
+    try:
+        await websocket.send_json({"type": "snapshot", "robots": positions.snapshot(map_id, robot_id)})
+        while True:
+            batch = asyncio.create_task(subscriber.next_batch())
+            done, _ = await asyncio.wait({batch, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if batch in done:
+                await websocket.send_json({"type": "positions", "robots": batch.result()})
+            else:
+                batch.cancel()
+            # Входящие сообщения не используются, ждём от клиента только закрытия
+            if receiver in done:
+                if receiver.result()["type"] == "websocket.disconnect":
+                    break
+                receiver = asyncio.create_task(websocket.receive())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiver.cancel()
+        positions.unsubscribe(subscriber)
 
 @router.get("/{robot_id}", response_model=Robot)
-def read_robot(robot_id: int, db: Session = Depends(get_db)):
-    """Получение робота по ID"""
+async def read_robot(robot_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """Получение робота по ID (If-None-Match -> 304)"""
     from app.services.robot_service import get_robot
     
-    robot = get_robot(db, robot_id)
+    robot = await get_robot(db, robot_id)
     if not robot:
         raise HTTPException(status_code=404, detail="Робот не найден")
-    return robot
+    return conditional_response(request, Robot.model_validate(robot).model_dump_json().encode())
 
-@router.get("/{robot_id}/map", response_model=Map)
-def get_robot_map(robot_id: int, db: Session = Depends(get_db)):
-    """Получение карты робота по его ID"""
-    from app.services.robot_service import get_robot
-    robot = get_robot(db, robot_id)
-    if not robot:
+@router.get("/{robot_id}/telemetry", response_model=RobotTrack)
+async def read_robot_track(
+    robot_id: int,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    resolution: Optional[float] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    История позиций робота для воспроизведения: окно [start, end) в unix-времени
+    (по умолчанию последний час), по одной отметке на resolution секунд
+    (шаг увеличивается, если точек получается больше TRACK_MAX_POINTS)
+    """
+    try:
+        return await get_robot_track(db, robot_id, start, end, resolution)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _robot_map(db: AsyncSession, robot_id: int) -> Map:
+    """Карта робота: робот и карта одним запросом с JOIN (или из памяти и кэша карт)"""
+    from app.services.map_service import get_robot_map_info
+    found = await get_robot_map_info(db, robot_id)
+    if found is None:
         raise HTTPException(status_code=404, detail="Робот не найден")
     
-    if not robot.current_map_id:
+    map_id, map_obj = found
+    if not map_id:
         raise HTTPException(status_code=404, detail="У робота нет назначенной карты")
-    
-    from app.services.map_service import get_map
-    map_obj = get_map(db, robot.current_map_id)
     if not map_obj:
         raise HTTPException(status_code=404, detail="Карта не найдена")
-    
     return map_obj
 
+@router.get("/{robot_id}/map", response_model=Map)
+async def get_robot_map(robot_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """Получение карты робота по его ID (If-None-Match -> 304)"""
+    map_obj = await _robot_map(db, robot_id)
+    return conditional_response(request, map_obj.model_dump_json().encode())
+
 @router.get("/{robot_id}/map/image")
-def get_robot_map_image(robot_id: int, db: Session = Depends(get_db)):
-    """Получение файла карты робота"""
-    from app.services.robot_service import get_robot
-    robot = get_robot(db, robot_id)
-    if not robot:
-        raise HTTPException(status_code=404, detail="Робот не найден")
+async def get_robot_map_image(robot_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Получение файла карты робота. ETag — по времени изменения и размеру
+    файла: при совпадении с If-None-Match отдаётся 304 без чтения файла
+    """
+    map_obj = await _robot_map(db, robot_id)
     
-    if not robot.current_map_id:
-        raise HTTPException(status_code=404, detail="У робота нет назначенной карты")
-    
-    from app.services.map_service import get_map
-    map_obj = get_map(db, robot.current_map_id)
-    if not map_obj:
-        raise HTTPException(status_code=404, detail="Карта не найдена")
-    
-    # Проверяем существование файла
-    if not os.path.exists(map_obj.file_path):
+    # Проверяем существование файла (stat нужен и для ETag)
+    try:
+        stat_result = os.stat(map_obj.file_path)
+    except (OSError, TypeError):
         raise HTTPException(status_code=404, detail="Файл карты не найден")
     
+    etag = f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    
     # Отдаём файл как изображение PNG
     return FileResponse(
         map_obj.file_path,
         media_type="image/png",
-        filename=f"map_{map_obj.id}.png"
+        filename=f"map_{map_obj.id}.png",
+        headers=headers,
+        stat_result=stat_result,
     )
 
+@router.get("/{robot_id}/map/tiles", response_model=MapTiles)
+async def get_robot_map_tiles(robot_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    Пирамида тайлов карты робота: сами тайлы запрашиваются по
+    /maps/{map_id}/tiles/{z}/{x}/{y}, только видимые на экране
+    """
+    map_obj = await _robot_map(db, robot_id)
+    return tiles_response(request, map_obj, await map_pyramid(map_obj))
+
 @router.patch("/{robot_id}/occupy", response_model=Robot)
-def occupy_robot(robot_id: int, db: Session = Depends(get_db)):
+async def occupy_robot(robot_id: int, db: AsyncSession = Depends(get_db)):
     """Занять робота (сделать BUSY)"""
     try:
-        return update_robot_status(db, robot_id, "BUSY")
+        return await update_robot_status(db, robot_id, "BUSY")
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.patch("/{robot_id}/position", response_model=Robot)
-def update_robot_position_endpoint(robot_id: int, x: float, y: float, db: Session = Depends(get_db)):
+async def update_robot_position_endpoint(robot_id: int, x: float, y: float, db: AsyncSession = Depends(get_db)):
     """Обновление позиции робота (для эмулятора)"""
     try:
-        return update_robot_position(db, robot_id, x, y)
+        return await update_robot_position(db, robot_id, x, y)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
@@ -1,34 +1,62 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
 from app.schemas import Trajectory, TrajectoryCreate
 from app.services.trajectory_service import (
-    create_trajectory, get_trajectory_by_request
+    create_trajectory, create_trajectory_binary, get_trajectory_by_request, get_trajectory_blob,
+    get_trajectory_text_chunks
 )
-from app.services.transport_request_service import update_request_status
+from app.trajectory_codec import MEDIA_TYPE
 
 router = APIRouter(prefix="/trajectories", tags=["trajectories"])
 
 
 @router.post("/", response_model=Trajectory)
-def create_new_trajectory(trajectory: TrajectoryCreate, db: Session = Depends(get_db)):
-    """Создание новой траектории (для OCP-планировщика)"""
+async def create_new_trajectory(trajectory: TrajectoryCreate, db: AsyncSession = Depends(get_db)):
+    """Создание новой траектории (для OCP-планировщика); заявка переходит в READY в той же транзакции"""
     try:
-        # Создаем траекторию
-        new_trajectory = create_trajectory(db, trajectory)
-        
-        # Обновляем статус заявки на READY
-        update_request_status(db, trajectory.request_id, 'READY')
-        
-        return new_trajectory
+        return await create_trajectory(db, trajectory)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.post("/binary", status_code=201)
+async def create_new_trajectory_binary(request_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    """Создание траектории в двоичном формате (тело — app/trajectory_codec.py)"""
+    data = await request.body()
+    try:
+        trajectory = await create_trajectory_binary(db, request_id, data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"id": trajectory.id, "request_id": trajectory.request_id, "size": len(data)}
+
+@router.get("/request/{request_id}/binary")
+async def read_trajectory_binary(request_id: int, db: AsyncSession = Depends(get_db)):
+    """Получение траектории по ID заявки в двоичном формате"""
+    try:
+        data = await get_trajectory_blob(db, request_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if data is None:
+        raise HTTPException(status_code=404, detail="Траектория еще не рассчитана")
+    return Response(content=data, media_type=MEDIA_TYPE)
+
+@router.get("/request/{request_id}/text")
+async def read_trajectory_text(request_id: int, db: AsyncSession = Depends(get_db)):
+    """Получение траектории строкой "x:..,y:..;..." (отдаётся потоком, по частям)"""
+    try:
+        chunks = await get_trajectory_text_chunks(db, request_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if chunks is None:
+        raise HTTPException(status_code=404, detail="Траектория еще не рассчитана")
+    return StreamingResponse(chunks, media_type="text/plain")
+
 @router.get("/request/{request_id}", response_model=Trajectory)
-def read_trajectory_by_request(request_id: int, db: Session = Depends(get_db)):
+async def read_trajectory_by_request(request_id: int, db: AsyncSession = Depends(get_db)):
     """Получение траектории по ID заявки"""
-    trajectory = get_trajectory_by_request(db, request_id)
+    trajectory = await get_trajectory_by_request(db, request_id)
     if not trajectory:
         raise HTTPException(status_code=404, detail="Траектория еще не рассчитана")
     return trajectory
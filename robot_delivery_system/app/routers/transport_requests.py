@@ -1,119 +1,203 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+import json
+from datetime import datetime
 
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+
+from app import fast_json
+from app.cache import conditional_response
 from app.database import get_db
-from app.schemas import TransportRequest, TransportRequestCreate
+from app.events import broker, LONG_POLL_TIMEOUT, SSE_HEARTBEAT
+from app.schemas import TransportRequest, TransportRequestCreate, ClaimedRequest, RequestEventFeed
 from app.services.transport_request_service import (
-    create_transport_request, get_transport_request, 
-    get_user_requests, update_request_status
+    create_transport_request, get_transport_request, get_all_requests,
+    get_user_requests, update_request_status, transition_request, claim_pending_requests, encode_cursor
 )
-from app.services.robot_service import update_robot_status
 
 router = APIRouter(prefix="/requests", tags=["transport_requests"])
 
+# Заголовок ответа с курсором следующей страницы
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Наибольший размер страницы списков заявок
+MAX_PAGE_SIZE = 1000
+
+
+_request_list_adapter = TypeAdapter(List[TransportRequest])
+
+
+def _page_response(request: Request, page: list, limit: int) -> Response:
+    """
+    Страница заявок с ETag (If-None-Match -> 304). Полная страница — возможно,
+    есть следующая: её курсор отдаётся в заголовке
+    """
+    headers = {NEXT_CURSOR_HEADER: encode_cursor(page[-1])} if len(page) == limit else None
+    if fast_json.enabled():
+        # Страница прочитана кортежами столбцов (rows=True)
+        body = fast_json.dump_rows(page, fast_json.REQUEST_FIELDS)
+    else:
+        body = _request_list_adapter.dump_json(_request_list_adapter.validate_python(page, from_attributes=True))
+    return conditional_response(request, body, headers=headers)
+
 
 @router.post("/", response_model=TransportRequest, status_code=status.HTTP_201_CREATED)
-def create_request(request: TransportRequestCreate, db: Session = Depends(get_db)):
-    """Создание новой заявки на перевозку"""
+async def create_request(request: TransportRequestCreate, db: AsyncSession = Depends(get_db)):
+    """Создание новой заявки на перевозку (робот занимается в той же транзакции)"""
     # user_id передается в теле запроса
     try:
-        # Создаем заявку
-        transport_request = create_transport_request(db, request)
-        
-        # Автоматически занимаем робота
-        update_robot_status(db, request.robot_id, "BUSY")
-        
-        return transport_request
+        return await create_transport_request(db, request)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/", response_model=List[TransportRequest])
-def get_all_requests(
+async def read_all_requests(
+    request: Request,
     skip: int = 0,
-    limit: int = 100,
-    db: Session = Depends(get_db)
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    status: Optional[List[str]] = Query(None),
+    robot_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    order: str = Query("asc", pattern="^(asc|desc)$"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Получение списка заявок с фильтрами по статусу, роботу, пользователю
+    и времени создания, по порядку (created_at, id). Если страница полная,
+    курсор следующей приходит в заголовке X-Next-Cursor — его передают
+    параметром cursor с теми же фильтрами.
+    """
+    try:
+        page = await get_all_requests(
+            db, skip=skip, limit=limit, statuses=status, robot_id=robot_id, user_id=user_id,
+            created_from=created_from, created_to=created_to, cursor=cursor,
+            descending=order == "desc", rows=fast_json.enabled(),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _page_response(request, page, limit)
+
+@router.post("/claim", response_model=List[ClaimedRequest])
+async def claim_requests(limit: int = Query(1, ge=1, le=100), db: AsyncSession = Depends(get_db)):
+    """Выдача самых старых PENDING заявок планировщику (атомарно переводит их в PLANNING)"""
+    return await claim_pending_requests(db, limit)
+
+@router.get("/events", response_model=RequestEventFeed)
+async def poll_request_events(
+    after: Optional[int] = None,
+    status: Optional[List[str]] = Query(None),
+    robot_id: Optional[int] = None,
+    request_id: Optional[int] = None,
+    timeout: float = Query(LONG_POLL_TIMEOUT, ge=0, le=60),
+):
+    """
+    Long-poll ленты переходов статусов (без обращения к БД).
+    Без after сразу возвращает текущий курсор; с after ждёт до timeout секунд
+    первого подходящего события. reset == True — события потеряны, нужно
+    перечитать заявки целиком.
+    """
+    if after is None:
+        return {"last_id": broker.last_id, "reset": False, "events": []}
+    events, last_id, reset = await broker.listen(after, timeout, status, robot_id, request_id)
+    return {"last_id": last_id, "reset": reset, "events": events}
+
+@router.get("/events/stream")
+async def stream_request_events(
+    request: Request,
+    after: Optional[int] = None,
+    status: Optional[List[str]] = Query(None),
+    robot_id: Optional[int] = None,
+    request_id: Optional[int] = None,
+    last_event_id: Optional[int] = Header(None),
 ):
-    """Получение списка всех заявок"""
-    from app import models
-    
-    return db.query(models.TransportRequest).offset(skip).limit(limit).all()
+    """Server-Sent Events: переходы статусов заявок (поддерживает Last-Event-ID)"""
+    cursor = last_event_id if last_event_id is not None else after
+    if cursor is None:
+        cursor = broker.last_id
+
+    async def event_stream():
+        nonlocal cursor
+        yield "retry: 2000\n\n"
+        while not await request.is_disconnected():
+            events, cursor, reset = await broker.listen(cursor, SSE_HEARTBEAT, status, robot_id, request_id)
+            if reset:
+                yield f"id: {cursor}\nevent: reset\ndata: {{}}\n\n"
+            for item in events:
+                yield f"id: {item['id']}\nevent: status\ndata: {json.dumps(item)}\n\n"
+            if not events and not reset:
+                yield ": ping\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @router.get("/user/{user_id}", response_model=List[TransportRequest])
-def read_user_requests(user_id: int, db: Session = Depends(get_db)):
-    """Получение заявок пользователя по его ID"""
-    return get_user_requests(db, user_id)
+async def read_user_requests(
+    user_id: int,
+    request: Request,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    status: Optional[List[str]] = Query(None),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Получение заявок пользователя по его ID (новые первыми; следующая страница — X-Next-Cursor)"""
+    try:
+        page = await get_user_requests(db, user_id, limit=limit, cursor=cursor, statuses=status,
+                                       rows=fast_json.enabled())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _page_response(request, page, limit)
 
 @router.get("/{request_id}", response_model=TransportRequest)
-def read_request(request_id: int, db: Session = Depends(get_db)):
-    """Получение заявки по ID"""
-    request = get_transport_request(db, request_id)
+async def read_request(request_id: int, http_request: Request, db: AsyncSession = Depends(get_db)):
+    """Получение заявки по ID (If-None-Match -> 304)"""
+    request = await get_transport_request(db, request_id)
     if not request:
         raise HTTPException(status_code=404, detail="Заявка не найдена")
-    return request
+    return conditional_response(http_request, TransportRequest.model_validate(request).model_dump_json().encode())
 
 @router.patch("/{request_id}/status", response_model=TransportRequest)
-def update_status(request_id: int, status: str, db: Session = Depends(get_db)):
-    """Обновление статуса заявки (для пользователя и планировщика)"""
+async def update_status(request_id: int, status: str, expected: Optional[List[str]] = Query(None),
+                        db: AsyncSession = Depends(get_db)):
+    """
+    Обновление статуса заявки (для пользователя и планировщика);
+    expected — статусы, из которых переход допустим (иначе 400)
+    """
     try:
-        return update_request_status(db, request_id, status)
+        return await update_request_status(db, request_id, status, expected)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-@router.patch("/{request_id}/accept", response_model=TransportRequest)
-def accept_request(request_id: int, db: Session = Depends(get_db)):
-    """Принятие траектории и начало выполнения (IN_PROGRESS)"""
-    request = get_transport_request(db, request_id)
-    if not request:
-        raise HTTPException(status_code=404, detail="Заявка не найдена")
-    
-    # Проверяем, что заявка в состоянии READY
-    if request.status != 'READY':
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Заявка должна быть в состоянии READY, а не {request.status}"
-        )
-    
+async def _transition(request_id: int, status: str, db: AsyncSession):
+    """Переход из READY одной транзакцией: 404 — заявки нет, 400 — она не в READY"""
     try:
-        return update_request_status(db, request_id, 'IN_PROGRESS')
+        request = await transition_request(db, request_id, status, expected=('READY',))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-
-@router.patch("/{request_id}/reject", response_model=TransportRequest)
-def reject_request(request_id: int, db: Session = Depends(get_db)):
-    """Отклонение траектории (FAILED)"""
-    request = get_transport_request(db, request_id)
     if not request:
         raise HTTPException(status_code=404, detail="Заявка не найдена")
-    
-    # Проверяем, что заявка в состоянии READY
-    if request.status != 'READY':
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Заявку можно отклонить только в состоянии READY, а не {request.status}"
-        )
-    
-    try:
-        # Обновляем статус на FAILED
-        updated_request = update_request_status(db, request_id, 'FAILED')
-        
-        # Освобождаем робота
-        update_robot_status(db, request.robot_id, "IDLE")
-        
-        return updated_request
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    return request
+
+@router.patch("/{request_id}/accept", response_model=TransportRequest)
+async def accept_request(request_id: int, db: AsyncSession = Depends(get_db)):
+    """Принятие траектории и начало выполнения (IN_PROGRESS)"""
+    return await _transition(request_id, 'IN_PROGRESS', db)
+
+@router.patch("/{request_id}/reject", response_model=TransportRequest)
+async def reject_request(request_id: int, db: AsyncSession = Depends(get_db)):
+    """Отклонение траектории (FAILED); робот освобождается в той же транзакции"""
+    return await _transition(request_id, 'FAILED', db)
 
 @router.patch("/{request_id}/complete", response_model=TransportRequest)
-def complete_request(request_id: int, db: Session = Depends(get_db)):
-    """Завершение заявки (COMPLETED) - для эмулятора"""
+async def complete_request(request_id: int, db: AsyncSession = Depends(get_db)):
+    """Завершение заявки (COMPLETED) - для эмулятора; робот освобождается в той же транзакции"""
     try:
-        # Обновляем статус на COMPLETED
-        updated_request = update_request_status(db, request_id, 'COMPLETED')
-        
-        # Освобождаем робота
-        update_robot_status(db, updated_request.robot_id, "IDLE")
-        
-        return updated_request
+        return await update_request_status(db, request_id, 'COMPLETED')
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, HTTPException, status, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
 from app.database import get_db
@@ -10,17 +10,17 @@ router = APIRouter(prefix="/users", tags=["users"])
 
 
 @router.post("/register", response_model=User, status_code=status.HTTP_201_CREATED)
-def register(user: UserCreate, db: Session = Depends(get_db)):
+async def register(user: UserCreate, db: AsyncSession = Depends(get_db)):
     """Регистрация нового пользователя"""
     try:
-        return create_user(db, user)
+        return await create_user(db, user)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/login", response_model=User)
-def login(credentials: UserLogin, db: Session = Depends(get_db)):
+async def login(credentials: UserLogin, db: AsyncSession = Depends(get_db)):
     """Вход в систему - возвращает пользователя с его ID"""
-    user = get_user_by_username(db, credentials.username)
+    user = await get_user_by_username(db, credentials.username)
     
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
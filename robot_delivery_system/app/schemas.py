@@ -1,7 +1,7 @@
 # app/schemas.py
 
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 # Robot schemas
@@ -29,6 +29,31 @@ class Robot(RobotBase):
     class Config:
         from_attributes = True
 
+class RobotPosition(BaseModel):
+    """Отметка позиции робота; t — время отметки (unix, с), если известно"""
+    robot_id: int
+    x: float
+    y: float
+    t: Optional[float] = None
+
+class RobotPositionBatch(BaseModel):
+    """Позиции многих роботов одним запросом (по несколько отметок на робота)"""
+    positions: List[RobotPosition]
+
+class RobotPositionBatchResult(BaseModel):
+    updated: int
+    unknown: List[int] = []
+
+class RobotTrack(BaseModel):
+    """Прореженный трек робота: по одной отметке (t, x, y) на шаг resolution секунд"""
+    robot_id: int
+    start: float
+    end: float
+    resolution: float
+    t: List[float]
+    x: List[float]
+    y: List[float]
+
 # Map schemas
 class MapBase(BaseModel):
     name: str
@@ -44,6 +69,23 @@ class Map(MapBase):
     class Config:
         from_attributes = True
 
+class TileLevel(BaseModel):
+    """Уровень пирамиды тайлов: размер изображения и сетка тайлов"""
+    z: int
+    width: int
+    height: int
+    cols: int
+    rows: int
+
+class MapTiles(BaseModel):
+    """Пирамида тайлов карты: уровень max_zoom — исходный размер, каждый следующий вниз вдвое меньше"""
+    map_id: int
+    width: int
+    height: int
+    tile_size: int
+    max_zoom: int
+    levels: List[TileLevel]
+
 # User schemas
 class UserBase(BaseModel):
     username: str
@@ -81,6 +123,28 @@ class TransportRequest(TransportRequestBase):
     class Config:
         from_attributes = True
 
+class ClaimedRequest(TransportRequest):
+    """Заявка, выданная планировщику, с позицией робота и его картой"""
+    start_x: float = 0.0
+    start_y: float = 0.0
+    map_id: Optional[int] = None
+    map_file_path: Optional[str] = None
+
+class RequestEvent(BaseModel):
+    """Переход статуса заявки"""
+    id: int
+    request_id: int
+    robot_id: Optional[int] = None
+    status: str
+    old_status: Optional[str] = None
+    timestamp: float
+
+class RequestEventFeed(BaseModel):
+    """Ответ long-poll: события после курсора и новый курсор"""
+    last_id: int
+    reset: bool = False
+    events: List[RequestEvent] = []
+
 # Trajectory schemas
 class TrajectoryBase(BaseModel):
     request_id: int
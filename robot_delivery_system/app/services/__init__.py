@@ -1,11 +1,16 @@
 from .robot_service import (
     create_robot, get_robot, get_all_robots, get_available_robots,
-    update_robot, delete_robot, update_robot_position, update_robot_status
+    get_all_robots_json, get_available_robots_json,
+    update_robot, delete_robot, update_robot_position, update_robot_positions, update_robot_status
 )
-from .map_service import create_map, get_map, get_maps, delete_map
+from .map_service import create_map, get_map, get_map_info, get_robot_map_info, get_maps, delete_map
 from .user_service import create_user, get_user, get_user_by_email, get_users
 from .transport_request_service import (
-    create_transport_request, get_transport_request, get_user_requests,
-    update_request_status, cancel_request
+    create_transport_request, get_transport_request, get_all_requests, get_user_requests,
+    claim_pending_requests, update_request_status, transition_request, cancel_request
 )
-from .trajectory_service import create_trajectory, get_trajectory_by_request
\ No newline at end of file
+from .trajectory_service import (
+    create_trajectory, create_trajectory_binary, get_trajectory_by_request, get_trajectory_blob,
+    get_trajectory_text_chunks
+)
+from .telemetry_service import get_robot_track
\ No newline at end of file
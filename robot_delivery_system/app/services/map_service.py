@@ -1,9 +1,11 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import models
-from app.schemas import MapCreate
+from app.cache import maps
+from app.schemas import Map, MapCreate
 
 # create
-def create_map(db: Session, map_data: MapCreate):
+async def create_map(db: AsyncSession, map_data: MapCreate):
     """Создание новой карты"""
     db_map = models.Map(
         name=map_data.name,
@@ -11,23 +13,67 @@ def create_map(db: Session, map_data: MapCreate):
         file_path=map_data.file_path
     )
     db.add(db_map)
-    db.commit()
-    db.refresh(db_map)
+    await db.commit()
+    maps.invalidate()
+    await db.refresh(db_map)
     return db_map
 
 # read
-def get_map(db: Session, map_id: int):
+async def get_map(db: AsyncSession, map_id: int):
     """Получение карты по ID"""
-    return db.query(models.Map).filter(models.Map.id == map_id).first()
+    return await db.scalar(select(models.Map).where(models.Map.id == map_id))
 
-def get_maps(db: Session, skip: int = 0, limit: int = 100):
+async def get_map_info(db: AsyncSession, map_id: int):
+    """Карта по ID из кэша (схема Map, не объект сессии); None — карты нет"""
+    info = maps.get(map_id)
+    if info is None:
+        version = maps.version
+        db_map = await get_map(db, map_id)
+        if db_map is None:
+            return None
+        info = Map.model_validate(db_map)
+        maps.put(map_id, info, version)
+    return info
+
+async def get_robot_map_info(db: AsyncSession, robot_id: int):
+    """
+    Карта робота: (id карты или None, схема Map или None); None — робота нет.
+    Робот берётся из памяти, если состояние загружено, иначе робот и карта
+    читаются одним запросом с JOIN
+    """
+    from app.robot_state import robot_state
+    if robot_state.loaded:
+        robot = robot_state.get(robot_id)
+        if robot is None:
+            return None
+        if robot.current_map_id is None:
+            return None, None
+        return robot.current_map_id, await get_map_info(db, robot.current_map_id)
+
+    version = maps.version
+    row = (await db.execute(
+        select(models.Robot.current_map_id, models.Map)
+        .outerjoin(models.Map, models.Map.id == models.Robot.current_map_id)
+        .where(models.Robot.id == robot_id)
+    )).first()
+    if row is None:
+        return None
+    map_id, db_map = row
+    if db_map is None:
+        return map_id, None
+    info = Map.model_validate(db_map)
+    maps.put(map_id, info, version)
+    return map_id, info
+
+async def get_maps(db: AsyncSession, skip: int = 0, limit: int = 100):
     """Получение списка карт"""
-    return db.query(models.Map).offset(skip).limit(limit).all()
+    result = await db.scalars(select(models.Map).offset(skip).limit(limit))
+    return result.all()
 
 # update
-def update_map(db: Session, map_id: int, map_data: dict):
+async def update_map(db: AsyncSession, map_id: int, map_data: dict):
     """Обновление данных карты"""
-    db_map = get_map(db, map_id)
+    db_map = await get_map(db, map_id)
     if not db_map:
         raise ValueError(f"Карта с ID {map_id} не найдена")
     
@@ -35,25 +81,27 @@ def update_map(db: Session, map_id: int, map_data: dict):
         if hasattr(db_map, key):
             setattr(db_map, key, value)
     
-    db.commit()
-    db.refresh(db_map)
+    await db.commit()
+    maps.invalidate()
+    await db.refresh(db_map)
     return db_map
 
 # delete
-def delete_map(db: Session, map_id: int):
+async def delete_map(db: AsyncSession, map_id: int):
     """Удаление карты"""
-    db_map = get_map(db, map_id)
+    db_map = await get_map(db, map_id)
     if not db_map:
         raise ValueError(f"Карта с ID {map_id} не найдена")
     
     # Проверяем, есть ли роботы на этой карте
-    robots_on_map = db.query(models.Robot).filter(
+    robots_on_map = await db.scalar(select(models.Robot.id).where(
         models.Robot.current_map_id == map_id
-    ).first()
+    ).limit(1))
     
     if robots_on_map:
         raise ValueError(f"Невозможно удалить карту {map_id}: на ней находятся роботы")
     
-    db.delete(db_map)
-    db.commit()
-    return db_map
\ No newline at end of file
+    await db.delete(db_map)
+    await db.commit()
+    maps.invalidate()
+    return db_map
@@ -1,10 +1,20 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
-from app import models
-from app.schemas import RobotCreate, RobotUpdate
+import time
+from typing import Dict, List, Sequence
+from pydantic import TypeAdapter
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import fast_json, models
+from app.events import position_item, positions, stage_robot_updates
+from app.cache import robot_lists
+from app.robot_state import robot_state
+from app.telemetry import telemetry
+from app.schemas import Robot, RobotCreate, RobotUpdate, RobotPosition
+
+# Максимум отметок позиций в одном пакетном запросе
+MAX_POSITION_BATCH = 20000
 
 # create
-def create_robot(db: Session, robot: RobotCreate):
+async def create_robot(db: AsyncSession, robot: RobotCreate):
     """Создание нового робота"""
     db_robot = models.Robot(
         name=robot.name,
@@ -14,81 +24,239 @@ def create_robot(db: Session, robot: RobotCreate):
         status=robot.status if hasattr(robot, 'status') else 'IDLE'
     )
     db.add(db_robot)
-    db.commit()
-    db.refresh(db_robot)
-    return db_robot
+    await db.commit()
+    await db.refresh(db_robot)
+    return _current(db_robot)
 
 # read
-def get_robot(db: Session, robot_id: int):
-    """Получение робота по ID"""
-    return db.query(models.Robot).filter(models.Robot.id == robot_id).first()
+async def _load_robot(db: AsyncSession, robot_id: int):
+    """Робот из БД (объект сессии — для изменения)"""
+    return await db.scalar(select(models.Robot).where(models.Robot.id == robot_id))
+
+async def _load_missing(db: AsyncSession, robot_ids) -> None:
+    """Догружает в память роботов, добавленных в БД в обход API"""
+    missing = [robot_id for robot_id in robot_ids if robot_id not in robot_state]
+    if missing:
+        for robot in (await db.scalars(select(models.Robot).where(models.Robot.id.in_(missing)))).all():
+            robot_state.upsert(robot)
+
+def _current(db_robot):
+    """После COMMIT отдаём робота из памяти: позиция в БД может быть ещё старой"""
+    if robot_state.loaded:
+        robot_state.upsert(db_robot)
+        # Новый робот появляется в памяти только сейчас, уже после сброса кэша при COMMIT
+        robot_lists.invalidate()
+        return robot_state.get(db_robot.id)
+    return db_robot
+
+async def get_robot(db: AsyncSession, robot_id: int):
+    """Получение робота по ID (из памяти, если состояние роботов загружено)"""
+    if not robot_state.loaded:
+        return await _load_robot(db, robot_id)
+    await _load_missing(db, [robot_id])
+    return robot_state.get(robot_id)
 
-def get_all_robots(db: Session, skip: int = 0, limit: int = 100):
+def _robot_query(rows: bool):
+    """SELECT роботов: объекты ORM или (rows) только столбцы схемы Robot, без identity map"""
+    if rows:
+        return select(*(getattr(models.Robot, name) for name in fast_json.ROBOT_FIELDS))
+    return select(models.Robot)
+
+async def get_all_robots(db: AsyncSession, skip: int = 0, limit: int = 100, rows: bool = False):
     """Получение списка роботов"""
-    return db.query(models.Robot).offset(skip).limit(limit).all()
+    if robot_state.loaded:
+        return robot_state.rows(skip, limit)
+    result = await db.execute(_robot_query(rows).offset(skip).limit(limit))
+    return result.all() if rows else result.scalars().all()
 
-def get_available_robots(db: Session):
+async def get_available_robots(db: AsyncSession, rows: bool = False):
     """Получение доступных роботов (IDLE)"""
-    return db.query(models.Robot).filter(models.Robot.status == 'IDLE').all()
+    if robot_state.loaded:
+        return robot_state.rows(status='IDLE')
+    result = await db.execute(_robot_query(rows).where(models.Robot.status == 'IDLE'))
+    return result.all() if rows else result.scalars().all()
+
+# Готовые JSON-ответы списков. Кэш сбрасывается после каждого COMMIT,
+# изменившего роботов (app/events.py), и при обновлении позиций в памяти
+_robot_list_adapter = TypeAdapter(List[Robot])
+
+async def _cached_list(key, load) -> bytes:
+    body = robot_lists.get(key)
+    if body is None:
+        version = robot_lists.version
+        if fast_json.enabled():
+            body = fast_json.dump_rows(await load(True), fast_json.ROBOT_FIELDS)
+        else:
+            robots = _robot_list_adapter.validate_python(await load(False), from_attributes=True)
+            body = _robot_list_adapter.dump_json(robots)
+        robot_lists.put(key, body, version)
+    return body
+
+async def get_all_robots_json(db: AsyncSession, skip: int = 0, limit: int = 100) -> bytes:
+    """Список роботов в виде готового JSON (из кэша, если он не сброшен)"""
+    return await _cached_list(("all", skip, limit), lambda rows: get_all_robots(db, skip, limit, rows))
+
+async def get_available_robots_json(db: AsyncSession) -> bytes:
+    """Доступные роботы в виде готового JSON (из кэша, если он не сброшен)"""
+    return await _cached_list(("available",), lambda rows: get_available_robots(db, rows))
 
 # update
-def update_robot(db: Session, robot_id: int, robot_update: RobotUpdate):
+async def update_robot(db: AsyncSession, robot_id: int, robot_update: RobotUpdate):
     """Обновление данных робота"""
-    db_robot = get_robot(db, robot_id)
+    db_robot = await _load_robot(db, robot_id)
     if not db_robot:
         raise ValueError(f"Робот с ID {robot_id} не найден")
     
     update_data = robot_update.dict(exclude_unset=True)
+    if robot_state.loaded and {'current_position_x', 'current_position_y'} & set(update_data):
+        # Позиция живёт в памяти; в БД её запишет фоновая запись
+        robot_state.upsert(db_robot)
+        current = robot_state.get(robot_id)
+        robot_state.set_position(
+            robot_id,
+            update_data.pop('current_position_x', current.current_position_x),
+            update_data.pop('current_position_y', current.current_position_y),
+        )
     for key, value in update_data.items():
         setattr(db_robot, key, value)
     
-    db.commit()
-    db.refresh(db_robot)
-    return db_robot
+    await db.commit()
+    await db.refresh(db_robot)
+    return _current(db_robot)
 
-def update_robot_position(db: Session, robot_id: int, x: float, y: float):
-    """Обновление позиции робота"""
-    db_robot = get_robot(db, robot_id)
+async def update_robot_position(db: AsyncSession, robot_id: int, x: float, y: float):
+    """
+    Обновление позиции робота. Если состояние роботов загружено, позиция
+    пишется только в память и сразу уходит подписчикам; в БД её запишет
+    фоновая запись вместе с остальными.
+    """
+    if robot_state.loaded:
+        await _load_missing(db, [robot_id])
+        row = robot_state.set_position(robot_id, x, y)
+        if row is None:
+            raise ValueError(f"Робот с ID {robot_id} не найден")
+        telemetry.record(robot_id, x, y)
+        _publish_positions([row])
+        return row
+    
+    db_robot = await _load_robot(db, robot_id)
     if not db_robot:
         raise ValueError(f"Робот с ID {robot_id} не найден")
     
     db_robot.current_position_x = x
     db_robot.current_position_y = y
-    db.commit()
-    db.refresh(db_robot)
+    await db.commit()
+    telemetry.record(robot_id, x, y)
+    await db.refresh(db_robot)
     return db_robot
 
-def update_robot_status(db: Session, robot_id: int, status: str):
+async def update_robot_positions(db: AsyncSession, samples: Sequence[RobotPosition]) -> Dict:
+    """
+    Пакетное обновление позиций: одна транзакция на весь пакет.
+    Из нескольких отметок робота применяется последняя (по t, если оно
+    задано, иначе по порядку в пакете). Роботы загружаются одним SELECT,
+    позиции пишутся одним UPDATE с executemany. Если состояние роботов
+    загружено, пакет применяется в памяти, без обращения к БД.
+    """
+    if len(samples) > MAX_POSITION_BATCH:
+        raise ValueError(f"Слишком много позиций в пакете: {len(samples)} (максимум {MAX_POSITION_BATCH})")
+
+    # В историю идут все отметки пакета, в текущую позицию — последняя
+    latest = {}
+    for sample in samples:
+        prev = latest.get(sample.robot_id)
+        if prev is None or sample.t is None or prev.t is None or sample.t >= prev.t:
+            latest[sample.robot_id] = sample
+    if not latest:
+        return {"updated": 0, "unknown": []}
+
+    if robot_state.loaded:
+        await _load_missing(db, latest)
+        updated, unknown = [], []
+        for robot_id, sample in latest.items():
+            row = robot_state.set_position(robot_id, sample.x, sample.y)
+            if row is None:
+                unknown.append(robot_id)
+            else:
+                updated.append(row)
+        _record_samples(samples, {row.id for row in updated})
+        _publish_positions(updated)
+        return {"updated": len(updated), "unknown": sorted(unknown)}
+
+    rows = (await db.execute(
+        select(models.Robot.id, models.Robot.current_map_id, models.Robot.status)
+        .where(models.Robot.id.in_(latest))
+    )).all()
+    known = {row.id: row for row in rows}
+    unknown = sorted(set(latest) - set(known))
+    if not known:
+        await db.commit()
+        return {"updated": 0, "unknown": unknown}
+
+    await db.execute(update(models.Robot), [
+        {"id": robot_id, "current_position_x": latest[robot_id].x, "current_position_y": latest[robot_id].y}
+        for robot_id in known
+    ])
+    # Объекты роботов не загружались, поэтому подписчикам позиции передаём явно
+    stage_robot_updates(db, (
+        position_item(robot_id, row.current_map_id, latest[robot_id].x, latest[robot_id].y, row.status)
+        for robot_id, row in known.items()
+    ))
+    await db.commit()
+    _record_samples(samples, known)
+    return {"updated": len(known), "unknown": unknown}
+
+def _record_samples(samples: Sequence[RobotPosition], robot_ids) -> None:
+    """Отметки известных роботов — в историю позиций, по времени отметки"""
+    if not telemetry.active:
+        return
+    now = time.time()
+    for sample in sorted(samples, key=lambda s: now if s.t is None else s.t):
+        if sample.robot_id in robot_ids:
+            telemetry.record(sample.robot_id, sample.x, sample.y, now if sample.t is None else sample.t)
+
+def _position_item(row) -> Dict:
+    return position_item(row.id, row.current_map_id, row.current_position_x,
+                         row.current_position_y, row.status)
+
+def _publish_positions(rows) -> None:
+    """Позиции, изменённые только в памяти: подписчикам и сброс кэша списков"""
+    if rows:
+        robot_lists.invalidate()
+    for row in rows:
+        positions.publish(_position_item(row))
+
+async def update_robot_status(db: AsyncSession, robot_id: int, status: str):
     """Обновление статуса робота"""
     valid_statuses = ['IDLE', 'BUSY']
     if status not in valid_statuses:
         raise ValueError(f"Неверный статус. Допустимые: {valid_statuses}")
     
-    db_robot = get_robot(db, robot_id)
+    db_robot = await _load_robot(db, robot_id)
     if not db_robot:
         raise ValueError(f"Робот с ID {robot_id} не найден")
     
     db_robot.status = status
-    db.commit()
-    db.refresh(db_robot)
-    return db_robot
+    await db.commit()
+    await db.refresh(db_robot)
+    return _current(db_robot)
 
 # delete
-def delete_robot(db: Session, robot_id: int):
+async def delete_robot(db: AsyncSession, robot_id: int):
     """Удаление робота (только если нет активных заявок)"""
-    db_robot = get_robot(db, robot_id)
+    db_robot = await _load_robot(db, robot_id)
     if not db_robot:
         raise ValueError(f"Робот с ID {robot_id} не найден")
     
     # Проверяем, есть ли у робота активные заявки
-    active_requests = db.query(models.TransportRequest).filter(
+    active_requests = await db.scalar(select(models.TransportRequest.id).where(
         models.TransportRequest.robot_id == robot_id,
         models.TransportRequest.status.in_(['PENDING', 'PLANNING', 'IN_PROGRESS'])
-    ).first()
+    ).limit(1))
     
     if active_requests:
         raise ValueError(f"Невозможно удалить робота {robot_id}: есть активные заявки")
     
-    db.delete(db_robot)
-    db.commit()
+    await db.delete(db_robot)
+    await db.commit()
     return db_robot
@@ -0,0 +1,55 @@
+import asyncio
+import time
+from typing import Dict, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models
+from app.telemetry import TELEMETRY_CHUNK_SECONDS, decode_chunk, downsample, telemetry
+
+# Окно истории по умолчанию, секунды
+TRACK_DEFAULT_WINDOW = 3600.0
+# Самое длинное окно одного запроса, секунды
+TRACK_MAX_WINDOW = 7 * 86400.0
+# Максимум точек в ответе: шаг увеличивается, чтобы в него уложиться
+TRACK_MAX_POINTS = 5000
+# Знаков после запятой в ответе (координаты хранятся во float32)
+TRACK_DIGITS = 3
+
+# read
+async def get_robot_track(db: AsyncSession, robot_id: int, start: Optional[float] = None,
+                          end: Optional[float] = None, resolution: Optional[float] = None) -> Dict:
+    """
+    Трек робота за окно [start, end) (unix-время, с) с шагом resolution секунд.
+    Отрезки читаются одним диапазоном индекса (robot_id, t_start), к ним
+    добавляются ещё не записанные отрезки из памяти.
+    """
+    if end is None:
+        end = time.time()
+    if start is None:
+        start = end - TRACK_DEFAULT_WINDOW
+    if end <= start:
+        raise ValueError("Конец окна должен быть позже начала")
+    if end - start > TRACK_MAX_WINDOW:
+        raise ValueError(f"Слишком длинное окно: {end - start:.0f} с (максимум {TRACK_MAX_WINDOW:.0f} с)")
+    if resolution is not None and resolution <= 0:
+        raise ValueError("Шаг трека должен быть положительным")
+    resolution = max(resolution or 0.0, (end - start) / TRACK_MAX_POINTS)
+
+    table = models.RobotTelemetry
+    rows = (await db.execute(select(table.robot_id, table.t_start, table.samples).where(
+        table.robot_id == robot_id,
+        # Отрезок не длиннее TELEMETRY_CHUNK_SECONDS: нижняя граница ограничивает диапазон индекса
+        table.t_start >= start - TELEMETRY_CHUNK_SECONDS,
+        table.t_start < end,
+        table.t_end >= start,
+    ))).all()
+
+    def build():
+        chunks = [decode_chunk(row) for row in rows] + telemetry.pending(robot_id, start, end)
+        return [[round(v, TRACK_DIGITS) for v in column]
+                for column in downsample(chunks, start, end, resolution)]
+
+    # Распаковка и прореживание — вне event loop
+    t, x, y = await asyncio.to_thread(build)
+    return {"robot_id": robot_id, "start": start, "end": end, "resolution": resolution,
+            "t": t, "x": x, "y": y}
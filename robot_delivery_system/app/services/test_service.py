@@ -1,3 +1,3 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import or_
 from app import models
\ No newline at end of file
@@ -1,54 +1,89 @@
-from sqlalchemy.orm import Session
+import asyncio
+from typing import Iterator, Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import json
-from app import models
+from app import models, trajectory_codec
+from app.database import unit_of_work
 from app.schemas import TrajectoryCreate
 
-# create
-def create_trajectory(db: Session, trajectory: TrajectoryCreate):
-    """Создание траектории для заявки"""
-    # Проверяем, что заявка существует
-    request = db.query(models.TransportRequest).filter(
-        models.TransportRequest.id == trajectory.request_id
-    ).first()
+# Статусы заявки, в которых к ней можно записать траекторию
+PLANNABLE_STATUSES = ('PENDING', 'PLANNING')
+
+async def _get_request_without_trajectory(db: AsyncSession, request_id: int):
+    """
+    Заявка, ждущая траекторию: ещё без неё и в PENDING/PLANNING (иначе
+    ValueError — например, её отменили, пока планировщик считал). Заявка и
+    траектория проверяются одним SELECT с JOIN; строка заявки блокируется
+    до COMMIT, чтобы две траектории не записались одновременно
+    """
+    row = (await db.execute(
+        select(models.TransportRequest, models.Trajectory.id)
+        .outerjoin(models.Trajectory, models.Trajectory.request_id == models.TransportRequest.id)
+        .where(models.TransportRequest.id == request_id)
+        .with_for_update(of=models.TransportRequest)
+        .execution_options(populate_existing=True)
+    )).first()
     
-    if not request:
-        raise ValueError(f"Заявка с ID {trajectory.request_id} не найдена")
+    # Проверяем, что заявка существует
+    if row is None:
+        raise ValueError(f"Заявка с ID {request_id} не найдена")
     
     # Проверяем, что для этой заявки еще нет траектории
-    existing = db.query(models.Trajectory).filter(
-        models.Trajectory.request_id == trajectory.request_id
-    ).first()
-    
+    request, existing = row
     if existing:
-        raise ValueError(f"Для заявки {trajectory.request_id} уже существует траектория")
+        raise ValueError(f"Для заявки {request_id} уже существует траектория")
     
+    # Проверяем, что заявку не отменили и не перевели дальше
+    if request.status not in PLANNABLE_STATUSES:
+        raise ValueError(
+            f"Заявка должна быть в состоянии {' или '.join(PLANNABLE_STATUSES)}, а не {request.status}"
+        )
+    return request
+
+async def _add_trajectory(db: AsyncSession, request_id: int, **fields):
+    """Траектория и перевод заявки в READY — одной транзакцией"""
+    async with unit_of_work(db):
+        request = await _get_request_without_trajectory(db, request_id)
+        db_trajectory = models.Trajectory(request_id=request_id, **fields)
+        
+        # Обновляем статус заявки на READY
+        request.status = 'READY'
+        db.add(db_trajectory)
+    
+    # calculated_at выставляет БД
+    await db.refresh(db_trajectory)
+    return db_trajectory
+
+# create
+async def create_trajectory(db: AsyncSession, trajectory: TrajectoryCreate):
+    """Создание траектории для заявки"""
     # Преобразуем path_data в JSON строку
     if isinstance(trajectory.path_data, dict) or isinstance(trajectory.path_data, list):
         path_json = json.dumps(trajectory.path_data)
     else:
         path_json = trajectory.path_data
     
-    db_trajectory = models.Trajectory(
-        request_id=trajectory.request_id,
-        path_data=path_json
-    )
-    
-    # Обновляем статус заявки на READY
-    request.status = 'READY'
-    
-    db.add(db_trajectory)
-    db.commit()
-    db.refresh(db_trajectory)
-    return db_trajectory
+    return await _add_trajectory(db, trajectory.request_id, path_data=path_json)
+
+async def create_trajectory_binary(db: AsyncSession, request_id: int, data: bytes):
+    """Создание траектории в двоичном формате (app/trajectory_codec.py)"""
+    # Проверяем, что данные читаются, до записи в БД (разбор — вне event loop)
+    await asyncio.to_thread(trajectory_codec.decode, data)
+    return await _add_trajectory(db, request_id, path_blob=data)
 
 # read
-def get_trajectory_by_request(db: Session, request_id: int):
+async def get_trajectory_by_request(db: AsyncSession, request_id: int):
     """Получение траектории по ID заявки"""
-    trajectory = db.query(models.Trajectory).filter(
+    trajectory = await db.scalar(select(models.Trajectory).where(
         models.Trajectory.request_id == request_id
-    ).first()
+    ))
     
-    if trajectory and trajectory.path_data:
+    if trajectory and trajectory.path_data is None and trajectory.path_blob:
+        # Старые клиенты получают текстовое представление двоичной траектории
+        db.expunge(trajectory)
+        trajectory.path_data = await asyncio.to_thread(trajectory_codec.to_text, trajectory.path_blob)
+    elif trajectory and trajectory.path_data:
         try:
             trajectory.path_data = json.loads(trajectory.path_data)
         except:
@@ -56,11 +91,31 @@ def get_trajectory_by_request(db: Session, request_id: int):
     
     return trajectory
 
-def get_trajectory(db: Session, trajectory_id: int):
+async def get_trajectory_blob(db: AsyncSession, request_id: int) -> Optional[bytes]:
+    """Траектория заявки в двоичном формате (старые текстовые записи конвертируются)"""
+    row = (await db.execute(select(models.Trajectory.path_blob, models.Trajectory.path_data).where(
+        models.Trajectory.request_id == request_id
+    ))).first()
+    if not row:
+        return None
+    if row.path_blob:
+        return row.path_blob
+    return await asyncio.to_thread(trajectory_codec.from_text, row.path_data or "")
+
+async def get_trajectory_text_chunks(db: AsyncSession, request_id: int) -> Optional[Iterator[str]]:
+    """Траектория заявки строкой "x:..,y:..;..." по частям (данные читаются из БД сразу)"""
+    row = (await db.execute(select(models.Trajectory.path_blob, models.Trajectory.path_data).where(
+        models.Trajectory.request_id == request_id
+    ))).first()
+    if not row:
+        return None
+    if row.path_blob:
+        return await asyncio.to_thread(trajectory_codec.iter_text, row.path_blob)
+    return iter([row.path_data or ""])
+
+async def get_trajectory(db: AsyncSession, trajectory_id: int):
     """Получение траектории по ID"""
-    trajectory = db.query(models.Trajectory).filter(
-        models.Trajectory.id == trajectory_id
-    ).first()
+    trajectory = await db.get(models.Trajectory, trajectory_id)
     
     if trajectory and trajectory.path_data:
         try:
@@ -71,9 +126,9 @@ def get_trajectory(db: Session, trajectory_id: int):
     return trajectory
 
 # update
-def update_trajectory(db: Session, trajectory_id: int, path_data: dict):
+async def update_trajectory(db: AsyncSession, trajectory_id: int, path_data: dict):
     """Обновление траектории"""
-    trajectory = get_trajectory(db, trajectory_id)
+    trajectory = await get_trajectory(db, trajectory_id)
     if not trajectory:
         raise ValueError(f"Траектория с ID {trajectory_id} не найдена")
     
@@ -82,17 +137,17 @@ def update_trajectory(db: Session, trajectory_id: int, path_data: dict):
     else:
         trajectory.path_data = path_data
     
-    db.commit()
-    db.refresh(trajectory)
+    await db.commit()
+    await db.refresh(trajectory)
     return trajectory
 
 # delete
-def delete_trajectory(db: Session, trajectory_id: int):
+async def delete_trajectory(db: AsyncSession, trajectory_id: int):
     """Удаление траектории по ID"""
-    trajectory = get_trajectory(db, trajectory_id)
+    trajectory = await get_trajectory(db, trajectory_id)
     if not trajectory:
         raise ValueError(f"Траектория с ID {trajectory_id} не найдена")
     
-    db.delete(trajectory)
-    db.commit()
+    await db.delete(trajectory)
+    await db.commit()
     return trajectory
@@ -1,112 +1,282 @@
-from sqlalchemy.orm import Session
-from app import models
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional, Sequence, Tuple
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import fast_json, models
+from app.database import unit_of_work
+from app.robot_state import robot_state
 from app.schemas import TransportRequestCreate
 
+# Допустимые статусы заявки
+REQUEST_STATUSES = ['PENDING', 'PLANNING', 'READY', 'IN_PROGRESS', 'COMPLETED', 'FAILED']
+# Статусы, в которых заявка завершена и робот свободен
+FINAL_STATUSES = ('COMPLETED', 'FAILED')
+# Аренда заявки планировщиком: если за это время траектория не пришла
+# (планировщик упал), заявку из PLANNING забирает следующий, секунды
+PLANNING_LEASE = 300
+
 # create
-def create_transport_request(db: Session, request: TransportRequestCreate):
-    """Создание новой заявки на перевозку"""
-    # Проверяем, существует ли робот
-    robot = db.query(models.Robot).filter(models.Robot.id == request.robot_id).first()
-    if not robot:
-        raise ValueError(f"Робот с ID {request.robot_id} не найден")
-    
-    # Проверяем, доступен ли робот
-    if robot.status == 'BUSY':
-        raise ValueError(f"Робот {robot.name} уже занят")
-    
-    # Проверяем, существует ли пользователь
-    user = db.query(models.User).filter(models.User.id == request.user_id).first()
-    if not user:
-        raise ValueError(f"Пользователь с ID {request.user_id} не найден")
-    
-    # Создаем заявку
-    db_request = models.TransportRequest(
-        user_id=request.user_id,
-        robot_id=request.robot_id,
-        target_x=request.target_x,
-        target_y=request.target_y,
-        status='PENDING'
-    )
-    
-    # Меняем статус робота на BUSY
-    robot.status = 'BUSY'
+async def create_transport_request(db: AsyncSession, request: TransportRequestCreate):
+    """
+    Создание новой заявки на перевозку; робот становится BUSY в той же
+    транзакции. Робот и пользователь проверяются одним SELECT с JOIN,
+    строка робота блокируется до COMMIT, чтобы его не заняли дважды
+    """
+    async with unit_of_work(db):
+        row = (await db.execute(
+            select(models.Robot, models.User.id)
+            .outerjoin(models.User, models.User.id == request.user_id)
+            .where(models.Robot.id == request.robot_id)
+            .with_for_update(of=models.Robot)
+            .execution_options(populate_existing=True)
+        )).first()
+        
+        # Проверяем, существует ли робот
+        if row is None:
+            raise ValueError(f"Робот с ID {request.robot_id} не найден")
+        robot, user_id = row
+        
+        # Проверяем, доступен ли робот
+        if robot.status == 'BUSY':
+            raise ValueError(f"Робот {robot.name} уже занят")
+        
+        # Проверяем, существует ли пользователь
+        if user_id is None:
+            raise ValueError(f"Пользователь с ID {request.user_id} не найден")
+        
+        # Создаем заявку
+        db_request = models.TransportRequest(
+            user_id=request.user_id,
+            robot_id=request.robot_id,
+            target_x=request.target_x,
+            target_y=request.target_y,
+            status='PENDING'
+        )
+        
+        # Меняем статус робота на BUSY
+        robot.status = 'BUSY'
+        db.add(db_request)
     
-    db.add(db_request)
-    db.commit()
-    db.refresh(db_request)
+    # created_at выставляет БД
+    await db.refresh(db_request)
     return db_request
 
 # read
-def get_transport_request(db: Session, request_id: int):
+async def get_transport_request(db: AsyncSession, request_id: int):
     """Получение заявки по ID"""
-    return db.query(models.TransportRequest).filter(
+    return await db.scalar(select(models.TransportRequest).where(
         models.TransportRequest.id == request_id
-    ).first()
+    ))
+
+def encode_cursor(request) -> str:
+    """Курсор страницы: позиция заявки в порядке (created_at, id)"""
+    raw = json.dumps([request.created_at.isoformat(), request.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
 
-def get_user_requests(db: Session, user_id: int):
-    """Получение всех заявок пользователя"""
-    return db.query(models.TransportRequest).filter(
-        models.TransportRequest.user_id == user_id
-    ).order_by(models.TransportRequest.created_at.desc()).all()
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, request_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(request_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Неверный курсор страницы: {e}")
+
+async def get_all_requests(
+    db: AsyncSession,
+    skip: int = 0,
+    limit: Optional[int] = 100,
+    statuses: Optional[Sequence[str]] = None,
+    robot_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    descending: bool = False,
+    rows: bool = False,
+):
+    """
+    Получение списка заявок с фильтрами, упорядоченного по (created_at, id).
+    Страницы листаются курсором (keyset): следующая страница начинается
+    сразу после заявки, закодированной в cursor (см. encode_cursor), и
+    читается по индексу (status, created_at) или (user_id, created_at)
+    одинаково быстро в любом месте истории. skip оставлен для старых
+    клиентов и с курсором не нужен. rows=True — вместо объектов ORM
+    кортежи столбцов схемы TransportRequest (без identity map).
+    """
+    table = models.TransportRequest
+    if rows:
+        query = select(*(getattr(table, name) for name in fast_json.REQUEST_FIELDS))
+    else:
+        query = select(table)
+    if statuses:
+        query = query.where(table.status.in_(statuses))
+    if robot_id is not None:
+        query = query.where(table.robot_id == robot_id)
+    if user_id is not None:
+        query = query.where(table.user_id == user_id)
+    if created_from is not None:
+        query = query.where(table.created_at >= created_from)
+    if created_to is not None:
+        query = query.where(table.created_at < created_to)
+    if cursor:
+        created_at, request_id = decode_cursor(cursor)
+        if descending:
+            query = query.where(or_(table.created_at < created_at,
+                                    and_(table.created_at == created_at, table.id < request_id)))
+        else:
+            query = query.where(or_(table.created_at > created_at,
+                                    and_(table.created_at == created_at, table.id > request_id)))
+    if descending:
+        query = query.order_by(table.created_at.desc(), table.id.desc())
+    else:
+        query = query.order_by(table.created_at, table.id)
+    result = await db.execute(query.offset(skip).limit(limit))
+    return result.all() if rows else result.scalars().all()
+
+async def get_user_requests(db: AsyncSession, user_id: int, limit: Optional[int] = 100,
+                            cursor: Optional[str] = None, statuses: Optional[Sequence[str]] = None,
+                            rows: bool = False):
+    """Получение заявок пользователя (новые первыми, по страницам)"""
+    return await get_all_requests(db, limit=limit, statuses=statuses, user_id=user_id,
+                                  cursor=cursor, descending=True, rows=rows)
+
+async def claim_pending_requests(db: AsyncSession, limit: int = 1, lease: float = PLANNING_LEASE):
+    """
+    Атомарно забирает самые старые PENDING заявки для планировщика (PENDING -> PLANNING).
+    SELECT ... FOR UPDATE SKIP LOCKED пропускает строки, уже взятые другим
+    планировщиком, поэтому одна заявка не достанется двоим.
+    Заявка выдаётся в аренду на lease секунд (claimed_at): PLANNING заявка
+    с истёкшей арендой (или без отметки) выдаётся снова — робот не остаётся
+    BUSY навсегда, если планировщик упал до отправки траектории.
+    Вместе с заявкой возвращаются позиция робота и его карта.
+    """
+    table = models.TransportRequest
+    # Время аренды — по часам API (UTC без пояса, как хранит DATETIME)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    expired = and_(table.status == 'PLANNING',
+                   or_(table.claimed_at.is_(None), table.claimed_at < now - timedelta(seconds=lease)))
+    claimed = (await db.scalars(select(table).where(
+        or_(table.status == 'PENDING', expired)
+    ).order_by(
+        table.created_at, table.id
+    ).limit(limit).with_for_update(skip_locked=True))).all()
+
+    if not claimed:
+        # Завершаем пустую транзакцию COMMIT, а не ROLLBACK: откат сбросил бы
+        # загруженные в сессию объекты, а догрузка в асинхронном коде невозможна
+        await db.commit()
+        return []
+
+    # Позиции роботов и карты — одним запросом, без блокировки строк роботов
+    robot_ids = {request.robot_id for request in claimed}
+    rows = (await db.execute(select(models.Robot, models.Map).outerjoin(
+        models.Map, models.Robot.current_map_id == models.Map.id
+    ).where(models.Robot.id.in_(robot_ids)))).all()
+    robots = {robot.id: (robot, map_obj) for robot, map_obj in rows}
+
+    result = []
+    for request in claimed:
+        request.status = 'PLANNING'
+        request.claimed_at = now
+        robot, map_obj = robots.get(request.robot_id, (None, None))
+        if robot is not None and robot_state.loaded:
+            # Свежая позиция — в памяти, в БД она записывается с задержкой
+            robot = robot_state.get(robot.id) or robot
+        result.append({
+            "id": request.id,
+            "user_id": request.user_id,
+            "robot_id": request.robot_id,
+            "target_x": request.target_x,
+            "target_y": request.target_y,
+            "status": request.status,
+            "created_at": request.created_at,
+            "start_x": robot.current_position_x if robot else 0.0,
+            "start_y": robot.current_position_y if robot else 0.0,
+            "map_id": map_obj.id if map_obj else None,
+            "map_file_path": map_obj.file_path if map_obj else None,
+        })
+
+    await db.commit()
+    return result
 
 # update
-def update_request_status(db: Session, request_id: int, status: str):
-    """Обновление статуса заявки"""
-    valid_statuses = ['PENDING', 'PLANNING', 'READY', 'IN_PROGRESS', 'COMPLETED', 'FAILED']
-    if status not in valid_statuses:
-        raise ValueError(f"Неверный статус. Допустимые: {valid_statuses}")
-    
-    db_request = get_transport_request(db, request_id)
-    if not db_request:
-        raise ValueError(f"Заявка с ID {request_id} не найдена")
-    
-    old_status = db_request.status
-    db_request.status = status
+async def _lock_request_with_robot(db: AsyncSession, request_id: int):
+    """Заявка и её робот одним SELECT ... FOR UPDATE; (None, None) — заявки нет"""
+    row = (await db.execute(
+        select(models.TransportRequest, models.Robot)
+        .outerjoin(models.Robot, models.Robot.id == models.TransportRequest.robot_id)
+        .where(models.TransportRequest.id == request_id)
+        .with_for_update()
+        .execution_options(populate_existing=True)
+    )).first()
+    return row if row is not None else (None, None)
+
+async def transition_request(db: AsyncSession, request_id: int, status: str,
+                             expected: Optional[Sequence[str]] = None):
+    """
+    Переход статуса заявки одной транзакцией: заявка и робот читаются
+    одним запросом, при COMPLETED/FAILED робот освобождается в том же
+    COMMIT. expected — статусы, из которых переход допустим (иначе
+    ValueError). None — заявки нет
+    """
+    if status not in REQUEST_STATUSES:
+        raise ValueError(f"Неверный статус. Допустимые: {REQUEST_STATUSES}")
     
-    # Если заявка завершена или провалена, освобождаем робота
-    if status in ['COMPLETED', 'FAILED']:
-        robot = db.query(models.Robot).filter(models.Robot.id == db_request.robot_id).first()
-        if robot:
+    async with unit_of_work(db):
+        db_request, robot = await _lock_request_with_robot(db, request_id)
+        if db_request is None:
+            return None
+        if expected is not None and db_request.status not in expected:
+            raise ValueError(
+                f"Заявка должна быть в состоянии {' или '.join(expected)}, а не {db_request.status}"
+            )
+        
+        db_request.status = status
+        
+        # Если заявка завершена или провалена, освобождаем робота
+        if status in FINAL_STATUSES and robot is not None:
             robot.status = 'IDLE'
-    
-    db.commit()
-    db.refresh(db_request)
     return db_request
 
-def cancel_request(db: Session, request_id: int):
-    """Отмена заявки"""
-    db_request = get_transport_request(db, request_id)
+async def update_request_status(db: AsyncSession, request_id: int, status: str,
+                                expected: Optional[Sequence[str]] = None):
+    """Обновление статуса заявки (expected — см. transition_request)"""
+    db_request = await transition_request(db, request_id, status, expected)
     if not db_request:
         raise ValueError(f"Заявка с ID {request_id} не найдена")
-    
-    if db_request.status in ['PENDING', 'PLANNING']:
+    return db_request
+
+async def cancel_request(db: AsyncSession, request_id: int):
+    """Отмена заявки"""
+    async with unit_of_work(db):
+        db_request, robot = await _lock_request_with_robot(db, request_id)
+        if not db_request:
+            raise ValueError(f"Заявка с ID {request_id} не найдена")
+        
+        if db_request.status not in ['PENDING', 'PLANNING']:
+            raise ValueError(f"Невозможно отменить заявку со статусом {db_request.status}")
+        
         db_request.status = 'FAILED'
         
         # Освобождаем робота
-        robot = db.query(models.Robot).filter(models.Robot.id == db_request.robot_id).first()
         if robot:
             robot.status = 'IDLE'
-        
-        db.commit()
-        db.refresh(db_request)
-    else:
-        raise ValueError(f"Невозможно отменить заявку со статусом {db_request.status}")
     
     return db_request
 
 # delete
-def delete_transport_request(db: Session, request_id: int):
+async def delete_transport_request(db: AsyncSession, request_id: int):
     """Удаление заявки по ID"""
-    db_request = get_transport_request(db, request_id)
-    if not db_request:
-        raise ValueError(f"Заявка с ID {request_id} не найдена")
-    
-    # Если заявка активна, освобождаем робота
-    if db_request.status in ['PENDING', 'PLANNING', 'IN_PROGRESS']:
-        robot = db.query(models.Robot).filter(models.Robot.id == db_request.robot_id).first()
-        if robot:
+    async with unit_of_work(db):
+        db_request, robot = await _lock_request_with_robot(db, request_id)
+        if not db_request:
+            raise ValueError(f"Заявка с ID {request_id} не найдена")
+        
+        # Если заявка активна, освобождаем робота
+        if db_request.status in ['PENDING', 'PLANNING', 'IN_PROGRESS'] and robot:
             robot.status = 'IDLE'
-    
-    db.delete(db_request)
-    db.commit()
+        
+        await db.delete(db_request)
     return db_request
@@ -1,12 +1,13 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import models
 from app.schemas import UserCreate
 
 # create
-def create_user(db: Session, user: UserCreate):
+async def create_user(db: AsyncSession, user: UserCreate):
     """Создание нового пользователя"""
     # Проверяем, не существует ли уже пользователь с таким email
-    existing_user = get_user_by_email(db, user.email)
+    existing_user = await get_user_by_email(db, user.email)
     if existing_user:
         raise ValueError(f"Пользователь с email {user.email} уже существует")
     
@@ -16,31 +17,32 @@ def create_user(db: Session, user: UserCreate):
         password=user.password
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 # read
-def get_user(db: Session, user_id: int):
+async def get_user(db: AsyncSession, user_id: int):
     """Получение пользователя по ID"""
-    return db.query(models.User).filter(models.User.id == user_id).first()
+    return await db.scalar(select(models.User).where(models.User.id == user_id))
 
-def get_user_by_email(db: Session, email: str):
+async def get_user_by_email(db: AsyncSession, email: str):
     """Получение пользователя по email"""
-    return db.query(models.User).filter(models.User.email == email).first()
+    return await db.scalar(select(models.User).where(models.User.email == email).limit(1))
 
-def get_user_by_username(db: Session, username: str):
+async def get_user_by_username(db: AsyncSession, username: str):
     """Получение пользователя по email"""
-    return db.query(models.User).filter(models.User.username == username).first()
+    return await db.scalar(select(models.User).where(models.User.username == username).limit(1))
 
-def get_users(db: Session, skip: int = 0, limit: int = 100):
+async def get_users(db: AsyncSession, skip: int = 0, limit: int = 100):
     """Получение списка пользователей"""
-    return db.query(models.User).offset(skip).limit(limit).all()
+    result = await db.scalars(select(models.User).offset(skip).limit(limit))
+    return result.all()
 
 # update
-def update_user(db: Session, user_id: int, user_data: dict):
+async def update_user(db: AsyncSession, user_id: int, user_data: dict):
     """Обновление данных пользователя"""
-    db_user = get_user(db, user_id)
+    db_user = await get_user(db, user_id)
     if not db_user:
         raise ValueError(f"Пользователь с ID {user_id} не найден")
     
@@ -48,26 +50,26 @@ def update_user(db: Session, user_id: int, user_data: dict):
         if hasattr(db_user, key):
             setattr(db_user, key, value)
     
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return db_user
 
 # delete
-def delete_user(db: Session, user_id: int):
+async def delete_user(db: AsyncSession, user_id: int):
     """Удаление пользователя по ID"""
-    user = get_user(db, user_id)
+    user = await get_user(db, user_id)
     if not user:
         raise ValueError(f"Пользователь с ID {user_id} не найден")
     
     # Проверяем, есть ли активные заявки у пользователя
-    active_requests = db.query(models.TransportRequest).filter(
+    active_requests = await db.scalar(select(models.TransportRequest.id).where(
         models.TransportRequest.user_id == user_id,
         models.TransportRequest.status.in_(['PENDING', 'PLANNING', 'IN_PROGRESS'])
-    ).first()
+    ).limit(1))
     
     if active_requests:
         raise ValueError(f"Невозможно удалить пользователя {user_id}: есть активные заявки")
     
-    db.delete(user)
-    db.commit()
+    await db.delete(user)
+    await db.commit()
     return user
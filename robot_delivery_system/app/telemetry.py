@@ -0,0 +1,209 @@
+import asyncio
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import insert
+
+from app import models, trajectory_codec
+
+# Длительность одного отрезка истории робота, секунды
+TELEMETRY_CHUNK_SECONDS = 60.0
+# Максимум отметок в одном отрезке
+TELEMETRY_CHUNK_POINTS = 4096
+# Как часто готовые отрезки записываются в БД, секунды
+TELEMETRY_FLUSH_INTERVAL = 5.0
+# Сколько готовых отрезков держать в памяти, если БД недоступна
+TELEMETRY_MAX_PENDING = 100000
+# Поля отметки в отрезке (dt — секунды от начала отрезка)
+TELEMETRY_FIELDS = ("dt", "x", "y")
+
+
+class TrackChunk:
+    """Отрезок истории робота: отметки по возрастанию времени"""
+    __slots__ = ("robot_id", "t_start", "dt", "x", "y")
+
+    def __init__(self, robot_id: int, t_start: float, dt=None, x=None, y=None):
+        self.robot_id = robot_id
+        self.t_start = t_start
+        self.dt = dt if dt is not None else array("d")
+        self.x = x if x is not None else array("d")
+        self.y = y if y is not None else array("d")
+
+    @property
+    def t_end(self) -> float:
+        return self.t_start + self.dt[-1]
+
+    def __len__(self) -> int:
+        return len(self.dt)
+
+
+class TelemetryRecorder:
+    """
+    Накопитель истории позиций в памяти процесса API.
+    Отметки каждого робота собираются в отрезок; отрезок закрывается,
+    когда ему больше TELEMETRY_CHUNK_SECONDS, в нём TELEMETRY_CHUNK_POINTS
+    отметок или пришла отметка старше последней. Закрытые отрезки фоновая
+    задача записывает в БД одним INSERT раз в TELEMETRY_FLUSH_INTERVAL,
+    при остановке API закрываются и записываются все. Пока отрезок не
+    записан, он отдаётся запросам истории из памяти.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open: Dict[int, TrackChunk] = {}
+        self._closed: List[TrackChunk] = []
+        self._task: Optional[asyncio.Task] = None
+        self._session_factory = None
+        self.active = False
+        self.dropped = 0
+
+    def record(self, robot_id: int, x: float, y: float, t: Optional[float] = None) -> None:
+        """Отметка позиции (t — unix-время, по умолчанию сейчас); без start() не записывается"""
+        if not self.active:
+            return
+        if t is None:
+            t = time.time()
+        with self._lock:
+            chunk = self._open.get(robot_id)
+            if chunk is not None:
+                dt = t - chunk.t_start
+                if dt < chunk.dt[-1] or dt >= TELEMETRY_CHUNK_SECONDS or len(chunk) >= TELEMETRY_CHUNK_POINTS:
+                    self._close(chunk)
+                    chunk = None
+            if chunk is None:
+                chunk = self._open[robot_id] = TrackChunk(robot_id, t)
+                dt = 0.0
+            chunk.dt.append(dt)
+            chunk.x.append(x)
+            chunk.y.append(y)
+
+    def _close(self, chunk: TrackChunk) -> None:
+        del self._open[chunk.robot_id]
+        self._closed.append(chunk)
+        if len(self._closed) > TELEMETRY_MAX_PENDING:
+            # БД долго недоступна: теряем самую старую историю, а не память процесса
+            del self._closed[0]
+            self.dropped += 1
+
+    def close_expired(self, now: Optional[float] = None, everything: bool = False) -> None:
+        """Закрывает отрезки, начатые раньше TELEMETRY_CHUNK_SECONDS назад (или все)"""
+        if now is None:
+            now = time.time()
+        with self._lock:
+            for chunk in list(self._open.values()):
+                if everything or now - chunk.t_start >= TELEMETRY_CHUNK_SECONDS:
+                    self._close(chunk)
+
+    def pending(self, robot_id: int, start: float, end: float) -> List[TrackChunk]:
+        """Ещё не записанные в БД отрезки робота, пересекающие окно [start, end)"""
+        with self._lock:
+            chunks = [chunk for chunk in self._closed if chunk.robot_id == robot_id]
+            if robot_id in self._open:
+                chunk = self._open[robot_id]
+                # Копия: открытый отрезок продолжает пополняться
+                chunks.append(TrackChunk(robot_id, chunk.t_start, chunk.dt[:], chunk.x[:], chunk.y[:]))
+        return [chunk for chunk in chunks if chunk.t_start < end and chunk.t_end >= start]
+
+    async def flush(self, session_factory) -> int:
+        """Записывает в БД закрытые отрезки; возвращает их число"""
+        self.close_expired()
+        with self._lock:
+            chunks = list(self._closed)
+        if not chunks:
+            return 0
+        rows = await asyncio.to_thread(_encode_chunks, chunks)
+        async with session_factory() as db:
+            await db.execute(insert(models.RobotTelemetry), rows)
+            await db.commit()
+        # До COMMIT отрезки оставались доступны запросам из памяти
+        with self._lock:
+            written = set(map(id, chunks))
+            self._closed = [chunk for chunk in self._closed if id(chunk) not in written]
+        return len(chunks)
+
+    def start(self, session_factory, interval: float = TELEMETRY_FLUSH_INTERVAL) -> None:
+        """Включает запись истории и периодическую выгрузку в текущем event loop"""
+        self._session_factory = session_factory
+        self.active = True
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(session_factory, interval))
+
+    async def stop(self) -> None:
+        """Останавливает выгрузку и записывает всё накопленное"""
+        task, self._task = self._task, None
+        self.active = False
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._session_factory is not None:
+            self.close_expired(everything=True)
+            await self.flush(self._session_factory)
+
+    async def _run(self, session_factory, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush(session_factory)
+            except Exception as e:
+                print(f"Ошибка записи истории позиций в БД: {e}")
+
+
+def _encode_chunks(chunks: Sequence[TrackChunk]) -> List[Dict]:
+    return [{
+        "robot_id": chunk.robot_id,
+        "t_start": chunk.t_start,
+        "t_end": chunk.t_end,
+        "points": len(chunk),
+        "samples": trajectory_codec.encode(TELEMETRY_FIELDS, [chunk.dt.tolist(), chunk.x.tolist(), chunk.y.tolist()]),
+    } for chunk in chunks]
+
+
+def decode_chunk(row) -> TrackChunk:
+    """Строка robot_telemetry -> отрезок"""
+    fields, columns = trajectory_codec.decode_arrays(row.samples)
+    if fields != TELEMETRY_FIELDS:
+        raise ValueError(f"Неизвестные поля истории позиций: {fields}")
+    return TrackChunk(row.robot_id, row.t_start, *columns)
+
+
+def downsample(chunks: Sequence[TrackChunk], start: float, end: float,
+               resolution: float) -> Tuple[List[float], List[float], List[float]]:
+    """
+    Трек в окне [start, end) с шагом resolution секунд: из каждого
+    интервала шага берётся последняя отметка (реальная позиция робота,
+    без усреднения). Отрезки перебираются по времени, внутри отрезка
+    границы интервалов ищутся двоичным поиском — число операций зависит
+    от числа точек ответа, а не от числа отметок.
+    """
+    t_out: List[float] = []
+    x_out: List[float] = []
+    y_out: List[float] = []
+    last_bin = -1
+    for chunk in sorted(chunks, key=lambda c: c.t_start):
+        dts, t0 = chunk.dt, chunk.t_start
+        i = bisect_left(dts, start - t0)
+        n = bisect_left(dts, end - t0)
+        while i < n:
+            current = int((t0 + dts[i] - start) // resolution)
+            # Последняя отметка интервала current внутри отрезка
+            j = max(bisect_left(dts, start + (current + 1) * resolution - t0, i, n) - 1, i)
+            if current > last_bin:
+                t_out.append(t0 + dts[j])
+                x_out.append(chunk.x[j])
+                y_out.append(chunk.y[j])
+                last_bin = current
+            elif current == last_bin:
+                # Интервал начат в предыдущем отрезке — берём более позднюю отметку
+                t_out[-1], x_out[-1], y_out[-1] = t0 + dts[j], chunk.x[j], chunk.y[j]
+            i = j + 1
+    return t_out, x_out, y_out
+
+
+# История позиций роботов процесса API
+telemetry = TelemetryRecorder()
@@ -0,0 +1,153 @@
+"""
+Двоичный формат траектории (версия 1).
+
+Заголовок (12 байт, little-endian):
+    magic   3s  b"TRJ"
+    version B   1
+    flags   B   FLAG_DEFLATE — данные сжаты
+    fields  B   число полей (столбцов)
+    names   H   длина строки имён полей
+    points  I   число точек
+Далее имена полей через запятую (ASCII), дополненные нулями до кратного 4,
+и столбцы float32: сначала все x, затем все y и т.д. При FLAG_DEFLATE
+столбцы хранятся после перестановки байтов (все первые байты чисел,
+затем все вторые...) и сжатия zlib — соседние значения гладкой траектории
+совпадают в старших байтах и хорошо сжимаются.
+"""
+import struct
+import sys
+import zlib
+from array import array
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+MAGIC = b"TRJ"
+VERSION = 1
+FLAG_DEFLATE = 0x01
+MEDIA_TYPE = "application/x-trajectory"
+
+_HEADER = struct.Struct("<3sBBBHI")
+_ITEM = 4  # float32
+
+
+def _shuffle(raw: bytes) -> bytes:
+    return b"".join(raw[i::_ITEM] for i in range(_ITEM))
+
+
+def _unshuffle(data: bytes) -> bytes:
+    n = len(data) // _ITEM
+    out = bytearray(len(data))
+    for i in range(_ITEM):
+        out[i::_ITEM] = data[i * n:(i + 1) * n]
+    return bytes(out)
+
+
+def encode(fields: Sequence[str], columns: Sequence[Sequence[float]], compress: bool = True) -> bytes:
+    """Кодирует столбцы траектории (по одному на поле) в двоичный формат"""
+    if len(fields) != len(columns):
+        raise ValueError("Число полей не совпадает с числом столбцов")
+    n_points = len(columns[0]) if columns else 0
+    values = array("f")
+    for column in columns:
+        if len(column) != n_points:
+            raise ValueError("Столбцы траектории разной длины")
+        values.extend(column)
+    if values.itemsize != _ITEM:
+        raise ValueError("float32 не поддерживается платформой")
+
+    names = ",".join(fields).encode("ascii")
+    padding = b"\0" * (-(_HEADER.size + len(names)) % _ITEM)
+    if sys.byteorder == "big":
+        values.byteswap()
+    payload = values.tobytes()
+    flags = 0
+    if compress:
+        payload = zlib.compress(_shuffle(payload), 6)
+        flags |= FLAG_DEFLATE
+    return _HEADER.pack(MAGIC, VERSION, flags, len(fields), len(names), n_points) + names + padding + payload
+
+
+def decode(data: bytes) -> Tuple[Tuple[str, ...], List[List[float]]]:
+    """Двоичная траектория -> (имена полей, столбцы значений)"""
+    fields, columns = decode_arrays(data)
+    return fields, [column.tolist() for column in columns]
+
+
+def decode_arrays(data: bytes) -> Tuple[Tuple[str, ...], List[array]]:
+    """Как decode, но столбцы — array("f") без преобразования в списки"""
+    if len(data) < _HEADER.size:
+        raise ValueError("Траектория слишком короткая")
+    magic, version, flags, n_fields, names_len, n_points = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Неизвестный формат траектории")
+    if version != VERSION:
+        raise ValueError(f"Неподдерживаемая версия траектории: {version}")
+
+    offset = _HEADER.size + names_len
+    fields = tuple(data[_HEADER.size:offset].decode("ascii").split(",")) if names_len else ()
+    if len(fields) != n_fields:
+        raise ValueError("Повреждён заголовок траектории")
+    size = n_fields * n_points * _ITEM
+    payload = data[offset + (-offset % _ITEM):]
+    if flags & FLAG_DEFLATE:
+        try:
+            # Распаковываем не больше, чем объявлено в заголовке (+1 байт для проверки)
+            decompressor = zlib.decompressobj()
+            payload = decompressor.decompress(payload, size + 1)
+        except zlib.error as e:
+            raise ValueError(f"Повреждены данные траектории: {e}")
+        if not decompressor.eof:
+            raise ValueError("Повреждены данные траектории: поток обрезан")
+        payload = _unshuffle(payload)
+    if len(payload) != size:
+        raise ValueError("Размер данных не совпадает с заголовком траектории")
+
+    values = array("f")
+    values.frombytes(payload)
+    if sys.byteorder == "big":
+        values.byteswap()
+    columns = [values[i * n_points:(i + 1) * n_points] for i in range(n_fields)]
+    return fields, columns
+
+
+def to_points(data: bytes, digits: int = 3) -> List[Dict[str, float]]:
+    """Двоичная траектория -> список точек {"x": .., "y": .., ...}"""
+    fields, columns = decode(data)
+    return [dict(zip(fields, (round(v, digits) for v in row))) for row in zip(*columns)]
+
+
+def iter_text(data: bytes, digits: int = 3, chunk_points: int = 1000) -> Iterator[str]:
+    """Строка "x:..,y:..;..." частями по chunk_points точек (для потоковой отдачи)"""
+    # Декодируем сразу, чтобы ошибка формата возникла до начала отдачи
+    fields, columns = decode(data)
+    return _iter_text_rows(fields, list(zip(*columns)), digits, chunk_points)
+
+
+def _iter_text_rows(fields: Sequence[str], rows: List[Tuple[float, ...]], digits: int,
+                    chunk_points: int) -> Iterator[str]:
+    for start in range(0, len(rows), chunk_points):
+        text = ";".join(",".join(f"{key}:{round(value, digits)}" for key, value in zip(fields, row))
+                        for row in rows[start:start + chunk_points])
+        yield text if start == 0 else ";" + text
+
+
+def to_text(data: bytes, digits: int = 3) -> str:
+    """Двоичная траектория -> строка "x:..,y:..;..." для старых клиентов"""
+    return "".join(iter_text(data, digits))
+
+
+def from_text(path_string: str, compress: bool = True) -> bytes:
+    """Строка "x:..,y:..;..." -> двоичная траектория (поля — по первой точке)"""
+    rows = []
+    for point_str in path_string.split(";"):
+        if not point_str.strip():
+            continue
+        rows.append(dict(map(str.strip, pair.split(":", 1)) for pair in point_str.split(",") if ":" in pair))
+    if not rows:
+        raise ValueError("Пустая траектория")
+
+    fields = list(rows[0])
+    try:
+        columns = [[float(row[key]) for row in rows] for key in fields]
+    except (KeyError, ValueError) as e:
+        raise ValueError(f"Неверный формат траектории: {e}")
+    return encode(fields, columns, compress)
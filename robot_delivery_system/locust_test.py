@@ -1,54 +1,384 @@
-from locust import HttpUser, task, between, tag
+"""
+Нагрузочные сценарии API.
+
+Профиль трафика (веса классов пользователей):
+- GuiUser — панель оператора: списки роботов и заявок, тайлы карты;
+- LifecycleUser — полный цикл заявки своего робота: создание -> ожидание
+  траектории -> принятие -> отметки позиций -> завершение;
+- PlannerUser — планировщик: забирает PENDING заявки и сохраняет траектории
+  (прямой отрезок до цели), поэтому прогон не требует planner_service.py
+  (если планировщик запущен, класс можно не включать);
+- EmulatorUser — эмулятор: пакеты позиций своего парка роботов.
+
+Каждый пользователь сам регистрирует себя и создаёт своих роботов, поэтому
+запросы не падают с 400 из-за чужих id. robot_emulator.py во время прогона
+не запускать без --robots: он завершал бы заявки роботов LifecycleUser.
+
+Запуск без интерфейса с проверкой SLO (код выхода 1 при нарушении):
+    locust -f locust_test.py --headless -u 200 -r 20 -t 5m --host http://<api> \\
+        --slo-p95 500 --slo-error-rate 0.01 --slo-lifecycle-p95 60000
+Только часть профиля: имена классов в конце команды (например, GuiUser).
+"""
+import io
 import random
+import time
+import uuid
+
+from locust import HttpUser, task, between, constant, tag, events
+
+try:
+    from PIL import Image
+except ImportError:
+    # Без Pillow точки на карте выбираются без учёта препятствий
+    Image = None
+
+# Карта, на которой создаются роботы сценариев
+MAP_ID = 1
+# Занятые пиксели карты темнее порога (как в планировщике)
+OCCUPIED_THRESHOLD = 128
+# Отступ точек сценариев от препятствий, пиксели
+FREE_MARGIN = 2
+# Роботов в парке одного EmulatorUser
+EMULATOR_FLEET = 50
+# Отметок позиций на одну заявку в LifecycleUser
+POSITION_UPDATES = 5
+# Пауза между опросами статуса заявки, секунды
+POLL_INTERVAL = 0.5
+# Имя записи полного цикла в статистике
+LIFECYCLE_NAME = "create -> complete"
+
+# Свободные точки карты (общие для пользователей процесса Locust)
+_free_points = None
+
+
+@events.init_command_line_parser.add_listener
+def _add_arguments(parser):
+    parser.add_argument("--map-id", type=int, default=MAP_ID, help="карта роботов сценариев")
+    parser.add_argument("--slo-p95", type=float, default=500.0,
+                        help="допустимый p95 каждого запроса API, мс")
+    parser.add_argument("--slo-error-rate", type=float, default=0.01,
+                        help="допустимая доля ошибок (0..1)")
+    parser.add_argument("--slo-lifecycle-p95", type=float, default=60000.0,
+                        help="допустимый p95 полного цикла заявки, мс")
+    parser.add_argument("--lifecycle-timeout", type=float, default=120.0,
+                        help="сколько ждать траекторию и статус заявки, секунды")
+
+
+@events.quitting.add_listener
+def _check_slo(environment, **kwargs):
+    """Проверка SLO по итогам прогона: нарушение -> код выхода 1"""
+    options = environment.parsed_options
+    if options is None:
+        return
+    stats = environment.stats
+    violations = []
+    if stats.total.num_requests and stats.total.fail_ratio > options.slo_error_rate:
+        violations.append(f"доля ошибок {stats.total.fail_ratio:.2%} > {options.slo_error_rate:.2%}")
+
+    for entry in stats.entries.values():
+        if not entry.num_requests:
+            continue
+        p95 = entry.get_response_time_percentile(0.95)
+        limit = options.slo_lifecycle_p95 if entry.method == "LIFECYCLE" else options.slo_p95
+        if p95 > limit:
+            violations.append(f"{entry.method} {entry.name}: p95 {p95:.0f} мс > {limit:.0f} мс")
+
+    if violations:
+        for violation in violations:
+            print(f"SLO нарушен: {violation}")
+        environment.process_exit_code = 1
+    else:
+        print("SLO соблюдены")
+
+
+def _ok(response, *codes):
+    """Успех, если код ответа из codes (по умолчанию 200)"""
+    if response.status_code in (codes or (200,)):
+        response.success()
+        return True
+    response.failure(f"Status: {response.status_code}")
+    return False
+
+
+def _unique(prefix):
+    return f"{prefix}-{uuid.uuid4().hex[:12]}"
+
+
+class ScenarioUser(HttpUser):
+    """Пользователь с собственной учётной записью и роботами"""
+    abstract = True
+
+    def register(self):
+        name = _unique("locust")
+        with self.client.post("/users/register", name="/users/register", catch_response=True,
+                              json={"username": name, "email": f"{name}@example.com", "password": "locust"}) as response:
+            if _ok(response, 201):
+                self.user_id = response.json()["id"]
+
+    def create_robot(self):
+        """Новый свободный робот на карте сценариев; None — не создан"""
+        with self.client.post("/robots/", name="/robots/", catch_response=True,
+                              json={"name": _unique("locust"),
+                                    "current_map_id": self.environment.parsed_options.map_id}) as response:
+            if _ok(response):
+                return response.json()["id"]
+        return None
+
+    def free_points(self, robot_id):
+        """Свободные точки карты (изображение карты загружается один раз на процесс)"""
+        global _free_points
+        if _free_points is None:
+            response = self.client.get(f"/robots/{robot_id}/map/image", name="/robots/[id]/map/image")
+            _free_points = _decode_free_points(response.content) if response.status_code == 200 else []
+        return _free_points or [(random.uniform(10, 100), random.uniform(10, 100)) for _ in range(100)]
+
+    def place_robot(self, robot_id, x, y):
+        with self.client.patch(f"/robots/{robot_id}/position", params={"x": x, "y": y},
+                               name="/robots/[id]/position", catch_response=True) as response:
+            _ok(response)
+
+
+def _decode_free_points(data):
+    """Центры свободных пикселей карты с отступом FREE_MARGIN от препятствий, в координатах карты"""
+    if Image is None:
+        return []
+    image = Image.open(io.BytesIO(data))
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        alpha = image.convert("RGBA").getchannel("A")
+        occupied = [value >= OCCUPIED_THRESHOLD for value in alpha.getdata()]
+    else:
+        occupied = [value < OCCUPIED_THRESHOLD for value in image.convert("L").getdata()]
+    width, height = image.size
+
+    def free(row, col):
+        return all(0 <= r < height and 0 <= c < width and not occupied[r * width + c]
+                   for r in range(row - FREE_MARGIN, row + FREE_MARGIN + 1)
+                   for c in range(col - FREE_MARGIN, col + FREE_MARGIN + 1))
+
+    # Строки изображения идут сверху вниз, ось y карты — снизу вверх
+    return [(col + 0.5, height - row - 0.5)
+            for row in range(0, height, FREE_MARGIN)
+            for col in range(0, width, FREE_MARGIN) if free(row, col)]
+
+
+class GuiUser(ScenarioUser):
+    """Панель оператора: чтение списков, карты и своих заявок"""
+    weight = 5
+    wait_time = between(1, 3)
+
+    def on_start(self):
+        self.user_id = None
+        self.request_id = None
+        self.register()
+        self.robot_id = self.create_robot()
+        self.etags = {}
+
+    def get_cached(self, url, name):
+        """GET с If-None-Match: повторная выдача без изменений — 304"""
+        headers = {"If-None-Match": self.etags[url]} if url in self.etags else {}
+        with self.client.get(url, name=name, headers=headers, catch_response=True) as response:
+            if _ok(response, 200, 304) and "ETag" in response.headers:
+                self.etags[url] = response.headers["ETag"]
 
-class RobotDeliveryUser(HttpUser):
-    """Минимальный тест: только GET-запросы"""
-    wait_time = between(1, 3)  # Ждем 1-3 секунды между запросами
-    
     @tag("get_robots")
-    @task(5)  # Самый частый запрос
+    @task(5)
     def get_all_robots(self):
         """GET /robots/ - получение списка роботов"""
-        with self.client.get("/robots/", catch_response=True) as response:
-            if response.status_code == 200:
-                response.success()
-            else:
-                response.failure(f"Status: {response.status_code}")
-    
+        self.get_cached("/robots/", "/robots/")
+
     @tag("get_available")
     @task(3)
     def get_available_robots(self):
         """GET /robots/available - доступные роботы"""
-        with self.client.get("/robots/available", catch_response=True) as response:
-            if response.status_code == 200:
-                response.success()
-            else:
-                response.failure(f"Status: {response.status_code}")
-    
-    # @tag("get_user_requests")
-    # @task(2)
-    # def get_user_requests(self):
-    #     """GET /requests/user/{id} - заявки пользователя"""
-    #     with self.client.get(f"/requests/user/{random.randint(1, 1000)}", catch_response=True) as response:
-    #         if response.status_code == 200:
-    #             response.success()
-    #         else:
-    #             response.failure(f"Status: {response.status_code}")
-    
-    # @tag("create_request")
-    # @task(1)
-    # def create_and_complete_request(self):
-    #     """Создать заявку и сразу завершить её (цикл)"""
-    #     data = {
-    #         "user_id": random.randint(1, 1000),
-    #         "robot_id": random.randint(1, 1000),
-    #         "target_x": random.uniform(0, 100),
-    #         "target_y": random.uniform(0, 100)
-    #     }
-        
-    #     # 1. Создаем заявку
-    #     with self.client.post("/requests/", json=data, catch_response=True) as response:
-    #         if response.status_code in [201, 400]:
-    #             response.success()
-    #         else:
-    #             response.failure(f"Status: {response.status_code}")
\ No newline at end of file
+        self.get_cached("/robots/available", "/robots/available")
+
+    @tag("get_user_requests")
+    @task(2)
+    def get_user_requests(self):
+        """GET /requests/user/{id} - заявки пользователя"""
+        if self.user_id is not None:
+            self.get_cached(f"/requests/user/{self.user_id}", "/requests/user/[id]")
+
+    @tag("map_tiles")
+    @task(1)
+    def get_map_tiles(self):
+        """Описание пирамиды карты и тайл верхнего уровня"""
+        map_id = self.environment.parsed_options.map_id
+        self.get_cached(f"/maps/{map_id}/tiles", "/maps/[id]/tiles")
+        self.get_cached(f"/maps/{map_id}/tiles/0/0/0", "/maps/[id]/tiles/[z]/[x]/[y]")
+
+    @tag("telemetry")
+    @task(1)
+    def get_robot_track(self):
+        """Трек своего робота"""
+        if self.robot_id is not None:
+            with self.client.get(f"/robots/{self.robot_id}/telemetry", name="/robots/[id]/telemetry",
+                                 catch_response=True) as response:
+                _ok(response)
+
+
+class LifecycleUser(ScenarioUser):
+    """
+    Полный цикл заявки своего робота. Время от создания до завершения
+    попадает в статистику отдельной записью типа LIFECYCLE; заявка, не
+    дошедшая до завершения, считается ошибкой этой записи и переводится
+    в FAILED, чтобы робот освободился для следующей
+    """
+    weight = 2
+    wait_time = between(1, 5)
+
+    def on_start(self):
+        self.user_id = None
+        self.request_id = None
+        self.register()
+        self.robot_id = self.create_robot()
+        if self.robot_id is not None:
+            x, y = random.choice(self.free_points(self.robot_id))
+            self.place_robot(self.robot_id, x, y)
+
+    @tag("create_request")
+    @task
+    def request_lifecycle(self):
+        if self.user_id is None or self.robot_id is None:
+            return
+        started = time.perf_counter()
+        error = None
+        try:
+            self.run_lifecycle()
+        except LifecycleError as e:
+            error = e
+            self.release_request()
+        self.environment.events.request.fire(
+            request_type="LIFECYCLE", name=LIFECYCLE_NAME,
+            response_time=(time.perf_counter() - started) * 1000,
+            response_length=0, exception=error, context={},
+        )
+
+    def run_lifecycle(self):
+        x, y = random.choice(self.free_points(self.robot_id))
+        with self.client.post("/requests/", name="/requests/", catch_response=True,
+                              json={"user_id": self.user_id, "robot_id": self.robot_id,
+                                    "target_x": x, "target_y": y}) as response:
+            if not _ok(response, 201):
+                raise LifecycleError(f"заявка не создана: {response.status_code}")
+            request_id = self.request_id = response.json()["id"]
+
+        status = self.wait_status(request_id, ("READY", "FAILED"))
+        if status != "READY":
+            raise LifecycleError(f"заявка {request_id}: {status} вместо READY")
+
+        with self.client.get(f"/trajectories/request/{request_id}/text",
+                             name="/trajectories/request/[id]/text", catch_response=True) as response:
+            if not _ok(response):
+                raise LifecycleError(f"нет траектории заявки {request_id}")
+            points = _parse_points(response.text)
+
+        with self.client.patch(f"/requests/{request_id}/accept", name="/requests/[id]/accept",
+                               catch_response=True) as response:
+            if not _ok(response):
+                raise LifecycleError(f"заявка {request_id} не принята: {response.status_code}")
+
+        # Робот проходит траекторию: несколько отметок позиций пакетами
+        step = max(1, len(points) // POSITION_UPDATES)
+        for x, y in points[step - 1::step] + points[-1:]:
+            with self.client.post("/robots/positions", name="/robots/positions", catch_response=True,
+                                  json={"positions": [{"robot_id": self.robot_id, "x": x, "y": y,
+                                                       "t": time.time()}]}) as response:
+                _ok(response)
+
+        with self.client.patch(f"/requests/{request_id}/complete", name="/requests/[id]/complete",
+                               catch_response=True) as response:
+            if not _ok(response):
+                raise LifecycleError(f"заявка {request_id} не завершена: {response.status_code}")
+        self.request_id = None
+
+    def release_request(self):
+        """Незавершённая заявка -> FAILED: робот снова IDLE, следующая заявка не получит 400"""
+        if self.request_id is None:
+            return
+        with self.client.patch(f"/requests/{self.request_id}/status", params={"status": "FAILED"},
+                               name="/requests/[id]/status", catch_response=True) as response:
+            _ok(response)
+        self.request_id = None
+
+    def wait_status(self, request_id, statuses):
+        """Опрашивает заявку, пока её статус не попадёт в statuses (или не выйдет время)"""
+        deadline = time.monotonic() + self.environment.parsed_options.lifecycle_timeout
+        status = None
+        while time.monotonic() < deadline:
+            with self.client.get(f"/requests/{request_id}", name="/requests/[id]",
+                                 catch_response=True) as response:
+                if _ok(response):
+                    status = response.json()["status"]
+                    if status in statuses:
+                        return status
+            time.sleep(POLL_INTERVAL)
+        return status
+
+
+class LifecycleError(Exception):
+    pass
+
+
+def _parse_points(path_string):
+    """Точки (x, y) строки траектории "x:..,y:..;..." """
+    points = []
+    for part in path_string.split(";"):
+        fields = dict(item.split(":", 1) for item in part.split(",") if ":" in item)
+        if "x" in fields and "y" in fields:
+            points.append((float(fields["x"]), float(fields["y"])))
+    return points
+
+
+class PlannerUser(HttpUser):
+    """
+    Планировщик: забирает PENDING заявки и сохраняет для каждой прямой
+    отрезок от робота до цели (нагрузка на API та же, что у planner_service.py)
+    """
+    weight = 1
+    wait_time = between(0.5, 1)
+
+    @tag("planner")
+    @task
+    def plan_pending(self):
+        with self.client.post("/requests/claim", params={"limit": 16}, name="/requests/claim",
+                              catch_response=True) as response:
+            if not _ok(response):
+                return
+            claimed = response.json()
+
+        for request in claimed:
+            start_x, start_y = request["start_x"], request["start_y"]
+            end_x, end_y = request["target_x"], request["target_y"]
+            path = ";".join(
+                f"x:{start_x + (end_x - start_x) * i / 10},y:{start_y + (end_y - start_y) * i / 10}"
+                for i in range(11)
+            )
+            with self.client.post("/trajectories/", name="/trajectories/", catch_response=True,
+                                  json={"request_id": request["id"], "path_data": path}) as response:
+                _ok(response, 200, 201)
+
+
+class EmulatorUser(ScenarioUser):
+    """Эмулятор: пакеты позиций своего парка роботов (как robot_emulator.py, 10 Гц)"""
+    weight = 1
+    wait_time = constant(0.1)
+
+    def on_start(self):
+        robot_ids = [self.create_robot() for _ in range(EMULATOR_FLEET)]
+        self.fleet = {robot_id: (random.uniform(10, 100), random.uniform(10, 100))
+                      for robot_id in robot_ids if robot_id is not None}
+
+    @tag("positions")
+    @task
+    def send_positions(self):
+        now = time.time()
+        positions = []
+        for robot_id, (x, y) in self.fleet.items():
+            x, y = x + random.uniform(-0.1, 0.1), y + random.uniform(-0.1, 0.1)
+            self.fleet[robot_id] = (x, y)
+            positions.append({"robot_id": robot_id, "x": x, "y": y, "t": now})
+        if positions:
+            with self.client.post("/robots/positions", name="/robots/positions", catch_response=True,
+                                  json={"positions": positions}) as response:
+                _ok(response)
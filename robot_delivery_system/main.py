@@ -1,18 +1,36 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.routers import users, robots, transport_requests, trajectories
+from app.routers import users, robots, maps, transport_requests, trajectories
 from app.database import *
 from app import models
+from app.robot_state import robot_state
+from app.telemetry import telemetry
 
 # Создаем таблицы в БД
 # drop_tables()
 create_tables()
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Состояние роботов загружается в память при старте; накопленные позиции и история записываются при остановке"""
+    await robot_state.load_from_db(AsyncSessionLocal)
+    robot_state.start(AsyncSessionLocal)
+    telemetry.start(AsyncSessionLocal)
+    yield
+    await telemetry.stop()
+    await robot_state.stop()
+    await async_engine.dispose()
+
+
 app = FastAPI(
     title="Robot Delivery System API",
     description="API для системы управления автономными роботами-доставщиками",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Настройка CORS
@@ -22,11 +40,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Курсор следующей страницы списков заявок
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Подключаем только нужные роутеры
 app.include_router(users.router)
 app.include_router(robots.router)
+app.include_router(maps.router)
 app.include_router(transport_requests.router)
 app.include_router(trajectories.router)
 
@@ -39,9 +60,10 @@ def root():
         "version": "1.0.0",
         "endpoints": {
             "users": ["POST /users/register", "POST /users/login", "GET /users/me"],
-            "robots": ["GET /robots/", "GET /robots/available", "PATCH /robots/{id}/occupy", "PATCH /robots/{id}/position"],
-            "requests": ["GET /requests/my", "GET /requests/{id}", "POST /requests/", "PATCH /requests/{id}/status", "PATCH /requests/{id}/accept", "PATCH /requests/{id}/reject", "PATCH /requests/{id}/complete"],
-            "trajectories": ["GET /trajectories/request/{request_id}", "POST /trajectories/"]
+            "robots": ["GET /robots/", "GET /robots/available", "PATCH /robots/{id}/occupy", "PATCH /robots/{id}/position", "POST /robots/positions", "GET /robots/{id}/telemetry", "GET /robots/{id}/map/tiles", "WS /robots/ws"],
+            "maps": ["GET /maps/{id}/tiles", "GET /maps/{id}/tiles/{z}/{x}/{y}"],
+            "requests": ["GET /requests/my", "GET /requests/{id}", "POST /requests/", "POST /requests/claim", "GET /requests/events", "GET /requests/events/stream", "PATCH /requests/{id}/status", "PATCH /requests/{id}/accept", "PATCH /requests/{id}/reject", "PATCH /requests/{id}/complete"],
+            "trajectories": ["GET /trajectories/request/{request_id}", "GET /trajectories/request/{request_id}/binary", "GET /trajectories/request/{request_id}/text", "POST /trajectories/", "POST /trajectories/binary"]
         }
     }
 
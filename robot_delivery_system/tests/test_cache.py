@@ -0,0 +1,37 @@
+import unittest
+from starlette.requests import Request
+from app.cache import ResponseCache, conditional_response, etag_for
+
+def _request(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+class TestResponseCache(unittest.TestCase):
+    def test_invalidate_and_stale_put(self):
+        """Сброс удаляет записи; ответ, собранный до сброса, не сохраняется"""
+        now = [0.0]
+        cache = ResponseCache(ttl=5, clock=lambda: now[0])
+        cache.put("a", b"1", cache.version)
+        self.assertEqual(cache.get("a"), b"1")
+        
+        version = cache.version
+        cache.invalidate()
+        cache.put("a", b"old", version)
+        self.assertIsNone(cache.get("a"))
+        
+        cache.put("a", b"2", cache.version)
+        now[0] = 6.0
+        self.assertIsNone(cache.get("a"))
+
+    def test_conditional_response(self):
+        """Совпавший If-None-Match — 304 без тела, иначе тело с ETag"""
+        body = b'[{"id": 1}]'
+        etag = etag_for(body)
+        
+        full = conditional_response(_request(), body)
+        self.assertEqual((full.status_code, full.body, full.headers["etag"]), (200, body, etag))
+        self.assertEqual(conditional_response(_request(f'"x", W/{etag}'), body).status_code, 304)
+        self.assertEqual(conditional_response(_request('"other"'), body).status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import io
+import os
+import tempfile
+import unittest
+from PIL import Image
+from app.map_tiles import TILE_SIZE, MapTileCache
+
+def _save_map(path, width, height, color=0):
+    Image.new("P", (width, height), color).save(path)
+
+class TestMapTiles(unittest.TestCase):
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._dir.name, "map.png")
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def test_pyramid_levels_and_tiles(self):
+        """Каждый уровень вдвое меньше следующего, на уровне 0 карта в одном тайле"""
+        _save_map(self.path, 1000, 600)
+        pyramid = MapTileCache().get(1, self.path)
+
+        self.assertEqual(pyramid.max_zoom, 2)
+        self.assertEqual([(level.width, level.height) for level in pyramid.levels],
+                         [(250, 150), (500, 300), (1000, 600)])
+        self.assertEqual(pyramid.grid(2), (4, 3))
+
+        corner = Image.open(io.BytesIO(pyramid.tile(2, 3, 2)))
+        self.assertEqual(corner.size, (1000 - 3 * TILE_SIZE, 600 - 2 * TILE_SIZE))
+        self.assertEqual(Image.open(io.BytesIO(pyramid.tile(2, 0, 0))).size, (TILE_SIZE, TILE_SIZE))
+        self.assertIsNone(pyramid.tile(2, 4, 0))
+        self.assertIsNone(pyramid.tile(3, 0, 0))
+
+    def test_rebuild_and_eviction(self):
+        """Изменённый файл строится заново; при нехватке памяти вытесняется давно не использованная карта"""
+        _save_map(self.path, 300, 300)
+        cache = MapTileCache(max_bytes=10 ** 9)
+        first = cache.get(1, self.path)
+        self.assertIs(cache.get(1, self.path), first)
+
+        _save_map(self.path, 400, 300, color=1)
+        os.utime(self.path, ns=(first.signature[0] + 10 ** 9,) * 2)
+        second = cache.get(1, self.path)
+        self.assertIsNot(second, first)
+        self.assertEqual((second.width, cache.builds), (400, 2))
+
+        other = os.path.join(self._dir.name, "other.png")
+        _save_map(other, 300, 300)
+        cache.max_bytes = second.nbytes
+        cache.get(2, other)
+        self.assertEqual(len(cache), 1)
+        cache.get(1, self.path)
+        self.assertEqual(cache.builds, 4)
+
+    def test_tiles_count_towards_eviction(self):
+        """Закодированные тайлы учитываются в памяти кэша и при повторном запросе карты"""
+        other = os.path.join(self._dir.name, "other.png")
+        _save_map(self.path, 1000, 1000)
+        _save_map(other, 300, 300)
+        cache = MapTileCache(max_bytes=10 ** 9)
+        pyramid = cache.get(1, self.path)
+        cache.get(2, other)
+        cache.max_bytes = cache.nbytes
+        before = pyramid.nbytes
+        pyramid.tile(2, 0, 0)
+        self.assertGreater(pyramid.nbytes, before)
+
+        # Повторный запрос уже построенной карты вытесняет давно не использованную
+        self.assertIs(cache.get(1, self.path), pyramid)
+        self.assertEqual(len(cache), 1)
+        self.assertLessEqual(cache.nbytes, pyramid.nbytes)
+
+if __name__ == '__main__':
+    unittest.main()
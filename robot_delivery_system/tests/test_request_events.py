@@ -0,0 +1,84 @@
+import asyncio
+import unittest
+from app.events import RequestEventBroker, RobotPositionHub
+
+class TestRequestEventBroker(unittest.TestCase):
+    def setUp(self):
+        self.broker = RequestEventBroker(history=3)
+
+    def test_filters_and_reset(self):
+        """Фильтрация по статусу и роботу; вытесненные события требуют полной пересинхронизации"""
+        self.broker.publish(1, 10, 'PENDING')
+        self.broker.publish(1, 10, 'PLANNING', 'PENDING')
+        self.broker.publish(2, 20, 'PENDING')
+        
+        events, last_id, reset = self.broker.events_since(0, statuses=['PENDING'], robot_id=20)
+        self.assertEqual([e['request_id'] for e in events], [2])
+        self.assertEqual((last_id, reset), (3, False))
+        
+        self.broker.publish(2, 20, 'PLANNING', 'PENDING')
+        self.assertTrue(self.broker.events_since(0)[2])
+        self.assertFalse(self.broker.events_since(1)[2])
+        # Курсор из будущего (API перезапускался)
+        self.assertTrue(self.broker.events_since(100)[2])
+
+    def test_long_poll_wakes_on_publish(self):
+        """Long-poll пропускает неподходящие события и просыпается на подходящем"""
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            loop.call_later(0.01, self.broker.publish, 1, 10, 'PLANNING')
+            loop.call_later(0.02, self.broker.publish, 1, 10, 'IN_PROGRESS')
+            return await self.broker.listen(0, timeout=5, statuses=['IN_PROGRESS'])
+        
+        events, last_id, reset = asyncio.run(scenario())
+        self.assertEqual([e['status'] for e in events], ['IN_PROGRESS'])
+        self.assertEqual(last_id, 2)
+        
+        # Без событий — пустой ответ по таймауту
+        self.assertEqual(asyncio.run(self.broker.listen(2, timeout=0.01)), ([], 2, False))
+
+class TestRobotPositionHub(unittest.TestCase):
+    def test_coalesced_updates(self):
+        """Подписчик карты получает только последнюю позицию каждого робота своей карты"""
+        hub = RobotPositionHub()
+        
+        async def scenario():
+            subscriber = hub.subscribe(map_id=1)
+            for x in range(3):
+                hub.publish({"id": 5, "map_id": 1, "x": float(x), "y": 0.0, "status": "BUSY"})
+            hub.publish({"id": 6, "map_id": 2, "x": 1.0, "y": 1.0, "status": "IDLE"})
+            await asyncio.sleep(0)
+            batch = await subscriber.next_batch()
+            hub.unsubscribe(subscriber)
+            return batch
+        
+        batch = asyncio.run(scenario())
+        self.assertEqual([(item["id"], item["x"]) for item in batch], [(5, 2.0)])
+        self.assertEqual([item["id"] for item in hub.snapshot()], [5, 6])
+        self.assertEqual(hub.subscriber_count, 0)
+
+    def test_map_change_leaves_old_map(self):
+        """Робот, сменивший карту, уходит от подписчиков старой карты с deleted и появляется у новой"""
+        hub = RobotPositionHub()
+        
+        async def scenario():
+            old_map, new_map = hub.subscribe(map_id=1), hub.subscribe(map_id=2)
+            hub.publish({"id": 5, "map_id": 1, "x": 0.0, "y": 0.0, "status": "IDLE"})
+            await asyncio.sleep(0)
+            await old_map.next_batch()
+            hub.publish({"id": 5, "map_id": 2, "x": 3.0, "y": 4.0, "status": "IDLE"})
+            await asyncio.sleep(0)
+            batches = await old_map.next_batch(), await new_map.next_batch()
+            hub.unsubscribe(old_map)
+            hub.unsubscribe(new_map)
+            return batches
+        
+        left, arrived = asyncio.run(scenario())
+        self.assertEqual([(item["id"], item.get("deleted")) for item in left], [(5, True)])
+        self.assertEqual([(item["map_id"], item["previous_map_id"], item.get("deleted")) for item in arrived],
+                         [(2, 1, None)])
+        self.assertEqual(hub.snapshot(map_id=1), [])
+        self.assertNotIn("previous_map_id", hub.snapshot(map_id=2)[0])
+
+if __name__ == '__main__':
+    unittest.main()
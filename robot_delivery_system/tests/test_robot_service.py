@@ -1,63 +1,120 @@
+import json
 import unittest
-from app.database import SessionLocal, engine, Base
+from app.database import AsyncSessionLocal, async_engine, engine, Base
 from app.services import robot_service, map_service
-from app.schemas import RobotCreate, MapCreate
+from app.schemas import RobotCreate, MapCreate, RobotPosition
+from app.robot_state import robot_state
 
-class TestRobotService(unittest.TestCase):
-    def setUp(self):
+class TestRobotService(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
         """Создание тестовой БД перед каждым тестом"""
         Base.metadata.create_all(bind=engine)
-        self.db = SessionLocal()
+        self.db = AsyncSessionLocal()
         
         # Создаем тестовую карту
         map_data = MapCreate(name="Test Map", description="Test")
-        self.test_map = map_service.create_map(self.db, map_data)
+        self.test_map = await map_service.create_map(self.db, map_data)
 
-    def tearDown(self):
+    async def asyncTearDown(self):
         """Очистка после каждого теста"""
-        self.db.close()
+        await self.db.close()
+        # Соединения пула привязаны к event loop теста
+        await async_engine.dispose()
         Base.metadata.drop_all(bind=engine)
 
-    def test_create_robot(self):
+    async def test_create_robot(self):
         """Тест создания робота"""
         robot_data = RobotCreate(
             name="TestBot-1",
             model="TestModel",
             current_map_id=self.test_map.id
         )
-        robot = robot_service.create_robot(self.db, robot_data)
+        robot = await robot_service.create_robot(self.db, robot_data)
         
         self.assertIsNotNone(robot.id)
         self.assertEqual(robot.name, "TestBot-1")
         self.assertEqual(robot.status, "IDLE")
 
-    def test_get_robot(self):
+    async def test_get_robot(self):
         """Тест получения робота по ID"""
         robot_data = RobotCreate(
             name="TestBot-2",
             model="TestModel",
             current_map_id=self.test_map.id
         )
-        created = robot_service.create_robot(self.db, robot_data)
-        fetched = robot_service.get_robot(self.db, created.id)
+        created = await robot_service.create_robot(self.db, robot_data)
+        fetched = await robot_service.get_robot(self.db, created.id)
         
         self.assertEqual(fetched.id, created.id)
         self.assertEqual(fetched.name, "TestBot-2")
 
-    def test_update_robot_status(self):
+    async def test_update_robot_status(self):
         """Тест обновления статуса робота"""
         robot_data = RobotCreate(
             name="TestBot-3",
             model="TestModel",
             current_map_id=self.test_map.id
         )
-        robot = robot_service.create_robot(self.db, robot_data)
+        robot = await robot_service.create_robot(self.db, robot_data)
         
         # Обновляем статус
-        robot_service.update_robot_status(self.db, robot.id, "BUSY")
-        updated = robot_service.get_robot(self.db, robot.id)
+        await robot_service.update_robot_status(self.db, robot.id, "BUSY")
+        updated = await robot_service.get_robot(self.db, robot.id)
         
         self.assertEqual(updated.status, "BUSY")
 
+    async def test_update_robot_positions(self):
+        """Пакет позиций: последняя отметка каждого робота, неизвестные роботы пропускаются"""
+        robots = [
+            await robot_service.create_robot(self.db, RobotCreate(name=f"TestBot-{i}", current_map_id=self.test_map.id))
+            for i in range(4, 6)
+        ]
+        samples = [
+            RobotPosition(robot_id=robots[0].id, x=1.0, y=1.0, t=10.0),
+            RobotPosition(robot_id=robots[0].id, x=9.0, y=9.0, t=5.0),
+            RobotPosition(robot_id=robots[1].id, x=2.0, y=3.0),
+            RobotPosition(robot_id=robots[1].id, x=4.0, y=5.0),
+            RobotPosition(robot_id=9999, x=0.0, y=0.0),
+        ]
+        result = await robot_service.update_robot_positions(self.db, samples)
+        self.assertEqual(result, {"updated": 2, "unknown": [9999]})
+        
+        self.db.expunge_all()
+        first = await robot_service.get_robot(self.db, robots[0].id)
+        second = await robot_service.get_robot(self.db, robots[1].id)
+        self.assertEqual((first.current_position_x, first.current_position_y), (1.0, 1.0))
+        self.assertEqual((second.current_position_x, second.current_position_y), (4.0, 5.0))
+
+    async def test_write_behind_positions(self):
+        """Позиции пишутся в память и попадают в БД только при записи состояния"""
+        robot = await robot_service.create_robot(self.db, RobotCreate(name="TestBot-6", current_map_id=self.test_map.id))
+        await robot_state.load_from_db(AsyncSessionLocal)
+        try:
+            await robot_service.update_robot_position(self.db, robot.id, 3.0, 4.0)
+            await robot_service.update_robot_status(self.db, robot.id, "BUSY")
+            cached = await robot_service.get_robot(self.db, robot.id)
+            self.assertEqual((cached.current_position_x, cached.current_position_y, cached.status), (3.0, 4.0, "BUSY"))
+            self.assertEqual([r.id for r in await robot_service.get_available_robots(self.db)], [])
+            
+            stored = await robot_service._load_robot(self.db, robot.id)
+            self.assertEqual(stored.current_position_x, 0.0)
+            self.assertEqual(await robot_state.flush(AsyncSessionLocal), 1)
+            await self.db.refresh(stored)
+            self.assertEqual((stored.current_position_x, stored.current_position_y), (3.0, 4.0))
+        finally:
+            robot_state.clear()
+
+    async def test_robot_list_cache(self):
+        """Кэш списка роботов сбрасывается после COMMIT изменения робота"""
+        robot = await robot_service.create_robot(self.db, RobotCreate(name="TestBot-7", current_map_id=self.test_map.id))
+        first = await robot_service.get_available_robots_json(self.db)
+        self.assertIs(await robot_service.get_available_robots_json(self.db), first)
+        
+        await robot_service.update_robot_status(self.db, robot.id, "BUSY")
+        self.assertEqual(json.loads(await robot_service.get_available_robots_json(self.db)), [])
+        await robot_service.update_robot_position(self.db, robot.id, 1.0, 2.0)
+        listed = json.loads(await robot_service.get_all_robots_json(self.db))
+        self.assertEqual((listed[0]["current_position_x"], listed[0]["status"]), (1.0, "BUSY"))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
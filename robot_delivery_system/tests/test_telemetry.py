@@ -0,0 +1,53 @@
+import time
+import unittest
+from app.database import AsyncSessionLocal, async_engine, engine, Base
+from app.services import telemetry_service
+from app.telemetry import TelemetryRecorder, telemetry
+
+class TestTelemetry(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        """Создание тестовой БД перед каждым тестом"""
+        Base.metadata.create_all(bind=engine)
+        self.db = AsyncSessionLocal()
+
+    async def asyncTearDown(self):
+        """Очистка после каждого теста"""
+        await self.db.close()
+        await async_engine.dispose()
+        Base.metadata.drop_all(bind=engine)
+
+    async def test_chunks_and_downsampled_track(self):
+        """Отметки режутся на отрезки по минуте; трек — последняя отметка каждого шага из БД и памяти"""
+        recorder = TelemetryRecorder()
+        recorder.active = True
+        # Последний отрезок начат 10 секунд назад и остаётся открытым
+        base = time.time() - 130.0
+        for i in range(1500):
+            # 10 Гц, 150 секунд; y — время отметки от base
+            recorder.record(7, float(i), i / 10, t=base + i / 10)
+        recorder.record(8, 0.0, 0.0, t=base)
+        self.assertEqual(await recorder.flush(AsyncSessionLocal), 3)
+        self.assertEqual([len(c) for c in recorder.pending(7, base, base + 200.0)], [300])
+
+        rows = await telemetry_service.get_robot_track(self.db, 7, start=base, end=base + 150.0, resolution=30.0)
+        self.assertEqual(rows["resolution"], 30.0)
+        self.assertEqual([round(t - base, 3) for t in rows["t"]], [round(y, 3) for y in rows["y"]])
+        # Последняя отметка каждого шага; отметки последнего отрезка ещё в памяти процесса
+        self.assertEqual(rows["x"], [299.0, 599.0, 899.0, 1199.0])
+        
+        telemetry.active = True
+        try:
+            telemetry._open, telemetry._closed = recorder._open, recorder._closed
+            rows = await telemetry_service.get_robot_track(self.db, 7, start=base, end=base + 150.0, resolution=30.0)
+            self.assertEqual(rows["x"], [299.0, 599.0, 899.0, 1199.0, 1499.0])
+            window = await telemetry_service.get_robot_track(self.db, 7, start=base + 59.95, end=base + 60.25, resolution=0.1)
+            self.assertEqual(window["x"], [600.0, 601.0, 602.0])
+        finally:
+            telemetry.active = False
+            telemetry._open, telemetry._closed = {}, []
+        
+        with self.assertRaises(ValueError):
+            await telemetry_service.get_robot_track(self.db, 7, start=10.0, end=5.0)
+
+if __name__ == '__main__':
+    unittest.main()
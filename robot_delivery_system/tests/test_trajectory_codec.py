@@ -0,0 +1,25 @@
+import unittest
+from app import trajectory_codec
+
+class TestTrajectoryCodec(unittest.TestCase):
+    def test_text_compatibility(self):
+        """Строка старого формата переживает перевод в двоичный формат и обратно"""
+        path_string = "x:1.0,y:2.0,v:0.5;x:3.5,y:4.25,v:1.0;x:120.125,y:-7.5,v:0.0"
+        
+        data = trajectory_codec.from_text(path_string)
+        fields, columns = trajectory_codec.decode(data)
+        
+        self.assertEqual(fields, ("x", "y", "v"))
+        self.assertEqual(columns[0], [1.0, 3.5, 120.125])
+        self.assertEqual(trajectory_codec.to_text(data), path_string)
+        self.assertEqual(trajectory_codec.decode(trajectory_codec.from_text(path_string, compress=False)), (fields, columns))
+
+    def test_invalid_data(self):
+        """Повреждённые данные не принимаются"""
+        data = trajectory_codec.from_text("x:1.0,y:2.0;x:3.0,y:4.0")
+        for bad in (b"", b"JSON" + data[4:], data[:-3]):
+            with self.assertRaises(ValueError):
+                trajectory_codec.decode(bad)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,182 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from typing import List
+from pydantic import TypeAdapter
+from sqlalchemy import event, select, update
+from app import fast_json, models
+from app.cache import robot_lists
+from app.config import settings
+from app.database import AsyncSessionLocal, async_engine, engine, Base, unit_of_work
+from app.services import transport_request_service, robot_service, map_service, user_service, trajectory_service
+from app.schemas import RobotCreate, MapCreate, UserCreate, TransportRequest, TransportRequestCreate, TrajectoryCreate
+
+class TestTransportRequestService(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        """Создание тестовой БД перед каждым тестом"""
+        Base.metadata.create_all(bind=engine)
+        self.db = AsyncSessionLocal()
+        
+        # Создаем карту, пользователя и двух роботов
+        self.test_map = await map_service.create_map(self.db, MapCreate(name="Test Map", file_path="maps/1.png"))
+        self.user = await user_service.create_user(
+            self.db, UserCreate(username="tester", email="tester@example.com", password="secret")
+        )
+        self.robots = [
+            await robot_service.create_robot(self.db, RobotCreate(name=f"TestBot-{i}", current_map_id=self.test_map.id))
+            for i in range(2)
+        ]
+
+    async def asyncTearDown(self):
+        """Очистка после каждого теста"""
+        await self.db.close()
+        # Соединения пула привязаны к event loop теста
+        await async_engine.dispose()
+        Base.metadata.drop_all(bind=engine)
+
+    async def _create_request(self, robot):
+        return await transport_request_service.create_transport_request(
+            self.db,
+            TransportRequestCreate(user_id=self.user.id, robot_id=robot.id, target_x=10.0, target_y=20.0)
+        )
+
+    async def test_claim_pending_requests(self):
+        """Заявки выдаются по одной, в порядке создания, и переводятся в PLANNING"""
+        first = await self._create_request(self.robots[0])
+        second = await self._create_request(self.robots[1])
+        
+        claimed = await transport_request_service.claim_pending_requests(self.db, limit=1)
+        self.assertEqual([r["id"] for r in claimed], [first.id])
+        self.assertEqual(claimed[0]["status"], "PLANNING")
+        self.assertEqual(claimed[0]["map_id"], self.test_map.id)
+        
+        claimed = await transport_request_service.claim_pending_requests(self.db, limit=10)
+        self.assertEqual([r["id"] for r in claimed], [second.id])
+        
+        # Повторно те же заявки не выдаются
+        self.assertEqual(await transport_request_service.claim_pending_requests(self.db, limit=10), [])
+        self.assertEqual((await transport_request_service.get_transport_request(self.db, first.id)).status, "PLANNING")
+
+    async def test_expired_claim_is_reclaimed(self):
+        """Заявка, чья аренда PLANNING истекла (планировщик упал), выдаётся снова"""
+        request = await self._create_request(self.robots[0])
+        await transport_request_service.claim_pending_requests(self.db, limit=1)
+        self.assertEqual(await transport_request_service.claim_pending_requests(self.db, limit=1), [])
+        
+        lease = transport_request_service.PLANNING_LEASE
+        await self.db.execute(update(models.TransportRequest).values(
+            claimed_at=datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(seconds=lease + 1)
+        ))
+        await self.db.commit()
+        claimed = await transport_request_service.claim_pending_requests(self.db, limit=1)
+        self.assertEqual([(r["id"], r["status"]) for r in claimed], [(request.id, "PLANNING")])
+        self.assertEqual(await transport_request_service.claim_pending_requests(self.db, limit=1), [])
+        
+        # Отметка о сбое от старого планировщика не трогает заявку в другом состоянии
+        await trajectory_service.create_trajectory(self.db, TrajectoryCreate(request_id=request.id, path_data="[]"))
+        with self.assertRaises(ValueError):
+            await transport_request_service.update_request_status(self.db, request.id, "FAILED", expected=["PLANNING"])
+        self.assertEqual((await transport_request_service.get_transport_request(self.db, request.id)).status, "READY")
+
+    async def test_keyset_pages_and_filters(self):
+        """Страницы по курсору идут без пропусков и повторов; фильтры по статусу и времени"""
+        start = datetime(2024, 1, 1)
+        # Две заявки на каждую секунду: порядок внутри секунды — по id
+        self.db.add_all(
+            models.TransportRequest(user_id=self.user.id, robot_id=self.robots[i % 2].id, target_x=0.0, target_y=0.0,
+                                    status='COMPLETED' if i % 3 else 'FAILED', created_at=start + timedelta(seconds=i // 2))
+            for i in range(11)
+        )
+        await self.db.commit()
+        everything = await transport_request_service.get_all_requests(self.db, limit=None)
+        
+        pages, cursor = [], None
+        while True:
+            page = await transport_request_service.get_all_requests(self.db, limit=4, cursor=cursor)
+            pages.append([r.id for r in page])
+            if len(page) < 4:
+                break
+            cursor = transport_request_service.encode_cursor(page[-1])
+        self.assertEqual(sum(pages, []), [r.id for r in everything])
+        self.assertEqual(len(pages), 3)
+        
+        newest = await transport_request_service.get_user_requests(self.db, self.user.id, limit=3)
+        self.assertEqual([r.id for r in newest], [r.id for r in everything[::-1][:3]])
+        failed = await transport_request_service.get_all_requests(
+            self.db, statuses=['FAILED'], robot_id=self.robots[0].id, created_from=start + timedelta(seconds=1)
+        )
+        self.assertEqual([r.created_at for r in failed], [start + timedelta(seconds=3)])
+        with self.assertRaises(ValueError):
+            await transport_request_service.get_all_requests(self.db, cursor="not-a-cursor")
+
+    async def test_lifecycle_single_commit(self):
+        """Каждый переход — один COMMIT; робот занимается и освобождается в той же транзакции"""
+        commits = []
+        event.listen(self.db.sync_session, "after_commit", commits.append)
+        
+        request = await self._create_request(self.robots[0])
+        self.assertEqual(len(commits), 1)
+        self.assertEqual((await robot_service.get_robot(self.db, self.robots[0].id)).status, "BUSY")
+        with self.assertRaises(ValueError):
+            await self._create_request(self.robots[0])
+        
+        with self.assertRaises(ValueError):
+            await transport_request_service.transition_request(self.db, request.id, "FAILED", expected=("READY",))
+        self.assertIsNone(await transport_request_service.transition_request(self.db, 999, "FAILED"))
+        
+        commits.clear()
+        await trajectory_service.create_trajectory(self.db, TrajectoryCreate(request_id=request.id, path_data="[]"))
+        rejected = await transport_request_service.transition_request(self.db, request.id, "FAILED", expected=("READY",))
+        self.assertEqual((len(commits), rejected.status), (2, "FAILED"))
+        self.assertEqual((await robot_service.get_robot(self.db, self.robots[0].id)).status, "IDLE")
+
+    async def test_trajectory_after_cancel_in_planning(self):
+        """Траектория к заявке, отменённой во время планирования, не записывается"""
+        request = await self._create_request(self.robots[0])
+        await transport_request_service.claim_pending_requests(self.db, limit=1)
+        await transport_request_service.cancel_request(self.db, request.id)
+        
+        with self.assertRaises(ValueError):
+            await trajectory_service.create_trajectory(self.db, TrajectoryCreate(request_id=request.id, path_data="[]"))
+        self.assertEqual((await transport_request_service.get_transport_request(self.db, request.id)).status, "FAILED")
+        self.assertIsNone(await trajectory_service.get_trajectory_by_request(self.db, request.id))
+        self.assertEqual((await robot_service.get_robot(self.db, self.robots[0].id)).status, "IDLE")
+
+    async def test_unit_of_work_rolls_back_written_changes(self):
+        """ValueError после flush или UPDATE (в том числе во вложенном блоке) откатывает запись"""
+        names = [robot.name for robot in self.robots]
+        with self.assertRaises(ValueError):
+            async with unit_of_work(self.db):
+                async with unit_of_work(self.db):
+                    self.db.add(models.Robot(name="Ghost", current_map_id=self.test_map.id))
+                    await self.db.flush()
+                    raise ValueError("проверка не прошла")
+        with self.assertRaises(ValueError):
+            async with unit_of_work(self.db):
+                await self.db.execute(update(models.Robot).values(status="BUSY"))
+                raise ValueError("проверка не прошла")
+        
+        rows = (await self.db.execute(select(models.Robot.name, models.Robot.status))).all()
+        self.assertEqual(sorted(rows), [(name, "IDLE") for name in names])
+
+    @unittest.skipUnless(fast_json.orjson, "orjson не установлен")
+    async def test_fast_json_matches_schema(self):
+        """Быстрый путь списков отдаёт тот же JSON, что и сериализация через схемы"""
+        for robot in self.robots:
+            await self._create_request(robot)
+        adapter = TypeAdapter(List[TransportRequest])
+        page = await transport_request_service.get_all_requests(self.db)
+        rows = await transport_request_service.get_all_requests(self.db, rows=True)
+        self.assertEqual(fast_json.dump_rows(rows, fast_json.REQUEST_FIELDS),
+                         adapter.dump_json(adapter.validate_python(page, from_attributes=True)))
+        
+        slow = await robot_service.get_all_robots_json(self.db)
+        robot_lists.invalidate()
+        settings.FAST_JSON = True
+        try:
+            self.assertEqual(await robot_service.get_all_robots_json(self.db), slow)
+        finally:
+            settings.FAST_JSON = False
+            robot_lists.invalidate()
+
+if __name__ == '__main__':
+    unittest.main()
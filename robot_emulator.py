@@ -1,14 +1,29 @@
+import argparse
+import asyncio
 import time
-import requests
-import json
 import logging
-from datetime import datetime
-from typing import List, Dict
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+
+import httpx
+import numpy as np
+
+from planner.codec import decode_trajectory, columns_to_records, parse_path_string, PathStringStream
+from planner.simulation import FleetSimulation
 
 # Настройки
 API_BASE_URL = "http://192.168.56.104/api"
-POLL_INTERVAL = 1  # секунды
-MOVE_SPEED = 0.005   # метров в секунду (виртуальная скорость)
+POLL_INTERVAL = 1  # секунды (пауза, если лента событий недоступна)
+LONG_POLL_TIMEOUT = 25  # сколько ждать события в одном long-poll запросе, секунды
+STEP_INTERVAL = 0.05  # шаг симуляции движения и период отправки позиций, секунды (20 Гц)
+TIME_SCALE = 1.0  # секунд симуляции за секунду реального времени
+MAX_CATCHUP_STEPS = 20  # шагов симуляции подряд, если event loop отстал (дальше отставание сбрасывается)
+STREAM_CHUNK = 64 * 1024  # размер части при потоковой загрузке траектории, байт
+POSITION_FLUSH_INTERVAL = 0.1  # как часто буфер позиций отправляется в API, секунды (10 Гц)
+POSITION_BATCH_MAX = 5000  # отметок в буфере, после которых он отправляется сразу
+MAX_CONNECTIONS = 64  # соединений в пуле HTTP-клиента (общий для всех роботов)
+FLEET_MAP_ID = 1  # карта, на которой создаются роботы эмулятора
+FLEET_PREFIX = "emulator"  # имена роботов эмулятора: emulator-0, emulator-1, ...
+ROBOTS_PAGE = 1000  # роботов в одном запросе списка
 
 # Настройка логирования
 logging.basicConfig(
@@ -16,170 +31,491 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
+# Запросы тысяч роботов не пишем в лог по одному
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+class PositionBuffer:
+    """
+    Буфер отметок позиций роботов. Отметки всех роботов копятся и уходят
+    в API одним запросом раз в interval секунд (фоновая задача) или сразу
+    при переполнении. Если отправка не удалась, последние отметки роботов
+    остаются в буфере до следующей попытки.
+    """
+
+    def __init__(self, send: Callable[[List[Dict]], Awaitable[bool]],
+                 interval: float = POSITION_FLUSH_INTERVAL, max_size: int = POSITION_BATCH_MAX):
+        self._send = send
+        self.interval = interval
+        self.max_size = max_size
+        self._samples: List[Dict] = []
+        self._flush_lock = asyncio.Lock()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, robot_id: int, x: float, y: float):
+        if self._task is None:
+            self.start()
+        self._samples.append({"robot_id": robot_id, "x": x, "y": y, "t": time.time()})
+        if len(self._samples) >= self.max_size:
+            self._full.set()
+
+    def add_many(self, robot_ids: List[int], xs: List[float], ys: List[float]):
+        """Отметки нескольких роботов с одним временем"""
+        if self._task is None:
+            self.start()
+        t = time.time()
+        self._samples.extend({"robot_id": robot_id, "x": x, "y": y, "t": t}
+                             for robot_id, x, y in zip(robot_ids, xs, ys))
+        if len(self._samples) >= self.max_size:
+            self._full.set()
+
+    async def flush(self) -> bool:
+        """Отправляет накопленные отметки; False — отправка не удалась"""
+        # Отправки идут по одной, чтобы отметки робота не обгоняли друг друга
+        async with self._flush_lock:
+            samples, self._samples = self._samples, []
+            if not samples or await self._send(samples):
+                return True
+            # Повторно отправляем только последнюю позицию каждого робота
+            latest = {sample["robot_id"]: sample for sample in samples}
+            self._samples[:0] = latest.values()
+            return False
+
+    def start(self):
+        """Запускает периодическую отправку в текущем event loop"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка отправки позиций: {e}")
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
 
 class RobotEmulator:
-    def __init__(self):
-        self.active_robots = {}  # robot_id -> current_trajectory_info
-    
-    def get_in_progress_requests(self) -> List[Dict]:
-        """Получает IN_PROGRESS заявки"""
+    """
+    Эмулятор парка роботов в одном процессе: каждая IN_PROGRESS заявка
+    обрабатывается своей задачей asyncio, а движение всех активных роботов
+    считает одна симуляция (FleetSimulation) с шагом STEP_INTERVAL.
+    Запросы к API идут через общий пул соединений.
+    time_scale — во сколько раз симуляция быстрее реального времени.
+    fleet_size — сколько роботов эмулировать: недостающие роботы
+    emulator-N создаются на карте map_id, заявки остальных роботов
+    не обрабатываются; None — обрабатываются заявки всех роботов.
+    """
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None, fleet_size: Optional[int] = None,
+                 map_id: int = FLEET_MAP_ID, max_connections: int = MAX_CONNECTIONS,
+                 time_scale: float = TIME_SCALE):
+        self._own_client = client is None
+        self.client = client or httpx.AsyncClient(
+            base_url=API_BASE_URL,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(30.0, read=LONG_POLL_TIMEOUT + 10),
+        )
+        self.fleet_size = fleet_size
+        self.map_id = map_id
+        self.fleet: Optional[Set[int]] = None  # id роботов эмулятора (None — все роботы)
+        self.active_robots: Dict[int, asyncio.Task] = {}  # robot_id -> задача движения
+        self.positions = PositionBuffer(self.send_positions)
+        self.bulk_positions = True  # API поддерживает POST /robots/positions
+        self.time_scale = time_scale
+        self.simulation = FleetSimulation(dt=STEP_INTERVAL)
+        # robot_id -> (прибытие в конец траектории, время симуляции на старте)
+        self._arrivals: Dict[int, Tuple[asyncio.Future, float]] = {}
+        self._ticker: Optional[asyncio.Task] = None
+
+    async def ensure_fleet(self) -> Optional[Set[int]]:
+        """Находит роботов эмулятора и создаёт недостающих (если задан fleet_size)"""
+        if self.fleet_size is None:
+            return None
+        names = {f"{FLEET_PREFIX}-{i}" for i in range(self.fleet_size)}
+        fleet = {}
+        skip = 0
+        while True:
+            response = await self.client.get("/robots/", params={"skip": skip, "limit": ROBOTS_PAGE})
+            response.raise_for_status()
+            page = response.json()
+            fleet.update((robot["name"], robot["id"]) for robot in page if robot["name"] in names)
+            if len(page) < ROBOTS_PAGE:
+                break
+            skip += ROBOTS_PAGE
+
+        missing = sorted(names - fleet.keys())
+        if missing:
+            logger.info(f"Создаём {len(missing)} роботов эмулятора на карте {self.map_id}")
+            responses = await asyncio.gather(*[
+                self.client.post("/robots/", json={"name": name, "current_map_id": self.map_id})
+                for name in missing
+            ])
+            for response in responses:
+                response.raise_for_status()
+                robot = response.json()
+                fleet[robot["name"]] = robot["id"]
+        self.fleet = set(fleet.values())
+        logger.info(f"Роботов в парке эмулятора: {len(self.fleet)}")
+        return self.fleet
+
+    async def get_in_progress_requests(self) -> List[Dict]:
+        """Получает IN_PROGRESS заявки (фильтр на сервере, по страницам)"""
+        in_progress = []
+        params = {"status": "IN_PROGRESS", "limit": 1000}
         try:
-            response = requests.get(f"{API_BASE_URL}/requests/")
-            if response.status_code == 200:
-                all_requests = response.json()
-                in_progress = [r for r in all_requests if r.get("status") == "IN_PROGRESS"]
-                return in_progress
+            while True:
+                response = await self.client.get("/requests/", params=params)
+                if response.status_code != 200:
+                    break
+                in_progress.extend(response.json())
+                cursor = response.headers.get("X-Next-Cursor")
+                if not cursor:
+                    break
+                params["cursor"] = cursor
         except Exception as e:
             logger.error(f"Ошибка получения заявок: {e}")
-        return []
-    
-    def get_trajectory_for_request(self, request_id: int) -> List[Dict]:
-        """Получает траекторию для заявки"""
+        return in_progress
+
+    async def wait_for_events(self, after: Optional[int], statuses: Optional[List[str]] = None) -> Optional[Dict]:
+        """Long-poll ленты статусов заявок (None — лента недоступна)"""
+        params = {"timeout": LONG_POLL_TIMEOUT}
+        if after is not None:
+            params["after"] = after
+        if statuses:
+            params["status"] = statuses
         try:
-            response = requests.get(f"{API_BASE_URL}/trajectories/request/{request_id}")
+            response = await self.client.get("/requests/events", params=params)
+            if response.status_code == 200:
+                return response.json()
+        except Exception as e:
+            logger.error(f"Ошибка ленты событий: {e}")
+        return None
+
+    async def iter_trajectory_for_request(self, request_id: int) -> AsyncIterator[np.ndarray]:
+        """
+        Траектория заявки частями (структурированные массивы точек).
+        Двоичный формат приходит целиком; строка старого формата читается
+        потоком, и каждая часть отдаётся сразу после разбора.
+        """
+        try:
+            response = await self.client.get(f"/trajectories/request/{request_id}/binary")
+            if response.status_code == 200:
+                fields, columns = decode_trajectory(response.content)
+                yield self._valid_points(columns_to_records(fields, columns))
+                return
+        except Exception as e:
+            logger.error(f"Ошибка получения двоичной траектории для заявки {request_id}: {e}")
+
+        try:
+            async with self.client.stream("GET", f"/trajectories/request/{request_id}/text") as response:
+                if response.status_code == 200:
+                    parser = PathStringStream()
+                    async for chunk in response.aiter_text(chunk_size=STREAM_CHUNK):
+                        points = self._valid_points(parser.feed(chunk))
+                        if len(points):
+                            yield points
+                    yield self._valid_points(parser.close())
+                    return
+        except Exception as e:
+            logger.error(f"Ошибка потоковой загрузки траектории для заявки {request_id}: {e}")
+            return
+
+        try:
+            response = await self.client.get(f"/trajectories/request/{request_id}")
             if response.status_code == 200:
                 trajectory = response.json()
-                return self.parse_trajectory(trajectory.get("path_data", ""))
+                yield self.parse_trajectory(trajectory.get("path_data", ""))
         except Exception as e:
             logger.error(f"Ошибка получения траектории для заявки {request_id}: {e}")
-        return []
-    
-    def parse_trajectory(self, path_string: str) -> List[Dict]:
-        """Парсит строку траектории в список точек"""
-        if not path_string:
-            return []
-        
-        points = []
+
+    async def get_trajectory_for_request(self, request_id: int) -> np.ndarray:
+        """Получает траекторию для заявки целиком"""
+        chunks = [chunk async for chunk in self.iter_trajectory_for_request(request_id)]
+        return np.concatenate(chunks) if chunks else self.parse_trajectory("")
+
+    def parse_trajectory(self, path_string: str) -> np.ndarray:
+        """Парсит строку траектории в структурированный массив точек (поля x, y, ...)"""
         try:
-            point_strings = path_string.split(';')
-            for point_str in point_strings:
-                if not point_str.strip():
-                    continue
-                    
-                point = {}
-                pairs = point_str.split(',')
-                for pair in pairs:
-                    if ':' in pair:
-                        key, value = pair.split(':', 1)
-                        try:
-                            point[key] = float(value)
-                        except ValueError:
-                            point[key] = value
-                
-                if 'x' in point and 'y' in point:
-                    points.append(point)
-            
+            points = self._valid_points(parse_path_string(path_string or ""))
             logger.debug(f"Распарсено {len(points)} точек траектории")
-            
+            return points
         except Exception as e:
             logger.error(f"Ошибка парсинга траектории: {e}")
-        
-        return points
-    
-    def update_robot_position(self, robot_id: int, x: float, y: float) -> bool:
+            return self._valid_points(parse_path_string(""))
+
+    @staticmethod
+    def _valid_points(points: np.ndarray) -> np.ndarray:
+        """Только точки с координатами x и y"""
+        names = points.dtype.names or ()
+        if 'x' not in names or 'y' not in names:
+            return np.empty(0, dtype=[('x', np.float64), ('y', np.float64)])
+        return points[~(np.isnan(points['x']) | np.isnan(points['y']))]
+
+    async def update_robot_position(self, robot_id: int, x: float, y: float) -> bool:
         """Обновляет позицию робота через API"""
         try:
-            response = requests.patch(
-                f"{API_BASE_URL}/robots/{robot_id}/position?x={x}&y={y}"
-            )
+            response = await self.client.patch(f"/robots/{robot_id}/position", params={"x": x, "y": y})
             return response.status_code == 200
         except Exception as e:
             logger.error(f"Ошибка обновления позиции робота {robot_id}: {e}")
             return False
-    
-    def complete_request(self, request_id: int) -> bool:
+
+    async def send_positions(self, samples: List[Dict]) -> bool:
+        """Отправляет пачку отметок позиций одним запросом"""
+        if self.bulk_positions:
+            try:
+                response = await self.client.post("/robots/positions", json={"positions": samples})
+            except Exception as e:
+                logger.error(f"Ошибка отправки позиций: {e}")
+                return False
+            if response.status_code == 200:
+                unknown = response.json().get("unknown")
+                if unknown:
+                    logger.warning(f"API не знает роботов {unknown}")
+                return True
+            if response.status_code != 404:
+                logger.error(f"Ошибка отправки позиций: {response.status_code}")
+                return False
+            # Старый API без пакетного обновления
+            logger.info("Пакетное обновление позиций недоступно, отправляем по одной")
+            self.bulk_positions = False
+
+        latest = {sample["robot_id"]: sample for sample in samples}
+        results = await asyncio.gather(*[self.update_robot_position(robot_id, sample["x"], sample["y"])
+                                         for robot_id, sample in latest.items()])
+        return all(results)
+
+    async def complete_request(self, request_id: int) -> bool:
         """Завершает заявку"""
         try:
-            response = requests.patch(f"{API_BASE_URL}/requests/{request_id}/complete")
+            response = await self.client.patch(f"/requests/{request_id}/complete")
             return response.status_code == 200
         except Exception as e:
             logger.error(f"Ошибка завершения заявки {request_id}: {e}")
             return False
-    
-    def process_robot_movement(self, robot_id: int, trajectory: List[Dict]):
-        """Обрабатывает движение робота по траектории"""
-        if not trajectory:
-            logger.error(f"Нет траектории для робота {robot_id}")
-            return
-        
-        logger.info(f"Робот {robot_id} начинает движение по траектории ({len(trajectory)} точек)")
-        
-        # Двигаемся по точкам траектории
-        for i, point in enumerate(trajectory):
-            x = point.get('x', 0)
-            y = point.get('y', 0)
-            
-            # Обновляем позицию
-            if self.update_robot_position(robot_id, x, y):
-                logger.debug(f"Робот {robot_id} -> точка {i+1}/{len(trajectory)}: ({x:.2f}, {y:.2f})")
-            
-            # Задержка для имитации движения
-            time.sleep(MOVE_SPEED)
-        
-        logger.info(f"Робот {robot_id} завершил движение")
-    
-    def process_request(self, request: Dict):
+
+    async def process_robot_movement(self, robot_id: int,
+                                     trajectory: Union[np.ndarray, AsyncIterator[np.ndarray]]) -> int:
+        """
+        Обрабатывает движение робота по траектории (массиву точек или их частям).
+        Робот начинает движение по первой полученной части, следующие части
+        дописываются в симуляцию по мере загрузки; пока поток не закрыт, робот
+        ждёт продолжения в последней полученной точке и не прибывает. Позиции
+        уходят в буфер каждый шаг. Возвращает число точек траектории.
+        """
+        arrival = asyncio.get_running_loop().create_future()
+        count = 0
+        planned = 0.0
+        try:
+            async for chunk in _as_chunks(trajectory):
+                if not len(chunk):
+                    continue
+                if not count:
+                    self._arrivals[robot_id] = (arrival, self.simulation.time)
+                    planned = self.simulation.add(robot_id, chunk, final=False)
+                    logger.info(f"Робот {robot_id} начинает движение по траектории")
+                    self._start_ticker()
+                else:
+                    planned = self.simulation.extend(robot_id, chunk)
+                count += len(chunk)
+            if not count:
+                logger.error(f"Нет траектории для робота {robot_id}")
+                return 0
+            self.simulation.finish(robot_id)
+            logger.info(f"Траектория робота {robot_id} получена: {count} точек, "
+                        f"плановое время {planned:.1f} с")
+            elapsed = await arrival
+        finally:
+            # Отменённая задача или ошибка загрузки снимают робота с симуляции
+            self.simulation.remove(robot_id)
+            self._arrivals.pop(robot_id, None)
+
+        # Конечная позиция должна быть записана до завершения заявки
+        if not await self.positions.flush():
+            logger.error(f"Не удалось отправить позиции робота {robot_id}")
+
+        logger.info(f"Робот {robot_id} завершил движение за {elapsed:.1f} с (план {planned:.1f} с)")
+        return count
+
+    def _start_ticker(self):
+        if self._ticker is None or self._ticker.done():
+            self._ticker = asyncio.create_task(self._tick())
+
+    async def _tick(self):
+        """
+        Шаги симуляции с фиксированным dt по реальному времени (с учётом
+        time_scale). Если event loop не успевает, шаги догоняются пачкой,
+        но не больше MAX_CATCHUP_STEPS — остальное отставание отбрасывается.
+        Задача завершается, когда движущихся роботов не осталось.
+        """
+        period = STEP_INTERVAL / self.time_scale
+        deadline = time.monotonic()
+        while len(self.simulation):
+            now = time.monotonic()
+            steps = 0
+            while deadline <= now and steps < MAX_CATCHUP_STEPS:
+                self.step_simulation()
+                deadline += period
+                steps += 1
+            if deadline <= now:
+                logger.warning(f"Симуляция отстаёт от реального времени на {now - deadline:.2f} с")
+                deadline = now
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+
+    def step_simulation(self):
+        """Один шаг симуляции: позиции движущихся роботов — в буфер, прибывшие — завершают движение"""
+        ids, xs, ys, finished = self.simulation.step()
+        if len(ids):
+            self.positions.add_many(ids.tolist(), xs.tolist(), ys.tolist())
+        for robot_id in finished:
+            arrival, started = self._arrivals.pop(robot_id, (None, 0.0))
+            if arrival is not None and not arrival.done():
+                arrival.set_result(self.simulation.time - started)
+
+    async def process_request(self, request: Dict):
         """Обрабатывает одну IN_PROGRESS заявку"""
         request_id = request.get("id")
         robot_id = request.get("robot_id")
-        
+
         logger.info(f"Обработка IN_PROGRESS заявки {request_id} для робота {robot_id}")
-        
-        # Получаем траекторию
-        trajectory = self.get_trajectory_for_request(request_id)
-        
-        if not trajectory:
+
+        # Двигаем робота по мере получения траектории
+        moved = await self.process_robot_movement(robot_id, self.iter_trajectory_for_request(request_id))
+
+        if not moved:
             logger.error(f"Нет траектории для заявки {request_id}")
             return
-        
-        # Запускаем движение робота
-        self.process_robot_movement(robot_id, trajectory)
-        
+
         # Завершаем заявку
-        if self.complete_request(request_id):
+        if await self.complete_request(request_id):
             logger.info(f"Заявка {request_id} завершена (COMPLETED)")
         else:
             logger.error(f"Не удалось завершить заявку {request_id}")
-    
-    def run(self):
+
+    def start_request(self, request: Dict) -> Optional[asyncio.Task]:
+        """Запускает движение робота по заявке, если робот наш и ещё не занят"""
+        robot_id = request.get("robot_id")
+        if self.fleet is not None and robot_id not in self.fleet:
+            return None
+        # Проверяем, не обрабатывается ли уже этот робот
+        if robot_id in self.active_robots:
+            logger.debug(f"Робот {robot_id} уже в обработке")
+            return None
+
+        task = asyncio.create_task(self._guarded(request))
+        self.active_robots[robot_id] = task
+        task.add_done_callback(lambda _: self.active_robots.pop(robot_id, None))
+        return task
+
+    async def _guarded(self, request: Dict):
+        try:
+            await self.process_request(request)
+        except Exception as e:
+            logger.error(f"Ошибка обработки заявки {request.get('id')}: {e}")
+
+    async def run(self):
         """Основной цикл эмулятора"""
         logger.info("Эмулятор роботов запущен")
-        logger.info(f"Скорость движения: {MOVE_SPEED} м/с")
-        
-        while True:
-            try:
-                # Получаем IN_PROGRESS заявки
-                in_progress_requests = self.get_in_progress_requests()
-                
-                if in_progress_requests:
-                    logger.info(f"Найдено {len(in_progress_requests)} IN_PROGRESS заявок")
-                    
-                    # Обрабатываем каждую заявку
-                    for request in in_progress_requests:
-                        # Проверяем, не обрабатывается ли уже этот робот
-                        robot_id = request.get("robot_id")
-                        if robot_id not in self.active_robots:
-                            self.active_robots[robot_id] = request
-                            self.process_request(request)
-                            del self.active_robots[robot_id]
+        logger.info(f"Симуляция движения: шаг {STEP_INTERVAL} с, ускорение x{self.time_scale:g}")
+
+        try:
+            await self.ensure_fleet()
+            cursor = None
+            while True:
+                try:
+                    if cursor is None:
+                        # Полная синхронизация: курсор ленты, затем все IN_PROGRESS заявки
+                        feed = await self.wait_for_events(None)
+                        cursor = feed["last_id"] if feed else None
+                        in_progress_requests = await self.get_in_progress_requests()
+                    else:
+                        # Ждем переходов в IN_PROGRESS из ленты событий
+                        feed = await self.wait_for_events(cursor, ["IN_PROGRESS"])
+                        if feed is None or feed["reset"]:
+                            cursor = None
+                            in_progress_requests = []
                         else:
-                            logger.debug(f"Робот {robot_id} уже в обработке")
-                else:
-                    logger.debug("Нет IN_PROGRESS заявок")
-                
-                # Ждем перед следующей проверкой
-                time.sleep(POLL_INTERVAL)
-                
-            except KeyboardInterrupt:
-                logger.info("Эмулятор остановлен")
-                break
-            except Exception as e:
-                logger.error(f"Ошибка в основном цикле: {e}")
-                time.sleep(POLL_INTERVAL)
+                            cursor = feed["last_id"]
+                            in_progress_requests = [
+                                {"id": e["request_id"], "robot_id": e["robot_id"], "status": e["status"]}
+                                for e in feed["events"]
+                            ]
+
+                    if in_progress_requests:
+                        logger.info(f"Найдено {len(in_progress_requests)} IN_PROGRESS заявок, "
+                                    f"в движении {len(self.active_robots)} роботов")
+                        for request in in_progress_requests:
+                            self.start_request(request)
+                    else:
+                        logger.debug("Нет IN_PROGRESS заявок")
+
+                    # Без ленты событий — ждем перед следующей проверкой
+                    if cursor is None:
+                        await asyncio.sleep(POLL_INTERVAL)
+
+                except Exception as e:
+                    logger.error(f"Ошибка в основном цикле: {e}")
+                    await asyncio.sleep(POLL_INTERVAL)
+        finally:
+            await self.close()
+
+    async def close(self):
+        """Останавливает движение роботов и отправляет накопленные позиции"""
+        tasks = list(self.active_robots.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._ticker is not None:
+            self._ticker.cancel()
+            await asyncio.gather(self._ticker, return_exceptions=True)
+        await self.positions.stop()
+        if self._own_client:
+            await self.client.aclose()
+
+
+async def _as_chunks(trajectory: Union[np.ndarray, AsyncIterator[np.ndarray]]) -> AsyncIterator[np.ndarray]:
+    if isinstance(trajectory, np.ndarray):
+        yield trajectory
+        return
+    async for chunk in trajectory:
+        yield chunk
 
-def main():
-    emulator = RobotEmulator()
-    emulator.run()
+def main(fleet_size: Optional[int] = None, map_id: int = FLEET_MAP_ID,
+         max_connections: int = MAX_CONNECTIONS, time_scale: float = TIME_SCALE):
+    emulator = RobotEmulator(fleet_size=fleet_size, map_id=map_id, max_connections=max_connections,
+                             time_scale=time_scale)
+    try:
+        asyncio.run(emulator.run())
+    except KeyboardInterrupt:
+        logger.info("Эмулятор остановлен")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Эмулятор роботов")
+    parser.add_argument("--robots", type=int, default=None,
+                        help="сколько роботов эмулировать (создаются при нехватке); по умолчанию — все")
+    parser.add_argument("--map-id", type=int, default=FLEET_MAP_ID,
+                        help="карта для создаваемых роботов")
+    parser.add_argument("--connections", type=int, default=MAX_CONNECTIONS,
+                        help="соединений в пуле HTTP-клиента")
+    parser.add_argument("--time-scale", type=float, default=TIME_SCALE,
+                        help="во сколько раз симуляция движения быстрее реального времени")
+    args = parser.parse_args()
+    main(fleet_size=args.robots, map_id=args.map_id, max_connections=args.connections,
+         time_scale=args.time_scale)
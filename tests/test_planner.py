@@ -0,0 +1,376 @@
+import io
+import os
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+
+import numpy as np
+
+from planner import OccupancyGrid, TrajectoryCache, get_grid, clear_grid_cache, jps, expand_path, path_length, octile, find_path
+from planner.preprocess import (AUTO_PREPROCESS_CELLS, distance_transform, get_map_data, grid_distances,
+                                preprocess_occupancy, save_map_data, load_map_data)
+from planner.ocp import optimize_batch, VehicleParams, TRAJECTORY_FIELDS
+from planner.codec import encode_trajectory, decode_trajectory, parse_path_string, PathStringStream
+from planner.simulation import FleetSimulation, plan_times
+
+
+class TestGridPlanner(unittest.TestCase):
+    def setUp(self):
+        """Карта 20x20 со стеной посередине и проходом внизу"""
+        occupied = np.zeros((20, 20), dtype=bool)
+        occupied[0:17, 10] = True
+        self.grid = OccupancyGrid(1, occupied)
+
+    def test_path_avoids_obstacles(self):
+        """Путь проходит только по свободным ячейкам и огибает стену"""
+        cells = expand_path(jps(self.grid, (2, 2), (2, 17)))
+
+        self.assertEqual(cells[0], (2, 2))
+        self.assertEqual(cells[-1], (2, 17))
+        self.assertTrue(all(self.grid.is_free(r, c) for r, c in cells))
+        self.assertTrue(any(r >= 17 for r, _ in cells))
+
+    def test_path_is_optimal(self):
+        """Длина пути совпадает с кратчайшей октильной"""
+        cells = expand_path(jps(self.grid, (2, 2), (2, 17)))
+        # До прохода под стеной, два шага через него (без срезания углов) и обратно вверх
+        expected = octile(15, 7) + 2.0 + octile(15, 6)
+        self.assertAlmostEqual(path_length(cells), expected, places=6)
+
+    def test_unreachable_goal(self):
+        """Замкнутая область — путь не найден"""
+        occupied = np.zeros((10, 10), dtype=bool)
+        occupied[3:8, 3] = occupied[3:8, 7] = True
+        occupied[3, 3:8] = occupied[7, 3:8] = True
+        grid = OccupancyGrid(2, occupied)
+
+        self.assertIsNone(jps(grid, (0, 0), (5, 5)))
+        with self.assertRaises(ValueError):
+            find_path(grid, 0.5, 9.5, 5.5, 4.5, snap_radius=0)
+
+
+    def test_remote_grid_revalidated(self):
+        """Карта из API перепроверяется по ETag: 304 — та же сетка, новое изображение — новая подпись"""
+        from PIL import Image
+
+        def png(value):
+            buffer = io.BytesIO()
+            Image.fromarray(np.full((8, 8), value, dtype=np.uint8)).save(buffer, format="PNG")
+            return buffer.getvalue()
+
+        images = {'"v1"': png(255), '"v2"': png(0)}
+        current = ['"v1"']
+        sent = []
+
+        def fetch_image(etag=None):
+            sent.append(etag)
+            return (None, etag) if etag == current[0] else (images[current[0]], current[0])
+
+        clear_grid_cache()
+        try:
+            with mock.patch("planner.grid.REMOTE_REVALIDATE_INTERVAL", 0.0):
+                first = get_grid(7, "missing/7.png", fetch_image)
+                self.assertIs(get_grid(7, "missing/7.png", fetch_image), first)
+                current[0] = '"v2"'
+                changed = get_grid(7, "missing/7.png", fetch_image)
+        finally:
+            clear_grid_cache()
+        self.assertEqual(sent, [None, '"v1"', '"v1"'])
+        self.assertEqual(changed.signature, ("etag", '"v2"'))
+        self.assertTrue(changed.occupied.all())
+
+
+class TestMapPreprocess(unittest.TestCase):
+    def setUp(self):
+        occupied = np.random.default_rng(3).random((24, 30)) < 0.25
+        occupied[0:20, 15] = True
+        self.occupied = occupied
+
+    def test_distance_field(self):
+        """Поле расстояний совпадает с перебором (край карты — препятствие)"""
+        padded = np.ones((26, 32), dtype=bool)
+        padded[1:-1, 1:-1] = self.occupied
+        obstacles = np.argwhere(padded) - 1
+        cells = np.indices(self.occupied.shape).reshape(2, -1).T
+        expected = np.sqrt(((cells[:, None, :] - obstacles[None, :, :]) ** 2).sum(axis=2).min(axis=1))
+
+        np.testing.assert_allclose(distance_transform(self.occupied).ravel(), expected, rtol=1e-6)
+
+    def test_landmarks_keep_paths_optimal(self):
+        """С ориентирами ALT пути той же длины, что по Дейкстре; другая компонента — сразу None"""
+        grid = OccupancyGrid(1, self.occupied)
+        grid._map_data = preprocess_occupancy(self.occupied, landmark_count=4)
+        labels = grid._map_data.labels
+        self.assertGreater(grid._map_data.landmark_count, 0)
+
+        start = tuple(int(v) for v in np.argwhere(labels == np.bincount(labels[labels >= 0]).argmax())[0])
+        exact = grid_distances(self.occupied, start)
+        for goal in np.argwhere(np.isfinite(exact))[::7]:
+            goal = (int(goal[0]), int(goal[1]))
+            cells = expand_path(jps(grid, start, goal))
+            self.assertAlmostEqual(path_length(cells), exact[goal], places=6)
+        other = tuple(int(v) for v in np.argwhere((labels >= 0) & ~np.isfinite(exact))[0])
+        self.assertIsNone(jps(grid, start, other))
+
+    def test_sidecar_round_trip(self):
+        """Данные сохраняются рядом с картой и не подходят к изменённой карте"""
+        data = preprocess_occupancy(self.occupied, landmark_count=2)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "1.dist.npz")
+            save_map_data(path, self.occupied, data)
+            loaded = load_map_data(path, self.occupied)
+            np.testing.assert_array_equal(loaded.tables, data.tables)
+            np.testing.assert_array_equal(loaded.labels, data.labels)
+
+            changed = self.occupied.copy()
+            changed[0, 0] = not changed[0, 0]
+            self.assertIsNone(load_map_data(path, changed))
+
+    def test_no_sidecar_written_on_query(self):
+        """Без файла данных планировщик его не создаёт; большая карта идёт без поля расстояний"""
+        from PIL import Image
+
+        side = int(AUTO_PREPROCESS_CELLS ** 0.5) + 1
+        image = np.full((side, side), 255, dtype=np.uint8)
+        image[:side - 20, side // 2] = 0
+        with tempfile.TemporaryDirectory() as tmp:
+            map_file = os.path.join(tmp, "1.png")
+            Image.fromarray(image).save(map_file)
+            clear_grid_cache()
+            try:
+                grid = get_grid(1, map_file)
+                data = get_map_data(grid)
+                self.assertIsNone(data.clearance)
+                self.assertEqual(data.landmark_count, 0)
+                cells = expand_path(jps(grid, (2, 2), (2, side - 3)))
+                self.assertTrue(all(grid.is_free(r, c) for r, c in cells))
+                solution = optimize_batch([find_path(grid, 2.5, side - 2.5, side - 2.5, side - 2.5)], [grid])[0]
+                self.assertTrue(solution.feasible)
+            finally:
+                clear_grid_cache()
+            self.assertEqual(os.listdir(tmp), ["1.png"])
+
+
+class TestBatchOptimizer(unittest.TestCase):
+    def test_batch_is_feasible(self):
+        """Пачка траекторий: цель достигнута, ограничения модели соблюдены"""
+        occupied = np.zeros((20, 20), dtype=bool)
+        occupied[0:17, 10] = True
+        grid = OccupancyGrid(1, occupied)
+        references = [find_path(grid, 2.5, 17.5, 17.5, 17.5), find_path(grid, 1.5, 1.5, 8.5, 18.5)]
+
+        solutions = optimize_batch(references, [grid, grid])
+
+        self.assertEqual(len(solutions), 2)
+        for reference, solution in zip(references, solutions):
+            self.assertTrue(solution.feasible)
+            x, y, v, th, de, a, w = solution.states.T
+            self.assertLess(np.hypot(x[-1] - reference[-1][0], y[-1] - reference[-1][1]), 2 * VehicleParams.GOAL_TOL)
+            self.assertLessEqual(v.max(), VehicleParams.V_MAX + 1e-9)
+            self.assertLessEqual(np.abs(a).max(), VehicleParams.A_MAX + 1e-9)
+            self.assertLessEqual(np.abs(de).max(), VehicleParams.DE_MAX + 1e-9)
+            self.assertLessEqual(np.abs(w).max(), VehicleParams.W_MAX + 1e-9)
+
+
+class TestParallelPlanning(unittest.TestCase):
+    def test_pool_matches_serial(self):
+        """Пул процессов: результаты в порядке задач через границы пачек, как при расчёте в одном процессе"""
+        from planner_service import get_paths, get_paths_parallel
+
+        occupied = np.zeros((20, 20), dtype=bool)
+        occupied[0:17, 10] = True
+        # Замкнутая область: цель внутри неё недостижима
+        occupied[12:17, 13] = occupied[12:17, 17] = True
+        occupied[12, 13:18] = occupied[16, 13:18] = True
+        grid = OccupancyGrid(1, occupied)
+        tasks = [
+            (2.5, 17.5, 17.5, 17.5, grid),
+            (1.5, 1.5, 8.5, 18.5, grid),
+            (1.5, 1.5, 15.5, 5.5, grid),
+            (1.5, 10.5, 6.5, 3.5, grid),
+            (0.0, 0.0, 3.0, 4.0, None),
+        ]
+
+        serial = get_paths(tasks)
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            parallel = get_paths_parallel(tasks, pool, workers=2)
+
+        self.assertEqual([states is None for states in parallel], [False, False, True, False, False])
+        for (_, _, end_x, end_y, _), expected, states in zip(tasks, serial, parallel):
+            if states is None:
+                continue
+            np.testing.assert_allclose(states, expected)
+            self.assertLess(np.hypot(states[-1, 0] - end_x, states[-1, 1] - end_y), 2 * VehicleParams.GOAL_TOL)
+
+
+class TestTrajectoryUpload(unittest.TestCase):
+    @staticmethod
+    def _response(status: int, content: bytes, content_type: str):
+        import requests
+        response = requests.Response()
+        response.status_code = status
+        response._content = content
+        response.headers["Content-Type"] = content_type
+        return response
+
+    def _upload(self, binary_response):
+        import planner_service
+        states = np.zeros((3, 7))
+        with mock.patch.object(planner_service.requests, "post",
+                               side_effect=[binary_response, self._response(201, b"{}", "application/json")]) as post:
+            created = planner_service.create_trajectory(7, states)
+        return created, [call.args[0].rsplit("/", 2)[-2:] for call in post.call_args_list]
+
+    def test_fallback_to_text_endpoint(self):
+        """404 маршрута — от FastAPI или HTML-страница прокси — переключает на строковый формат"""
+        for missing in (self._response(404, b'{"detail": "Not Found"}', "application/json"),
+                        self._response(404, b"<html>404 Not Found</html>", "text/html"),
+                        self._response(404, b"not json", "application/json")):
+            created, urls = self._upload(missing)
+            self.assertTrue(created)
+            self.assertEqual(urls, [["trajectories", "binary"], ["trajectories", ""]])
+
+    def test_missing_request_is_not_fallback(self):
+        """404 заявки — ошибка, строковый формат не пробуется"""
+        created, urls = self._upload(self._response(404, b'{"detail": "Request 7 not found"}', "application/json"))
+        self.assertFalse(created)
+        self.assertEqual(urls, [["trajectories", "binary"]])
+
+
+class TestTrajectoryCache(unittest.TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.grid = OccupancyGrid(1, np.zeros((10, 10), dtype=bool), signature=(1, 100))
+        self.cache = TrajectoryCache(max_size=2, ttl=60, quantum=0.5, clock=lambda: self.now)
+
+    def test_quantized_hit_and_ttl(self):
+        """Попадание в пределах шага квантования, вытеснение по возрасту"""
+        self.cache.put(self.grid, 1.0, 1.0, 5.0, 5.0, np.zeros((3, 7)))
+
+        self.assertIsNotNone(self.cache.get(self.grid, 1.2, 1.4, 5.1, 5.3))
+        self.assertIsNone(self.cache.get(self.grid, 1.6, 1.0, 5.0, 5.0))
+        self.now = 61.0
+        self.assertIsNone(self.cache.get(self.grid, 1.0, 1.0, 5.0, 5.0))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_lru_and_map_change(self):
+        """Вытесняется давно не использованная запись; смена файла карты сбрасывает записи"""
+        self.cache.put(self.grid, 1, 1, 5, 5, np.zeros((3, 7)))
+        self.cache.put(self.grid, 2, 2, 5, 5, np.zeros((3, 7)))
+        self.cache.get(self.grid, 1, 1, 5, 5)
+        self.cache.put(self.grid, 3, 3, 5, 5, np.zeros((3, 7)))
+        self.assertIsNone(self.cache.get(self.grid, 2, 2, 5, 5))
+
+        changed = OccupancyGrid(1, self.grid.occupied, signature=(2, 100))
+        self.assertIsNone(self.cache.get(changed, 1, 1, 5, 5))
+        self.assertEqual(len(self.cache), 0)
+
+
+class TestTrajectoryCodec(unittest.TestCase):
+    def test_round_trip(self):
+        """Кодирование и декодирование без потерь (в пределах float32), сжатие работает"""
+        states = np.cumsum(np.random.default_rng(0).normal(0, 0.1, (500, 7)), axis=0)
+
+        for compress in (True, False):
+            data = encode_trajectory(states, compress=compress)
+            fields, columns = decode_trajectory(data)
+            self.assertEqual(fields, TRAJECTORY_FIELDS)
+            np.testing.assert_array_equal(columns.T, states.astype(np.float32))
+        self.assertLess(len(encode_trajectory(states)), len(encode_trajectory(states, compress=False)))
+
+        with self.assertRaises(ValueError):
+            decode_trajectory(encode_trajectory(states)[:-8])
+
+    def test_path_string(self):
+        """Строка старого формата: векторный и построчный разбор, потоковый разбор по частям"""
+        path_string = "x:1.0,y:2.0,v:0.5;x:-3.5,y:4.25,v:1e-3;x:120.125,y:-7.5,v:0"
+        points = parse_path_string(path_string)
+        self.assertEqual(points.dtype.names, ("x", "y", "v"))
+        self.assertEqual(points.tolist(), [(1.0, 2.0, 0.5), (-3.5, 4.25, 0.001), (120.125, -7.5, 0.0)])
+
+        # Точки с разными ключами: недостающие значения — NaN
+        mixed = parse_path_string("x:1,y:2;y:5,x:4;x:3")
+        self.assertEqual(mixed[["x"]].tolist(), [(1.0,), (4.0,), (3.0,)])
+        self.assertTrue(np.isnan(mixed["y"][2]))
+
+        stream = PathStringStream()
+        chunks = [stream.feed(path_string[i:i + 7]) for i in range(0, len(path_string), 7)]
+        chunks.append(stream.close())
+        np.testing.assert_array_equal(np.concatenate([c for c in chunks if len(c)]), points)
+
+
+class TestFleetSimulation(unittest.TestCase):
+    def test_arrival_at_planned_time(self):
+        """Роботы идут по траекториям с плановой скоростью и прибывают в их конечные точки"""
+        occupied = np.zeros((20, 20), dtype=bool)
+        occupied[0:17, 10] = True
+        grid = OccupancyGrid(1, occupied)
+        references = [find_path(grid, 2.5, 17.5, 17.5, 17.5), find_path(grid, 1.5, 1.5, 8.5, 18.5)]
+        dtype = [(field, np.float64) for field in TRAJECTORY_FIELDS]
+        trajectories = [np.array([tuple(row) for row in solution.states], dtype=dtype)
+                        for solution in optimize_batch(references, [grid, grid])]
+
+        simulation = FleetSimulation(dt=0.05, capacity=1)
+        planned = {robot_id: simulation.add(robot_id, trajectories[robot_id % 2]) for robot_id in range(10)}
+        arrived = {}
+        worst = 0.0
+        while len(simulation) and simulation.time < 100:
+            ids, xs, ys, finished = simulation.step()
+            for robot_id, x, y in zip(ids.tolist(), xs.tolist(), ys.tolist()):
+                if robot_id in finished:
+                    end = trajectories[robot_id % 2][-1]
+                    self.assertEqual((x, y), (end['x'], end['y']))
+                    arrived[robot_id] = simulation.time
+                else:
+                    # Робот не уходит далеко от линии траектории
+                    points = trajectories[robot_id % 2]
+                    worst = max(worst, np.hypot(points['x'] - x, points['y'] - y).min())
+
+        self.assertEqual(arrived.keys(), planned.keys())
+        for robot_id, duration in planned.items():
+            self.assertAlmostEqual(arrived[robot_id], duration, delta=0.1)
+        self.assertLess(worst, 2.0)
+
+
+    def test_streamed_trajectory(self):
+        """Траектория частями: та же, что целиком; пока она не закрыта, робот ждёт и не прибывает"""
+        occupied = np.zeros((20, 20), dtype=bool)
+        grid = OccupancyGrid(1, occupied)
+        dtype = [(field, np.float64) for field in TRAJECTORY_FIELDS]
+        states = optimize_batch([find_path(grid, 1.5, 1.5, 15.5, 12.5)], [grid])[0].states
+        points = np.array([tuple(row) for row in states], dtype=dtype)
+        parts = np.array_split(points, 3)
+
+        simulation = FleetSimulation(dt=0.05, capacity=1)
+        whole = simulation.add(1, points)
+        # Части двух роботов чередуются: отрезки переносятся в конец общих массивов
+        simulation.add(2, parts[0], final=False)
+        simulation.add(3, parts[0], final=False)
+        for part in parts[1:]:
+            streamed = simulation.extend(2, part)
+        simulation.finish(2)
+        self.assertAlmostEqual(streamed, whole)
+
+        arrived = {}
+        while len(arrived) < 2 and simulation.time < 100:
+            arrived.update((robot_id, simulation.time) for robot_id in simulation.step()[3])
+        self.assertAlmostEqual(arrived[1], arrived[2], delta=0.06)
+        # Робот 3 ждёт в конце первой части
+        self.assertIn(3, simulation)
+        end = parts[0][-1]
+        self.assertLess(np.hypot(*np.subtract(simulation.position(3), (end['x'], end['y']))), 0.5)
+
+        # Продолжение планируется от текущего момента (робот добавлен в момент 0)
+        planned = simulation.extend(3, np.concatenate(parts[1:]), final=True)
+        self.assertGreater(planned, simulation.time + whole - plan_times(parts[0])[-1])
+        finished = []
+        while 3 in simulation and simulation.time < 200:
+            finished += simulation.step()[3]
+        self.assertEqual(finished, [3])
+        # Отставание от плана то же, что у робота с целой траекторией
+        self.assertAlmostEqual(simulation.time - planned, arrived[1] - whole, delta=0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
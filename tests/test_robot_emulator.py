@@ -0,0 +1,183 @@
+import asyncio
+import json
+import unittest
+from unittest import mock
+
+import httpx
+import numpy as np
+
+from robot_emulator import PositionBuffer, RobotEmulator
+
+
+def make_client(handler) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://api")
+
+
+class TestPositionBuffer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.sent = []
+        self.ok = True
+
+    async def send(self, samples):
+        self.sent.append(samples)
+        return self.ok
+
+    async def test_flush_on_interval(self):
+        buffer = PositionBuffer(self.send, interval=0.02)
+        buffer.add(1, 1.0, 2.0)
+        buffer.add_many([2, 3], [3.0, 4.0], [5.0, 6.0])
+        await asyncio.sleep(0.1)
+        await buffer.stop()
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual([(s["robot_id"], s["x"], s["y"]) for s in self.sent[0]],
+                         [(1, 1.0, 2.0), (2, 3.0, 5.0), (3, 4.0, 6.0)])
+        self.assertEqual(len(buffer), 0)
+
+    async def test_flush_on_overflow(self):
+        buffer = PositionBuffer(self.send, interval=60.0, max_size=3)
+        buffer.add_many([1, 2], [0.0, 0.0], [0.0, 0.0])
+        await asyncio.sleep(0.02)
+        self.assertEqual(self.sent, [])
+        buffer.add(3, 0.0, 0.0)
+        await asyncio.sleep(0.02)
+        self.assertEqual([len(samples) for samples in self.sent], [3])
+        await buffer.stop()
+
+    async def test_failed_send_keeps_latest_sample(self):
+        buffer = PositionBuffer(self.send, interval=60.0)
+        self.ok = False
+        buffer.add(1, 1.0, 0.0)
+        buffer.add(2, 5.0, 0.0)
+        buffer.add(1, 2.0, 0.0)
+        self.assertFalse(await buffer.flush())
+        self.assertEqual(len(buffer), 2)
+
+        # Новые отметки идут после повторяемых
+        buffer.add(2, 6.0, 0.0)
+        self.ok = True
+        self.assertTrue(await buffer.flush())
+        await buffer.stop()
+        self.assertEqual([(s["robot_id"], s["x"]) for s in self.sent[-1]], [(1, 2.0), (2, 5.0), (2, 6.0)])
+
+
+class TestRobotEmulator(unittest.IsolatedAsyncioTestCase):
+    async def test_send_positions_falls_back_to_patch(self):
+        calls = []
+
+        def handler(request):
+            calls.append((request.method, request.url.path, dict(request.url.params)))
+            if request.url.path == "/robots/positions":
+                return httpx.Response(404, json={"detail": "Not Found"})
+            return httpx.Response(200, json={})
+
+        async with make_client(handler) as client:
+            emulator = RobotEmulator(client=client)
+            samples = [{"robot_id": 1, "x": 1.0, "y": 0.0, "t": 0.0},
+                       {"robot_id": 2, "x": 5.0, "y": 0.0, "t": 0.0},
+                       {"robot_id": 1, "x": 2.0, "y": 1.0, "t": 0.1}]
+            self.assertTrue(await emulator.send_positions(samples))
+            self.assertFalse(emulator.bulk_positions)
+            self.assertEqual(calls, [("POST", "/robots/positions", {}),
+                                     ("PATCH", "/robots/1/position", {"x": "2.0", "y": "1.0"}),
+                                     ("PATCH", "/robots/2/position", {"x": "5.0", "y": "0.0"})])
+
+            # Дальше — сразу по одной
+            calls.clear()
+            self.assertTrue(await emulator.send_positions(samples[:1]))
+            self.assertEqual([call[:2] for call in calls], [("PATCH", "/robots/1/position")])
+
+    async def test_send_positions_bulk(self):
+        bodies = []
+
+        def handler(request):
+            bodies.append(json.loads(request.content))
+            return httpx.Response(200, json={"updated": 1, "unknown": []})
+
+        async with make_client(handler) as client:
+            emulator = RobotEmulator(client=client)
+            samples = [{"robot_id": 1, "x": 1.0, "y": 0.0, "t": 0.0}]
+            self.assertTrue(await emulator.send_positions(samples))
+            self.assertTrue(emulator.bulk_positions)
+            self.assertEqual(bodies, [{"positions": samples}])
+
+    async def test_start_request_guards(self):
+        started, release = [], asyncio.Event()
+
+        async def process_request(request):
+            started.append(request["id"])
+            await release.wait()
+
+        async with make_client(lambda request: httpx.Response(404)) as client:
+            emulator = RobotEmulator(client=client)
+            emulator.fleet = {1, 2}
+            with mock.patch.object(emulator, "process_request", process_request):
+                self.assertIsNone(emulator.start_request({"id": 10, "robot_id": 3}))
+                task = emulator.start_request({"id": 11, "robot_id": 1})
+                self.assertIsNotNone(task)
+                # Робот уже в движении: вторая заявка не запускается
+                self.assertIsNone(emulator.start_request({"id": 12, "robot_id": 1}))
+                await asyncio.sleep(0)
+                release.set()
+                await task
+                await asyncio.sleep(0)
+            self.assertEqual(started, [11])
+            self.assertEqual(emulator.active_robots, {})
+
+    async def test_run_starts_fleet_requests_once(self):
+        polls = []
+
+        async def handler(request):
+            path = request.url.path
+            if path == "/requests/events":
+                polls.append(request.url.params.get("after"))
+                if len(polls) > 1:
+                    # Долгий опрос без новых событий
+                    await asyncio.sleep(0.05)
+                return httpx.Response(200, json={"last_id": 5, "reset": False, "events": []})
+            if path == "/requests/":
+                return httpx.Response(200, json=[
+                    {"id": 10, "robot_id": 1, "status": "IN_PROGRESS"},
+                    {"id": 11, "robot_id": 3, "status": "IN_PROGRESS"},
+                    {"id": 12, "robot_id": 2, "status": "IN_PROGRESS"},
+                ])
+            return httpx.Response(404)
+
+        started = []
+
+        async def process_request(request):
+            started.append(request["id"])
+            await asyncio.Event().wait()
+
+        async with make_client(handler) as client:
+            emulator = RobotEmulator(client=client)
+            emulator.fleet = {1, 2}
+            with mock.patch.object(emulator, "process_request", process_request):
+                run = asyncio.create_task(emulator.run())
+                await asyncio.sleep(0.2)
+                self.assertEqual(sorted(started), [10, 12])
+                self.assertEqual(sorted(emulator.active_robots), [1, 2])
+                # Следующие опросы ленты идут с курсором
+                self.assertEqual(polls[0], None)
+                self.assertTrue(polls[1:] and set(polls[1:]) == {"5"})
+                run.cancel()
+                await asyncio.gather(run, return_exceptions=True)
+            self.assertEqual(emulator.active_robots, {})
+
+    async def test_streamed_movement(self):
+        points = np.zeros(6, dtype=[("x", np.float64), ("y", np.float64)])
+        points["x"] = np.linspace(0.0, 1.0, 6)
+
+        async def chunks():
+            for part in np.array_split(points, 3):
+                yield part
+                await asyncio.sleep(0.01)
+
+        async with make_client(lambda request: httpx.Response(200, json={"unknown": []})) as client:
+            emulator = RobotEmulator(client=client, time_scale=20.0)
+            self.assertEqual(await emulator.process_robot_movement(1, chunks()), 6)
+            self.assertNotIn(1, emulator.simulation)
+            await emulator.close()
+
+
+if __name__ == '__main__':
+    unittest.main()